@@ -1,6 +1,5 @@
 #!/usr/bin/env python3
 
-import os
 import logging
 import operator
 import numpy as np
@@ -17,8 +16,9 @@ from tshcal.constants_esp import SAFE_TRAJ_MOVES
 from tshcal.constants_esp import TWO_RIG_AX_TO_MOVE, ESP_SETTLE
 from tshcal.commanding.plot_progress import GoalProgressPlot
 from tshcal.constants_esp import ESP_AX
-from tshcal.defaults import TSH_SETTLE_SEC, TSH_BUFFER_SEC, AXES_FILE_SEC
+from tshcal.defaults import TSH_SETTLE_SEC, TSH_BUFFER_SEC, TSH_COUNTS_TOL, AXES_FILE_SEC
 from tshcal.common import buffer
+from tshcal.common.calibration import axes_csv_file
 
 
 # create logger
@@ -230,17 +230,22 @@ def gss_two_axes(tsh, esp, out_dir, rough_home, plot=True, debug=False):
 
     # create data buffer
     tsh_buff = buffer.TshAccelBuffer(tsh, AXES_FILE_SEC, logger=module_logger)
-    buffer.raw_data_from_socket(tsh.ip, tsh_buff, port=DEFAULT_PORT)  # this populates 2nd arg, tsh_buff
+    if tsh.acquisition is not None:
+        # background acquisition already streaming, so just tap into that
+        if not tsh.acquisition.fill(tsh_buff, timeout=2 * AXES_FILE_SEC):
+            raise RuntimeError('Timed out filling %d-second buffer from %s.' % (AXES_FILE_SEC, tsh.name))
+    else:
+        buffer.raw_data_from_socket(tsh.ip, tsh_buff, port=DEFAULT_PORT)  # this populates 2nd arg, tsh_buff
 
     # save data to csv file
-    bname = 'axes_tsh' + tsh.name.replace('s', 's-') + '_' + rough_home
-    csv_file = os.path.join(out_dir, bname)
+    csv_file = axes_csv_file(out_dir, tsh.name, rough_home)
 
     # FIXME how best to not clobber CSV output files???
     # make sure we are not clobbering pre-existing csv file
 
-    # now write results to csv file
+    # now write results to csv file (and columnar export next to it, with times and gaps, for quick re-analysis)
     tsh_buff.write_csv_in_counts(csv_file)
+    tsh_buff.write_columnar(csv_file + '_columnar')
 
     # move to this rough home before going to next rough home pos
     move_to_rough_home(esp, rough_home)
@@ -520,28 +525,59 @@ def calibration(tsh, esp, out_dir, safe_moves=SAFE_TRAJ_MOVES, plot=True, debug=
         module_logger.info('Powered off ESP axis #%d.' % iax)
 
 
-def get_tsh_counts(tsh, sec=TSH_BUFFER_SEC):
-    """Fill buffer with TSH data, compute mean and return 1x3 array for TSH x-, y- and z-axis.
+def get_tsh_counts(tsh, sec=TSH_BUFFER_SEC, ring=None, tol=TSH_COUNTS_TOL, after=None):
+    """Fill buffer with TSH data, compute median and return 1x3 array for TSH x-, y- and z-axis.
 
     Parameters
     ----------
     tsh : obj
         The TSH "data source" object.
     sec : float
-        The number of seconds of xyz data to get.
+        The (most) number of seconds of xyz data to get.
+    ring : obj
+        None to use ring of tsh's background acquisition (if running); otherwise, open a new socket and fill a new
+        buffer or...
+        a circular TshAccelBuffer that is already streaming data for this tsh, in which case we use data that arrives
+        after this call (no new socket, no resync with the stream)
+    tol : float
+        Stop early, before sec seconds, once standard error of median is within this many counts on every axis
+        (None to always get the full sec seconds).
+    after : float
+        None to use data that arrives after this call or...
+        the (tsh) unix time of earliest sample to use, e.g. time move was done plus settle time (only with ring).
 
     Returns
     -------
     counts: 1x3 array of floats
-        The mean value for each of TSH x-, y- and z-axis.
+        The median value for each of TSH x-, y- and z-axis.
 
     """
 
     module_logger.warning('ASSUMING the TSH is configured (sample rate, gain, and so on).')
 
+    if ring is None and tsh.acquisition is not None:
+        ring = tsh.acquisition.ring
+
     # create data buffer -- at some pt in code before we need mean(counts), probably just after GSS min/max found
-    buff = buffer.TshAccelBuffer(tsh, sec, logger=module_logger)
-    buffer.raw_data_from_socket(tsh.ip, buff, port=DEFAULT_PORT)  # this populates 2nd arg, buff
+    buff = buffer.TshAccelBuffer(tsh, sec, logger=module_logger, tol=tol)
+
+    if ring is not None:
+        # samples from start on were acquired after the rig move (and settle), so fill with those
+        start = None
+        if after is not None:
+            start = ring.wait_for_time(after, timeout=2 * sec + TSH_SETTLE_SEC)
+            if start is None:
+                raise RuntimeError('Timed out waiting for streaming data from %s after time %.3f.' % (tsh.name, after))
+        if not buff.fill_from(ring, timeout=2 * sec + TSH_SETTLE_SEC, start=start):
+            raise RuntimeError('Timed out waiting for %.1f seconds of streaming data from %s.' % (sec, tsh.name))
+    else:
+        buffer.raw_data_from_socket(tsh.ip, buff, port=DEFAULT_PORT)  # this populates 2nd arg, buff
+
+    module_logger.debug('Got %.1f of %.1f sec for tsh counts; %s' % (buff.idx / tsh.rate, sec, buff.stats))
+    if buff.gaps:
+        # median does not care about sample order, so it just uses what did arrive (nothing spliced in to fill gaps)
+        module_logger.warning('Tsh counts data has %d gap(s), %d samples missing in all.' %
+                              (len(buff.gaps), sum([g.missing for g in buff.gaps])))
 
     # FIXME should this be median (instead of mean)?
     return np.median(buff.xyz, axis=0)
@@ -584,11 +620,25 @@ def move_rig_get_counts(esp, tsh, ax, a, idx_tsh_ax, plot_obj=None, debug=False)
             module_logger.info('User aborted RIG AXIS = %s, ANGLE = %.3f' % (ax, a))
             raise Exception('User aborted RIG AXIS = %s, ANGLE = %.3f' % (ax, a))
 
-    # move rig
-    actual_pos = move_axis(esp, ESP_AX[ax], a, tsh_settle=TSH_SETTLE_SEC, esp_settle=ESP_SETTLE)
+    if tsh.acquisition is None:
+        # move rig, then sleep for tsh to settle
+        actual_pos = move_axis(esp, ESP_AX[ax], a, tsh_settle=TSH_SETTLE_SEC, esp_settle=ESP_SETTLE)
+
+        # get counts
+        avg_counts = get_tsh_counts(tsh)[idx_tsh_ax]
 
-    # get counts
-    avg_counts = get_tsh_counts(tsh)[idx_tsh_ax]
+    else:
+        # move rig, then just skip streaming samples timestamped before move was done plus settle time (no sleep)
+        actual_pos = move_axis(esp, ESP_AX[ax], a, esp_settle=ESP_SETTLE)
+        ring = tsh.acquisition.ring
+        # anchor on (tsh) end time of 1st packet to arrive after move was done, not on newest sample already in ring
+        # (that lags tsh clock by up to a packet plus transport delay) nor on host time (different clock)
+        t_moved = tsh.acquisition.next_packet_end_time(timeout=2 * TSH_SETTLE_SEC)
+        if t_moved is None:
+            raise RuntimeError('Timed out waiting for streaming data from %s after rig move.' % tsh.name)
+
+        # get counts
+        avg_counts = get_tsh_counts(tsh, ring=ring, after=t_moved + TSH_SETTLE_SEC)[idx_tsh_ax]
 
     # FIXME we want a particular element of avg_counts (not all 3 components)
     # send (x, y) = (angle, counts) to plot this point
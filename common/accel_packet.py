@@ -1,11 +1,22 @@
 #!/usr/bin/env python3
 
 import struct
+import logging
+import numpy as np
 from time import time
-import MySQLdb as sql
+from collections import OrderedDict
+from multiprocessing.sharedctypes import RawArray
+from concurrent.futures import ProcessPoolExecutor
 
 from tshcal.secret import SDB, SUSER, SPASSWD
+from tshcal.common.sql_utils import get_pool, prefetch, sql_identifier
 from tshcal.common.time_utils import unix_to_human_time
+from tshcal.constants_tsh import TSH_RATES, TSH_GAINS, TSH_UNITS
+from tshcal.common.tshes_accel_packet import TshesAccelPacket, sample_records
+
+
+# create logger
+module_logger = logging.getLogger('tshcal')
 
 
 class WrongTypeOfPacket(Exception):
@@ -24,47 +35,86 @@ def binary_coded_decimal(char):
     return tens*10+ones
 
 
-def sql_connect(command, shost='localhost', suser=SUSER, spasswd=SPASSWD, sdb=SDB):
+def sql_connect(command, shost='localhost', suser=SUSER, spasswd=SPASSWD, sdb=SDB, params=None):
     """SQL helper routines ---------------------------------------------------------------
-    create a connection (with possible defaults), submit command, return all results
-    try to do all connecting through this function to handle exceptions"""
-    sqlRetryTime =30
-    repeat = 1
-    while repeat:
-        try:
-            con = sql.Connection(host=shost, user=suser, passwd=spasswd, db=sdb)
-            cursor = con.cursor()
-            cursor.execute(command)
-            results = cursor.fetchall()
-            # print(results)
-            repeat = 0
-            cursor.close()
-            con.close()
-        except MySQLError as msg:
-            t = unix_to_human_time(time(), 1) + '\n' + msg[1] + '\nMySQL call failed, will try again in %s seconds' % sqlRetryTime
-            printLog(t)
-            if idleWait(sqlRetryTime):
-                return []
+    submit command (with params for its %s placeholders, if any) on pooled connection, return all results
+    try to do all querying through this function to handle exceptions"""
+    return get_pool(shost, suser, spasswd, sdb).query(command, params)
+
+
+def printLog(t):
+    """log packet warning text"""
+    module_logger.warning(t)
+
+
+# where each kind of packet keeps its 2 selector bytes, by its 2 sync bytes
+PACKET_SELECTOR_OFFSETS = {b'\xac\xd3': 40, b'\xda\xbe': 12}
+
+PACKET_CLASSES = {}  # packet class by (sync bytes, selector bytes), filled in by register_packet_class
 
-    return results
+
+def register_packet_class(cls, sync, selectors):
+    """register cls as packet class for packets that start with sync bytes and have one of selectors"""
+    for selector in selectors:
+        PACKET_CLASSES[(sync, struct.pack('!H', selector))] = cls
 
 
 def guess_packet(packet, showWarnings=0):
-    """try to create a packet of the appropriate type"""
-    subtypes = [SamsTshEs, Sams2Packet]
-    for i in subtypes:
-        try:
-            p = i(packet, showWarnings=0)
-            return p
-        except WrongTypeOfPacket:
-            pass
+    """create a packet of the appropriate type, looked up by its sync bytes and selector"""
+    sync = bytes(packet[:2])
+    offset = PACKET_SELECTOR_OFFSETS.get(sync)
+    if offset is not None:
+        cls = PACKET_CLASSES.get((sync, bytes(packet[offset:offset + 2])))
+        if cls is not None:
+            try:
+                return cls(packet, showWarnings=0)
+            except WrongTypeOfPacket:
+                pass  # right type, but something is wrong with it (e.g. too short)
     if showWarnings:
         t = unix_to_human_time(time(), 1) + 'unknown packet type detected'
         printLog(t)
     return AccelPacket(packet)
 
 
-DigitalIOstatusHolder = {}  # global dictionary to hold SAMS TSH-ES DigitalIOstatus between packets
+# most samples we allow to be missing between contiguous SAMS TSH-ES packets, by rate
+TSHES_MIN_SAMPLES = {1000.0: 512, 500.0: 512, 250.0: 256, 125.0: 128, 62.5: 64, 31.25: 64, 15.625: 64, 7.8125: 32}
+
+# smallest SAMS2 packet (in samples), by rate, so we can catch one gone missing (see Sams2Packet.contiguous)
+SAMS2_MIN_SAMPLES = {62.5: 31, 125.0: 62, 250.0: 51, 500.0: 28, 1000.0: 56}
+
+_HEX_BYTES = ['%02x' % i for i in range(256)]
+
+# for ascii column of hex dump, unprintable characters get replaced with nulls (shown as \x00 in bytes repr)
+_HEX_DUMP_ASCII = bytes(0 if (i < 32 or i == 209) else i for i in range(256))
+
+
+def hex_dump(data, size=16):
+    """return hex dump of data (bytes-like), 16 bytes per line: offset, hex bytes (in 2 groups of 8) and bytes repr
+    of the line with unprintable characters nulled out; built with one pass over memoryview and a list join"""
+    data = memoryview(data).cast('B')
+    lines = []
+    for start in range(0, len(data), size):
+        row = data[start:start + size]
+        hx = [_HEX_BYTES[b] for b in row]
+        hx = ' '.join(hx[:8]) + ('   ' + ' '.join(hx[8:]) if len(hx) > 8 else '') + ' '
+        lines.append('%04x  %s"%s"\n' % (start, hx.ljust(52), row.tobytes().translate(_HEX_DUMP_ASCII)))
+    return ''.join(lines)
+
+
+def dump_packets(packets, f, accelData=0, hexDump=0):
+    """write dump (and, with hexDump, hex dump) of each packet in iterable of packets (bytes-like) to text file
+    object f as we go, so diagnostics for lots of packets never pile up in memory; return number of packets dumped"""
+    num = 0
+    for packet in packets:
+        pkt = guess_packet(packet)
+        if type(pkt) is AccelPacket:
+            f.write('AccelPacket( type:unknown length:%d)\n' % len(packet))
+        else:
+            f.write(pkt.dump(accelData) + '\n')
+        if hexDump:
+            f.write(hex_dump(packet))
+        num += 1
+    return num
 
 
 class AccelPacket(object):
@@ -164,49 +214,19 @@ class AccelPacket(object):
     def dump(self, accelData=0):
         if not self._rep_:
             header = self.header()
-            hkeys = list(header.keys())
-            className = split(str(self.__class__), '.')[1]
-            self._rep_ = '%s(' % className
-            for i in hkeys:
+            parts = ['%s(' % self.__class__.__name__]
+            for i in header:
                 if i == 'time' or i == 'endTime':  # work around Python 3 decimal place default for times
-                    self._rep_ = self._rep_ + ' %s:%.4f' % (i, header[i])
+                    parts.append(' %s:%.4f' % (i, header[i]))
                 else:
-                    self._rep_ = self._rep_ + ' %s:%s' % (i, header[i])
-            if accelData:
-                self._rep_ = self._rep_ + '\ndata:'
-                for j in self.xyz():
-                    self._rep_ = self._rep_ + '\n%.7e %.7e %.7e' % tuple(j)
-        #                for j in self.txyz():
-        #                    self._rep_ = self._rep_ + '\n%.4f %.7e %.7e %.7e' % j
+                    parts.append(' %s:%s' % (i, header[i]))
+            self._rep_ = ''.join(parts)
+        if accelData:
+            return '%s\ndata:\n%s' % (self._rep_, '\n'.join(['%.7e %.7e %.7e' % tuple(j) for j in self.xyz()]))
         return self._rep_
 
     def hexDump(self):
-        self._hex_ = ''
-        start = 0
-        size = 16
-        ln = len(self.p)
-        while start < ln:
-            # print line number
-            line = '%04x  ' % start
-            # print hex representation
-            c = 0
-            asc = self.p[start:min(start + size, ln)]
-            for b in asc:
-                if c == 8:
-                    line = line + '  '
-                # line = line + '%02x ' % ord(b)
-                line = line + format(b, '02x') + ' '
-                c = c + 1
-            # line = ljust(line, 58) + '"'
-            line = line.ljust(58) + '"'
-            # print ascii representation, replace unprintable characters with spaces [or now it's b'\x00' - kh]
-            for i in range(len(asc)):
-                # if ord(asc[i]) < 32 or ord(asc[i]) == 209:
-                if asc[i] < 32 or asc[i] == 209:
-                    asc = asc[:i] + b'\x00' + asc[i+1:]
-            line = line + str(asc) + '"\n'
-            self._hex_ = self._hex_ + line
-            start = start + size
+        self._hex_ = hex_dump(self.p)
         return self._hex_
 
 
@@ -252,7 +272,6 @@ class Sams2Packet(AccelPacket):
     #     at  500   Hz: 74, 74, 74, 28
     #     at 1000   Hz: 74, 74, 74, 74, 74, 74, 56
     def contiguous(self, other):
-        minSamples = {62.5: 31, 125.0: 62, 250.0: 51, 500.0: 28, 1000.0: 56}
         if not other:
             # print('contiguous: no other')
             return 0
@@ -272,7 +291,7 @@ class Sams2Packet(AccelPacket):
             # print('contiguous: OK non-periodic')
             return (start > oend)
         gap = start - oend
-        allowAbleGap = minSamples[self.rate()] / self.rate()
+        allowAbleGap = SAMS2_MIN_SAMPLES[self.rate()] / self.rate()
         result = (start >= ostart) and (gap <= allowAbleGap)
         # if not result:
         # print('contiguous:%s ostart:%.4lf oend:%.4lf start:%.4lf gap:%.4lf') % (result, ostart, oend, start, gap)
@@ -295,25 +314,19 @@ class Sams2Packet(AccelPacket):
                     t = t + ' packet too short (%s) to be a sams-ii acceleration packet' % len(self.p)
                     printLog(t)
                 return self._sams2_
-            # byte0 = struct.unpack('c', self.p[0])[0]
-            # byte1 = struct.unpack('c', self.p[1])[0]
-            byte0 = struct.unpack('c', bytes([self.p[0]]))[0]
-            byte1 = struct.unpack('c', bytes([self.p[1]]))[0]
-            if not (byte0 == chr(0xda) and byte1 == chr(0xbe)):
+            if bytes(self.p[:2]) != b'\xda\xbe':
                 self._sams2_ = 0
                 if self._showWarnings_:
                     t = 'SAMSII packet warning\n' + self.hexDump() + unix_to_human_time(time(), 1) + '\n'
                     t = t + ' packet cannot be sams-ii accel because it does not start with 0xdabe'
                     printLog(t)
                 return self._sams2_
-            byte2 = struct.unpack('c', self.p[12])[0]
-            byte3 = struct.unpack('c', self.p[13])[0]
-            accelpacket = (byte2 == chr(100)) and (byte3 == chr(0))
-            if not accelpacket and self._showWarnings_:
+            if bytes(self.p[12:14]) != b'\x64\x00':
                 self._sams2_ = 0
-                t = 'SAMSII packet warning\n' + self.hexDump() + unix_to_human_time(time(), 1) + '\n'
-                t = t + ' packet cannot be sams-ii accel because it does not have 0x6400 at offset 12'
-                printLog(t)
+                if self._showWarnings_:
+                    t = 'SAMSII packet warning\n' + self.hexDump() + unix_to_human_time(time(), 1) + '\n'
+                    t = t + ' packet cannot be sams-ii accel because it does not have 0x6400 at offset 12'
+                    printLog(t)
                 return self._sams2_
             if len(self.p) < 52 + 16 * self.samples():
                 self._sams2_ = 0
@@ -357,21 +370,19 @@ class Sams2Packet(AccelPacket):
 
     def eeId(self):
         if not self._eeId_:
-            self._eeId_ = self.p[16:24]
-            self._eeId_ = replace(self._eeId_, chr(0), '')  # delete nulls
-            self._eeId_ = join(split(self._eeId_, '-'), '')  # delete dashes
+            self._eeId_ = bytes(self.p[16:24]).replace(b'\0', b'')  # delete nulls
+            self._eeId_ = self._eeId_.replace(b'-', b'').decode('utf-8', 'replace')  # delete dashes
         return self._eeId_
 
     def seId(self):
         if not self._seId_:
-            self._seId_ = self.p[24:32]
-            self._seId_ = replace(self._seId_, chr(0), '')  # delete nulls
-            self._seId_ = join(split(self._seId_, '-'), '')  # delete dashes
+            self._seId_ = bytes(self.p[24:32]).replace(b'\0', b'')  # delete nulls
+            self._seId_ = self._seId_.replace(b'-', b'').decode('utf-8', 'replace')  # delete dashes
         return self._seId_
 
     def head(self):
         if not self._head_:
-            self._head_ = struct.unpack('c', self.p[32])[0]
+            self._head_ = self.p[32]
             self._head_ = (self._head_ == 1)
         return self._head_
 
@@ -387,12 +398,12 @@ class Sams2Packet(AccelPacket):
 
     def rate(self):
         if not self._rate_:
-            self._rate_ = struct.unpack('b', self.p[64])[0] & 0x07
+            self._rate_ = struct.unpack_from('b', self.p, 64)[0] & 0x07
             if self._showWarnings_:  # check for mis-matched rate bytes
                 for i in range(16, 161, 16):  # check next 10 rate bytes
                     if 64 + i >= len(self.p):
                         break
-                    dupRate = struct.unpack('b', self.p[64 + i])[0] & 0x07
+                    dupRate = struct.unpack_from('b', self.p, 64 + i)[0] & 0x07
                     if dupRate != self._rate_:
                         t = unix_to_human_time(time(), 1) + '\n'
                         t = t + ' mis-matched rate bytes, %s at offset 64 and %s at offset %s\n' % (
@@ -422,7 +433,7 @@ class Sams2Packet(AccelPacket):
 
     def gain(self):
         if not self._gain_:
-            self._gain_ = (struct.unpack('b', self.p[64])[0] & 0x18) >> 3
+            self._gain_ = (struct.unpack_from('b', self.p, 64)[0] & 0x18) >> 3
             if (self._gain_ == 0):
                 self._gain_ = 1.0
             elif (self._gain_ == 1):
@@ -443,7 +454,7 @@ class Sams2Packet(AccelPacket):
 
     def unit(self):
         if not self._unit_:
-            self._unit_ = (struct.unpack('b', self.p[65])[0])
+            self._unit_ = (struct.unpack_from('b', self.p, 65)[0])
             if (self._unit_ == 1):
                 self._unit_ = 'counts'
             elif (self._unit_ == 2):
@@ -462,7 +473,7 @@ class Sams2Packet(AccelPacket):
 
     def adjustment(self):
         if not self._adjustment_:
-            a = (struct.unpack('b', self.p[66])[0])
+            a = (struct.unpack_from('b', self.p, 66)[0])
             self._dqmIndicator_ = a & 0x07
             self._adjustment_ = ''
             if (a & 0x01 == 1):
@@ -566,9 +577,8 @@ class SamsTshEs(AccelPacket):
         AccelPacket.__init__(self, packet)
         self._showWarnings_ = showWarnings
         self._samsTshEs_ = None
-        self._samples_ = None
+        self._prefix_ = None
         self._adjustment_ = None
-        self._status_ = None
         if not self.isSamsTshEsPacket():
             raise WrongTypeOfPacket
         self.type = 'samses_accel'
@@ -576,15 +586,15 @@ class SamsTshEs(AccelPacket):
         self._header_ = {}
         self._Id_ = None
         self._head_ = None
-        self._counter_ = None
         self._rate_ = None
         self._gain_ = None
         self._unit_ = None
-        self._adjustment_ = None
         self._time_ = None
         self._endTime_ = None
-        self._xyz_ = []
-        self._txyz_ = []
+        self._xyz_ = None
+        self._txyz_ = None
+        self._dio_ = None
+        self._xyzCal_ = None
         self._xmlHeader_ = None
         self._cutoffFreq_ = None
 
@@ -617,9 +627,8 @@ class SamsTshEs(AccelPacket):
         #### during testing, all tsh-es packets are maximum size and very regular
         #### on orbit, they will be broken into multiple smaller packets of unknown size
         #### once we know the correct sizes, minSamples should be reduced
-        minSamples = {1000.0: 512, 500.0: 512, 250.0: 256, 125.0: 128, 62.5: 64, 31.25: 64, 15.625: 64, 7.8125: 32}
         gap = start - oend
-        allowAbleGap = minSamples[self.rate()] / self.rate()
+        allowAbleGap = TSHES_MIN_SAMPLES[self.rate()] / self.rate()
         result = (start >= ostart) and (gap <= allowAbleGap)
         # if not result:
         # print('contiguous:%s ostart:%.4lf oend:%.4lf start:%.4lf gap:%.4lf') % (result, ostart, oend, start, gap)
@@ -627,13 +636,13 @@ class SamsTshEs(AccelPacket):
 
     # name of the database table this data should be in (no dashes)
     def name(self):
-        if not self._name_:
+        if self._name_ is None:
             self._name_ = self.Id()
         return self._name_
 
     # return true if this appears to be a samsTshEs acceleration packet
     def isSamsTshEsPacket(self):  # struct.unpack doesn't seem to think 'h' is 2 bytes
-        if not self._samsTshEs_:
+        if self._samsTshEs_ is None:
             if len(self.p) < 80:
                 self._samsTshEs_ = 0
                 if self._showWarnings_:
@@ -643,9 +652,7 @@ class SamsTshEs(AccelPacket):
                 return self._samsTshEs_
 
             # get sync bytes & verify match for tsh
-            byte0 = struct.unpack('c', bytes([self.p[0]]))[0]
-            byte1 = struct.unpack('c', bytes([self.p[1]]))[0]
-            if not (byte0 == bytes([0xac]) and byte1 == bytes([0xd3])):
+            if bytes(self.p[:2]) != b'\xac\xd3':
                 self._samsTshEs_ = 0
                 if self._showWarnings_:
                     t = 'SAMS TSH-ES packet warning\n' + self.hexDump() + unix_to_human_time(time(), 1) + '\n'
@@ -654,9 +661,7 @@ class SamsTshEs(AccelPacket):
                 return self._samsTshEs_
 
             # get selector value
-            byte2 = struct.unpack('c', bytes([self.p[40]]))[0]
-            byte3 = struct.unpack('c', bytes([self.p[41]]))[0]
-            selector = ord(byte2) * 256 + ord(byte3)
+            selector = struct.unpack_from('!H', self.p, 40)[0]
 
             accelpacket = (selector == 170) or (selector == 171)  # || (selector == 177)
             if not accelpacket:
@@ -673,7 +678,7 @@ class SamsTshEs(AccelPacket):
             # print(rateBits)
 
             if len(self.p) < 80 + 16 * self.samples():
-                self._sams2_ = 0
+                self._samsTshEs_ = 0
                 t = 'SAMS TSH-ES packet warning\n' + self.hexDump() + unix_to_human_time(time(), 1) + '\n'
                 t = t + ' packet is not a complete samsTshEs accel packet, %s samples are not present' % self.samples()
                 print('LOG: ' + t)
@@ -684,7 +689,7 @@ class SamsTshEs(AccelPacket):
 
     # return header info in XML format for this packet
     def xmlHeader(self):
-        if not self._xmlHeader_:
+        if self._xmlHeader_ is None:
             self._xmlHeader_ = ''
             self._xmlHeader_ = self._xmlHeader_ + '\t<SensorID>%s</SensorID>\n' % self.name()
             self._xmlHeader_ = self._xmlHeader_ + '\t<TimeZero>%s</TimeZero>\n' % unix_to_human_time(self.time())
@@ -710,183 +715,86 @@ class SamsTshEs(AccelPacket):
             self._header_['endTime'] = self.endTime()
         return self._header_
 
+    def _prefix(self):
+        """decode whole TshesAccelPacket "Prefix" (bytes 44 to 80 of tshes message) with one precompiled struct, once:
+        (tshes_id, counter, sec, usec, packet_status, num_samples)"""
+        if self._prefix_ is None:
+            self._prefix_ = TshesAccelPacket.prefix_struct.unpack_from(self.p, 44)  # Network byte order
+        return self._prefix_
+
     def Id(self):
         """16 bytes starting at byte 44 of a tshes message are first 16 bytes [char:tshes_id] of TshesAccelPacket"""
-        if not self._Id_:
-            self._Id_ = self.p[44:60]
-            # self._Id_ = replace(self._Id_ , chr(0), '')  # delete nulls
-            # self._Id_ = join(split(self._Id_, '-'), '')  # delete dashes
-            self._Id_ = self._Id_.replace(b'-', b'').replace(b'\0', b'')  # delete dashes and nulls
+        if self._Id_ is None:
+            self._Id_ = self._prefix()[0].replace(b'-', b'').replace(b'\0', b'')  # delete dashes and nulls
             self._Id_ = self._Id_[-4:]  # keep last 4 characters only, i.e., "es13"
         return self._Id_
 
     def counter(self):
         """4 bytes starting at byte 60 of a tshes message are [unsigned int:counter] of TshesAccelPacket"""
-        if not self._counter_:
-            self._counter_ = struct.unpack('!I', self.p[60:64])[0]  # Network byte order
-        return self._counter_
+        return self._prefix()[1]
 
     def time(self):
         """8 bytes starting at byte 64 of a tshes message are [timeval:timestamp] of TshesAccelPacket"""
-        if not self._time_:
-            sec, usec = struct.unpack('!II', self.p[64:72])  # Network byte order
+        if self._time_ is None:
+            sec, usec = self._prefix()[2:4]
             self._time_ = sec + usec / 1000000.0
         return self._time_
 
     def status(self):
         """4 bytes starting at byte 72 of a tshes message are [int:packet_status] of TshesAccelPacket"""
-        if not self._status_:
-            self._status_ = struct.unpack('!i', self.p[72:76])[0]  # Network byte order
-        return self._status_
+        return self._prefix()[4]
 
     def samples(self):
         """4 bytes starting at byte 76 of a tshes message are [int:num_samples] of TshesAccelPacket"""
-        if not self._samples_:
-            self._samples_ = struct.unpack('!i', self.p[76:80])[0]  # Network byte order
-        return self._samples_
+        return self._prefix()[5]
 
     # see xyz method; rest of bytes starting at byte 80 of tshes message are [AccelSample:accel_data] of TshesAccelPacket
 
-    def rate(self):
-        """get rate bits from status int"""
-        if not self._rate_:
-            statusInt = self.status()
-            rateBits = (statusInt & 0x0f00) >> 8
+    def _bogus_status_bits(self, what, bits, assumed):
+        if self._showWarnings_:
+            t = '\n' + self.hexDump()
+            t = t + '\n' + self.dump()
+            t = t + '\n' + unix_to_human_time(time(), 1)
+            t = t + '\n' + ' TSH-ES bogus%sByte: %s at time %.4f, assuming %s' % (what, bits, self.time(), assumed)
+            printLog(t)
 
-            if (rateBits == 0):
-                self._rate_ = 7.8125
-                self._cutoffFreq_ = 3.2
-            elif (rateBits == 1):
-                self._rate_ = 15.625
-                self._cutoffFreq_ = 6.3
-            elif (rateBits == 2):
-                self._rate_ = 31.25
-                self._cutoffFreq_ = 12.7
-            elif (rateBits == 3):
-                self._rate_ = 62.5
-                self._cutoffFreq_ = 25.3
-            elif (rateBits == 4):
-                self._rate_ = 125.0
-                self._cutoffFreq_ = 50.6
-            elif (rateBits == 5):
-                self._rate_ = 250.0
-                self._cutoffFreq_ = 101.4
-            elif (rateBits == 6):
-                self._rate_ = 500.0
-                self._cutoffFreq_ = 204.2
-            elif (rateBits == 7):
-                self._rate_ = 1000.0
-                self._cutoffFreq_ = 408.5
-            elif (rateBits == 8):
-                self._rate_ = 125.0
-                self._cutoffFreq_ = 23.5
+    def rate(self):
+        """get rate bits from status int, look up rate (and cutoff frequency)"""
+        if self._rate_ is None:
+            rateBits = (self.status() & 0x0f00) >> 8
+            if rateBits < len(TSH_RATES):
+                self._rate_, self._cutoffFreq_ = TSH_RATES[rateBits]
             else:
-                if self._showWarnings_:
-                    t = '\n' + self.hexDump()
-                    t = t + '\n' + self.dump()
-                    t = t + '\n' + unix_to_human_time(time(), 1),
-                    t = t + '\n' + ' bogusRateByte: %s at time %.4f, assuming rate=1000' % (rateBits, self.time())
-                    printLog(t)
+                self._bogus_status_bits('Rate', rateBits, 'rate=1000')
                 self._rate_ = 1000.0
         return self._rate_
 
     def gain(self):
-        """get gain bits from status int"""
-        if not self._gain_:
-            statusInt = self.status()
-            gainBits = statusInt & 0x001f
-
-            if (gainBits == 0):
-                self._gain_ = 1.0
-                self._input_ = 'Ground'  # _input_ is not used as far as I can tell
-            elif (gainBits == 1):
-                self._gain_ = 2.5
-                self._input_ = 'Ground'
-            elif (gainBits == 2):
-                self._gain_ = 8.5
-                self._input_ = 'Ground'
-            elif (gainBits == 3):
-                self._gain_ = 34.0
-                self._input_ = 'Ground'
-            elif (gainBits == 4):
-                self._gain_ = 128.0
-                self._input_ = 'Ground'
-            elif (gainBits == 8):
-                self._gain_ = 1.0
-                self._input_ = 'Test'
-            elif (gainBits == 9):
-                self._gain_ = 2.5
-                self._input_ = 'Test'
-            elif (gainBits == 10):
-                self._gain_ = 8.5
-                self._input_ = 'Test'
-            elif (gainBits == 11):
-                self._gain_ = 34.0
-                self._input_ = 'Test'
-            elif (gainBits == 12):
-                self._gain_ = 128.0
-                self._input_ = 'Test'
-            elif (gainBits == 16):
-                self._gain_ = 1.0
-                self._input_ = 'Signal'
-            elif (gainBits == 17):
-                self._gain_ = 2.5
-                self._input_ = 'Signal'
-            elif (gainBits == 18):
-                self._gain_ = 8.5
-                self._input_ = 'Signal'
-            elif (gainBits == 19):
-                self._gain_ = 34.0
-                self._input_ = 'Signal'
-            elif (gainBits == 20):
-                self._gain_ = 128.0
-                self._input_ = 'Signal'
-            elif (gainBits == 24):
-                self._gain_ = 1.0
-                self._input_ = 'Vref'
-            elif (gainBits == 25):
-                self._gain_ = 1.0
-                self._input_ = 'Sensor test'
-            elif (gainBits == 26):
-                self._gain_ = 2.0
-                self._input_ = 'Sensor test'
+        """get gain bits from status int, look up gain (and input)"""
+        if self._gain_ is None:
+            gainBits = self.status() & 0x001f
+            if gainBits in TSH_GAINS:
+                self._gain_, self._input_ = TSH_GAINS[gainBits]  # _input_ is not used as far as I can tell
             else:
-                if self._showWarnings_:
-                    t = '\n' + self.hexDump()
-                    t = t + '\n' + self.dump()
-                    t = t + '\n' + unix_to_human_time(time(), 1),
-                    t = t + '\n' + ' TSH-ES bogusGainByte: %s at time %.4f, assuming gain=1' % (gainBits, self.time())
-                    printLog(t)
+                self._bogus_status_bits('Gain', gainBits, 'gain=1')
                 self._gain_ = 1.0
         return self._gain_
 
     def unit(self):
-        """get unit bits from status int"""
-        if not self._unit_:
-            statusInt = self.status()
-            unitBits = (statusInt & 0x0060) >> 5
-
-            if (unitBits == 0):
-                self._unit_ = 'counts'
-            elif (unitBits == 1):
-                self._unit_ = 'volts'
-            elif (unitBits == 2):
-                self._unit_ = 'g'
+        """get unit bits from status int, look up unit"""
+        if self._unit_ is None:
+            unitBits = (self.status() & 0x0060) >> 5
+            if unitBits < len(TSH_UNITS):
+                self._unit_ = TSH_UNITS[unitBits]
             else:
-                if self._showWarnings_:
-                    t = '\n' + self.hexDump()
-                    t = t + '\n' + self.dump()
-                    t = t + '\n' + unix_to_human_time(time(), 1),
-                    t = t + '\n' + ' TSH-ES bogusUnitByte: %s at time %.4f, assuming unit=g' % (unitBits, self.time())
-                    printLog(t)
+                self._bogus_status_bits('Unit', unitBits, 'unit=g')
                 self._unit_ = 'g'
         return self._unit_
 
     def adjustment(self):
         """get adjustment bits from status int"""
-        if not self._adjustment_:
-            statusInt = self.status()
-            adjBits = (statusInt & 0x0080) >> 7
+        if self._adjustment_ is None:
+            adjBits = (self.status() & 0x0080) >> 7
 
             self._dqmIndicator_ = adjBits
             self._adjustment_ = 'no-compensation'
@@ -896,88 +804,407 @@ class SamsTshEs(AccelPacket):
 
     def endTime(self):
         """compute end time from start, number of samples and rate"""
-        if not self._endTime_:
+        if self._endTime_ is None:
             self._endTime_ = self.time() + (self.samples() - 1) / self.rate()
         return self._endTime_
 
-    def handleDigitalIOstatus(self, digitalIOstatus, sampleNumber):
-        # check for the 'something interesting happened' bit for this sensor and do something with it
-        enabled = digitalIOstatus & 0x0001
-        if enabled:
-            inputIO = (digitalIOstatus & 0x0004) > 2
-            if self.name() in DigitalIOstatusHolder:
-                interestingBit = DigitalIOstatusHolder[self.name()]
-                if interestingBit != inputIO:  # state change
-                    DigitalIOstatusHolder[self.name()] = inputIO
-                    # state change detected, what should be do with that information?
-                    eventTime = self.time() + sampleNumber / self.rate()
-                    msg = ' (inputIO_state_change:%s time:%.4f)' % (inputIO, eventTime)
-                    # print self.name(), msg
-            else:
-                DigitalIOstatusHolder[self.name()] = inputIO
+    def dio(self):
+        """uint32 array of digitalIOstatus words, one per sample (cached)"""
+        if self._dio_ is None:
+            self._dio_ = sample_records(self.p, self.samples())['dio'].astype(np.uint32)
+        return self._dio_
+
+    def dioEvents(self, tracker):
+        """return event table (DIO_EVENT_DTYPE) of digital IO state changes in this packet, per state held by tracker"""
+        t = self.time() + np.arange(self.samples()) / self.rate()
+        return tracker.update(self.name(), self.dio(), t)
 
     def xyz(self):
-        """xyz array of accel_data"""
-        if not self._xyz_:
-            convert = 0
-            ##            if self.unit() != 'g':   #### need calibration numbers for flight units
-            ##                convert = 1
-            ##                if self.unit() == 'volts':
-            ##                    mx = my = mz = 1.0/3.89791388
-            ##                    bx = by = bz = 0
-            ##                else: # must be counts
-            ##                    if self.gain() == 1.0:
-            ##                        mx = my = mz = 2.18538e-07
-            ##                        bx = by = bz = -0.026280804
-            ##                    elif self.gain() == 10.0:
-            ##                        mx = my = mz = 2.18538e-08
-            ##                        bx = by = bz = -0.00262381
-            ##                    elif self.gain() == 100.0:
-            ##                        mx = my = mz = 2.18538e-09
-            ##                        bx = by = bz = -0.00026280804
-            ##                    elif self.gain() == 1000.0:
-            ##                        m = 2.18538e-10
-            ##                        bx = by = bz = -0.000026280804
-            for i in range(self.samples()):
-                start = 80 + 16 * i
-                stop = start + 16
-                x, y, z, digitalIOstatus = struct.unpack('!fffI', self.p[start:stop])  # Network byte order
-                self.handleDigitalIOstatus(digitalIOstatus, i)
-                if convert:
-                    x, y, z = x * mx + bx, y * my + by, z * mz + bz
-                self._xyz_.append((x, y, z))
+        """Nx3 float32 array of accel_data, decoded in one vectorized pass (and cached)"""
+        if self._xyz_ is None:
+            # NOTE: no conversion from counts or volts here (see xyzCalibrated for that)
+            recs = sample_records(self.p, self.samples())
+            xyz = np.empty((len(recs), 3), dtype=np.float32)  # native byte order, packet has network byte order
+            xyz[:, 0], xyz[:, 1], xyz[:, 2] = recs['x'], recs['y'], recs['z']
+            self._xyz_ = xyz
         return self._xyz_
 
     def txyz(self):
-        """txyz array of accel_data"""
-        if not self._txyz_:
-            dt = 1.0 / self.rate()
-            convert = 0
-            ##            if self.unit() != 'g':
-            ##                convert = 1
-            ##                if self.unit() == 'volts':
-            ##                    mx = my = mz = 1.0/3.89791388
-            ##                    bx = by = bz = 0
-            ##                else: # must be counts
-            ##                    if self.gain() == 1.0:
-            ##                        mx = my = mz = 2.18538e-07
-            ##                        bx = by = bz = -0.026280804
-            ##                    elif self.gain() == 10.0:
-            ##                        mx = my = mz = 2.18538e-08
-            ##                        bx = by = bz = -0.00262381
-            ##                    elif self.gain() == 100.0:
-            ##                        mx = my = mz = 2.18538e-09
-            ##                        bx = by = bz = -0.00026280804
-            ##                    elif self.gain() == 1000.0:
-            ##                        m = 2.18538e-10
-            ##                        bx = by = bz = -0.000026280804
-            for i in range(self.samples()):
-                start = 80 + 16 * i
-                stop = start + 16
-                x, y, z, digitalIOstatus = struct.unpack('!fffI', self.p[start:stop])  # Network byte order
-                self.handleDigitalIOstatus(digitalIOstatus, i)
-                if convert:
-                    x, y, z = x * mx + bx, y * my + by, z * mz + bz
-                t = i * dt
-                self._txyz_.append((t, x, y, z))
+        """Nx4 float64 array of accel_data with relative time (sec since 1st sample) as first column (and cached)"""
+        if self._txyz_ is None:
+            txyz = np.empty((self.samples(), 4))
+            txyz[:, 0] = np.arange(self.samples()) / self.rate()
+            txyz[:, 1:] = self.xyz()
+            self._txyz_ = txyz
         return self._txyz_
+
+    def xyzCalibrated(self, table):
+        """Nx3 float64 array of accel_data in g, using calibration for this sensor and gain from table
+        (CalibrationTable), or None if table has none or packet is not in counts (volts or g already); cached for the
+        calibration used"""
+        if self.unit() != 'counts':
+            return None
+        cal = table.get(self.name(), self.gain())
+        if cal is None:
+            return None
+        if self._xyzCal_ is None or self._xyzCal_[0] is not cal:
+            self._xyzCal_ = (cal, cal.apply(self.xyz()))
+        return self._xyzCal_[1]
+
+
+_TSHES_IDS = {}  # shared Id (bytes) objects for SamsTshEsHeader records
+
+
+register_packet_class(SamsTshEs, b'\xac\xd3', (170, 171))
+register_packet_class(Sams2Packet, b'\xda\xbe', (0x6400,))
+
+
+class SamsTshEsHeader(object):
+    """A lightweight header record for SAMS TSH-ES accel packet, for bulk scans of archived packets (e.g. contiguity
+    checks over a day's worth): just header values in __slots__ (no instance dict, no header dict, no XML or dump
+    caches) plus a reference to packet bytes, so payload only gets decoded if samples are asked for (not cached)."""
+
+    __slots__ = ('p', 'Id', 'counter', 'time', 'status', 'samples', 'rate')
+
+    def __init__(self, packet):
+        """decode header of packet (bytes-like), raise WrongTypeOfPacket if it is not a complete TSH-ES accel packet"""
+        if len(packet) < 80 or packet[0] != 0xac or packet[1] != 0xd3 or (packet[40] << 8 | packet[41]) not in (170, 171):
+            raise WrongTypeOfPacket
+        tshes_id, self.counter, sec, usec, self.status, self.samples = \
+            TshesAccelPacket.prefix_struct.unpack_from(packet, 44)  # Network byte order
+        if self.samples < 0 or len(packet) < 80 + 16 * self.samples:
+            raise WrongTypeOfPacket
+        self.p = packet
+        Id = tshes_id.replace(b'-', b'').replace(b'\0', b'')[-4:]  # keep last 4 characters only, i.e., "es13"
+        self.Id = _TSHES_IDS.setdefault(Id, Id)  # all records for a sensor share one Id object
+        self.time = sec + usec / 1000000.0
+        rateBits = (self.status & 0x0f00) >> 8
+        self.rate = TSH_RATES[rateBits][0] if rateBits < len(TSH_RATES) else 1000.0
+
+    def __str__(self):
+        s = '%s: ' % self.__class__.__name__
+        s += '%s, ' % self.Id.decode('utf-8')
+        s += 'counter = %d, ' % self.counter
+        s += 'time = %.4f, ' % self.time
+        s += 'samples = %d, ' % self.samples
+        s += 'rate = %.4f sa/sec' % self.rate
+        return s
+
+    def endTime(self):
+        """compute end time from start, number of samples and rate"""
+        return self.time + (self.samples - 1) / self.rate
+
+    def gain(self):
+        return TSH_GAINS.get(self.status & 0x001f, (1.0, None))[0]
+
+    def unit(self):
+        unitBits = (self.status & 0x0060) >> 5
+        return TSH_UNITS[unitBits] if unitBits < len(TSH_UNITS) else 'g'
+
+    def adjustment(self):
+        return 'temperature-compensation' if self.status & 0x0080 else 'no-compensation'
+
+    def contiguous(self, other):
+        """return True if this packet is contiguous with the supplied packet (header), same rule as SamsTshEs"""
+        if not other or self.rate != other.rate or (self.status & 0x0080) != (other.status & 0x0080):
+            return False
+        gap = self.time - other.endTime()
+        return (self.time >= other.time) and (gap <= TSHES_MIN_SAMPLES[self.rate] / self.rate)
+
+    def xyz(self):
+        """Nx3 float32 array of accel_data, decoded now (not cached, so record stays small)"""
+        recs = sample_records(self.p, self.samples)
+        xyz = np.empty((len(recs), 3), dtype=np.float32)
+        xyz[:, 0], xyz[:, 1], xyz[:, 2] = recs['x'], recs['y'], recs['z']
+        return xyz
+
+    def txyz(self):
+        """Nx4 float64 array of accel_data with relative time (sec since 1st sample) as first column"""
+        txyz = np.empty((self.samples, 4))
+        txyz[:, 0] = np.arange(self.samples) / self.rate
+        txyz[:, 1:] = self.xyz()
+        return txyz
+
+    def packet(self):
+        """return full-blown SamsTshEs packet object for this header"""
+        return SamsTshEs(self.p)
+
+
+def scan_headers(packets):
+    """generator that yields SamsTshEsHeader for each SAMS TSH-ES accel packet in iterable of packets (bytes-like),
+    skipping any other kinds of packets"""
+    for packet in packets:
+        try:
+            yield SamsTshEsHeader(packet)
+        except WrongTypeOfPacket:
+            pass
+
+
+# one record per SAMS TSH-ES accel packet for the most compact archive-wide scans; index is position in scanned packets
+HEADER_DTYPE = np.dtype([('index', 'i8'), ('counter', 'u4'), ('time', 'f8'), ('status', 'i4'), ('samples', 'i4'),
+                         ('rate', 'f8')])
+
+
+def header_records(packets):
+    """return structured array (HEADER_DTYPE) with a header record for each SAMS TSH-ES accel packet in iterable of
+    packets (bytes-like), skipping any other kinds of packets; use index field to go back to packet for its samples"""
+    rows = []
+    for i, packet in enumerate(packets):
+        try:
+            h = SamsTshEsHeader(packet)
+        except WrongTypeOfPacket:
+            continue
+        rows.append((i, h.counter, h.time, h.status, h.samples, h.rate))
+    return np.array(rows, dtype=HEADER_DTYPE)
+
+
+def contiguous_segments(start, end, rate, dqm, min_samples=TSHES_MIN_SAMPLES):
+    """return (M, 2) int array with [first, stop) packet index pair for each contiguous segment of a packet sequence,
+    given arrays of packet start times, end times, rates and DQM indicators, all in one vectorized pass; rule is the
+    same as the contiguous method of packets, with allowable gap of min_samples / rate, where min_samples is a dict
+    by rate (e.g. TSHES_MIN_SAMPLES or SAMS2_MIN_SAMPLES) or an array with one value per packet"""
+    start, end, rate, dqm = np.asarray(start), np.asarray(end), np.asarray(rate), np.asarray(dqm)
+    if len(start) == 0:
+        return np.empty((0, 2), dtype=np.int64)
+    if isinstance(min_samples, dict):
+        rates, inverse = np.unique(rate, return_inverse=True)
+        min_samples = np.array([min_samples.get(r, 0) for r in rates], dtype=np.float64)[inverse]
+    gap = start[1:] - end[:-1]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        periodic = (start[1:] >= start[:-1]) & (gap <= np.asarray(min_samples)[1:] / rate[1:])
+    ok = (rate[1:] == rate[:-1]) & (dqm[1:] == dqm[:-1]) & np.where(rate[1:] == 0, gap > 0, periodic)
+    breaks = np.flatnonzero(~ok) + 1
+    return np.column_stack((np.r_[0, breaks], np.r_[breaks, len(start)])).astype(np.int64)
+
+
+def header_segments(recs):
+    """return contiguous segments (see contiguous_segments) of SAMS TSH-ES packets from their header records
+    (HEADER_DTYPE), as [first, stop) index pairs into recs"""
+    end = recs['time'] + (recs['samples'] - 1) / recs['rate']
+    return contiguous_segments(recs['time'], end, recs['rate'], (recs['status'] & 0x0080) >> 7)
+
+
+def decode_packets(packets, dtype=np.float32, recs=None):
+    """decode samples of all SAMS TSH-ES accel packets in sequence of packets (bytes-like) straight into one
+    preallocated (total_samples, 3) array, skipping any other kinds of packets; return tuple of that xyz array, each
+    packet's offset (index of its 1st sample) into it and each packet's start time; pass recs (header_records of
+    packets) if you already have them, so headers do not get scanned again"""
+    if recs is None:
+        recs = header_records(packets)  # validates headers in bulk
+    offsets = np.zeros(len(recs), dtype=np.int64)
+    np.cumsum(recs['samples'][:-1], out=offsets[1:])
+    xyz = np.empty((int(recs['samples'].sum()), 3), dtype=dtype)
+    for i, offset, num in zip(recs['index'], offsets, recs['samples']):
+        samples = sample_records(packets[i], num)
+        out = xyz[offset:offset + num]
+        out[:, 0], out[:, 1], out[:, 2] = samples['x'], samples['y'], samples['z']
+    return xyz, offsets, recs['time']
+
+
+# one record per digital IO state change: sensor, time of 1st sample with new state, whether 'something interesting
+# happened' reporting is enabled (dio bit 0) and the input state (dio bit 2, always False while not enabled)
+DIO_EVENT_DTYPE = np.dtype([('sensor', 'U8'), ('time', 'f8'), ('enabled', '?'), ('state', '?')])
+
+
+class DigitalIOTracker(object):
+    """A class to find digital IO state changes (the 'something interesting happened' markers) in digitalIOstatus words
+    of SAMS TSH-ES packets, with vectorized edge detection over a whole packet or batch at a time.  Last state of each
+    sensor is carried over from one update to the next, so a change across packet (or batch) boundaries is caught,
+    but the very first state seen for a sensor is not an event."""
+
+    def __init__(self):
+        self.states = {}  # last state (dio bits 0 and 2) by sensor
+        self.num_events = 0
+
+    def __str__(self):
+        s = '%s: ' % self.__class__.__name__
+        s += 'sensors = %d, ' % len(self.states)
+        s += 'events = %d' % self.num_events
+        return s
+
+    def update(self, sensor, dio, t):
+        """return event table (DIO_EVENT_DTYPE) of state changes for sensor in dio (array of digitalIOstatus words,
+        one per sample) with sample times t (array of unix times), and hold on to last state for next update"""
+        if isinstance(sensor, bytes):
+            sensor = sensor.decode('utf-8')
+        dio = np.asarray(dio, dtype=np.uint32)
+        if len(dio) == 0:
+            return np.empty(0, dtype=DIO_EVENT_DTYPE)
+        state = dio & 0x0005
+        state[(state & 0x0001) == 0] = 0  # input bit means nothing while not enabled
+        prev = self.states.get(sensor, state[0])
+        changed = np.empty(len(state), dtype=bool)
+        changed[0] = state[0] != prev
+        np.not_equal(state[1:], state[:-1], out=changed[1:])
+        self.states[sensor] = state[-1]
+        idx = np.flatnonzero(changed)
+        events = np.empty(len(idx), dtype=DIO_EVENT_DTYPE)
+        events['sensor'] = sensor
+        events['time'] = np.asarray(t)[idx]
+        events['enabled'] = (state[idx] & 0x0001) != 0
+        events['state'] = (state[idx] & 0x0004) != 0
+        self.num_events += len(idx)
+        return events
+
+    def packet_events(self, packets):
+        """return event table (DIO_EVENT_DTYPE, in time order) of state changes in a batch of packets (bytes-like),
+        skipping any that are not SAMS TSH-ES accel packets; one vectorized update per sensor in batch"""
+        chunks = {}
+        for h in scan_headers(packets):
+            dio = sample_records(h.p, h.samples)['dio']
+            chunks.setdefault(h.Id, []).append((dio, h.time + np.arange(h.samples) / h.rate))
+        tables = [self.update(sensor, np.concatenate([c[0] for c in sensor_chunks]),
+                              np.concatenate([c[1] for c in sensor_chunks]))
+                  for sensor, sensor_chunks in chunks.items()]
+        if not tables:
+            return np.empty(0, dtype=DIO_EVENT_DTYPE)
+        events = np.concatenate(tables)
+        return events[np.argsort(events['time'], kind='mergesort')]
+
+
+_shared_xyz = None  # in decode worker processes, view of shared (upper bound on total_samples, 3) output array
+
+
+def _init_decode_worker(raw, shape):
+    global _shared_xyz
+    _shared_xyz = np.frombuffer(raw, dtype=np.float32).reshape(shape)
+
+
+def _decode_chunk_into_shared(packets, start):
+    """scan headers of a chunk of packets and decode their samples straight into shared output array, back to back
+    from row start (chunk's own region); return chunk's header records and how many samples it wrote"""
+    recs = header_records(packets)
+    row = start
+    for i, num in zip(recs['index'], recs['samples']):
+        samples = sample_records(packets[i], num)
+        out = _shared_xyz[row:row + num]
+        out[:, 0], out[:, 1], out[:, 2] = samples['x'], samples['y'], samples['z']
+        row += num
+    return recs, row - start
+
+
+def decode_packets_parallel(packets, workers=None, chunk_packets=2000):
+    """same as decode_packets (float32 only), but split across a pool of worker processes (None for one per core),
+    chunk_packets contiguous packets per task, in one pass: shared array (RawArray handed over by pool initializer, so
+    samples never get pickled) is sized from an upper bound on samples each packet can hold (its bytes past the header,
+    16 per sample), with a region of that size reserved for each chunk; each worker scans headers of its chunk and
+    decodes samples into its region, sending back just header records and sample count, then we compact the regions
+    (one move per chunk); worth it for many thousands of packets, like hours of archived data"""
+    packets = [bytes(p) for p in packets]
+    starts = list(range(0, len(packets), chunk_packets))
+    bounds = np.array([sum([max((len(p) - 80) // 16, 0) for p in packets[i:i + chunk_packets]]) for i in starts],
+                      dtype=np.int64)
+    regions = np.zeros(len(starts), dtype=np.int64)
+    np.cumsum(bounds[:-1], out=regions[1:])
+    bound = int(bounds.sum())
+    if bound == 0:
+        recs = header_records(packets)  # no room for samples, but maybe still some (empty) accel packets
+        return np.empty((0, 3), dtype=np.float32), np.zeros(len(recs), dtype=np.int64), recs['time']
+    raw = RawArray('f', 3 * bound)  # ctypes float is float32
+    xyz = np.frombuffer(raw, dtype=np.float32).reshape(bound, 3)
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_decode_worker,
+                             initargs=(raw, xyz.shape)) as executor:
+        futures = [executor.submit(_decode_chunk_into_shared, packets[i:i + chunk_packets], int(region))
+                   for i, region in zip(starts, regions)]
+        chunks = []
+        total = 0
+        for i, region, future in zip(starts, regions, futures):
+            recs, num = future.result()
+            recs['index'] += i
+            chunks.append(recs)
+            if region != total:
+                xyz[total:total + num] = xyz[region:region + num]
+            total += num
+    recs = np.concatenate(chunks)
+    offsets = np.zeros(len(recs), dtype=np.int64)
+    np.cumsum(recs['samples'][:-1], out=offsets[1:])
+    return xyz[:total], offsets, recs['time']
+
+
+def iter_accel_chunks(table, start=None, stop=None, chunk_packets=1000, shost='localhost', depth=2):
+    """generator that yields decode_packets tuple (xyz, offsets, start times) for each chunk of up to chunk_packets
+    packets from db table with start <= time < stop (None for no limit), in time order; rows come off a server-side
+    cursor, read ahead by up to depth chunks on a background thread while we decode, so memory stays bounded by chunk
+    size even for days of data"""
+    where, params = [], []
+    if start is not None:
+        where.append('time >= %s')
+        params.append(start)
+    if stop is not None:
+        where.append('time < %s')
+        params.append(stop)
+    command = 'select * from %s%s order by time' % (sql_identifier(table),
+                                                    ' where ' + ' and '.join(where) if where else '')
+    rows = get_pool(shost).stream(command, tuple(params) or None, chunk_rows=chunk_packets)
+    for chunk in prefetch(rows, depth=depth):
+        # i[0] is time, i[1] is the blob, i[2] is the type
+        yield decode_packets([i[1] for i in chunk])
+
+
+class DecodedPacketCache(object):
+    """A class for a bounded LRU cache of decoded packet samples (Nx3 float32 arrays) keyed by (table, packet time),
+    so a reader that keeps pulling a sliding window of the newest packets from db only decodes the new ones.  Least
+    recently used entries get evicted once the arrays held add up to more than max_bytes."""
+
+    def __init__(self, max_bytes=64 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.nbytes = 0     # bytes of sample arrays held now
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._cache = OrderedDict()
+
+    def __str__(self):
+        s = '%s: ' % self.__class__.__name__
+        s += 'entries = %d, ' % len(self._cache)
+        s += 'bytes = %d of %d, ' % (self.nbytes, self.max_bytes)
+        s += 'hits = %d, ' % self.hits
+        s += 'misses = %d, ' % self.misses
+        s += 'evictions = %d' % self.evictions
+        return s
+
+    def __len__(self):
+        return len(self._cache)
+
+    def __contains__(self, key):
+        return key in self._cache
+
+    def get(self, key):
+        """return cached (start time, xyz) for key and mark it most recently used, or None (and count a miss)"""
+        value = self._cache.get(key)
+        if value is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._cache.move_to_end(key)
+        return value
+
+    def put(self, key, value):
+        """cache (start time, xyz) for key, then evict least recently used entries until we are within max_bytes"""
+        old = self._cache.pop(key, None)
+        if old is not None:
+            self.nbytes -= old[1].nbytes
+        self._cache[key] = value
+        self.nbytes += value[1].nbytes
+        while self.nbytes > self.max_bytes and len(self._cache) > 1:
+            _, (_, xyz) = self._cache.popitem(last=False)
+            self.nbytes -= xyz.nbytes
+            self.evictions += 1
+
+    def decode(self, table, rows):
+        """return tuple of Nx3 xyz array (one for all rows) and start time of each packet, given db rows (time, blob,
+        ...) from table in time order; decode only the packets we do not have cached (non-TSH-ES packets come back
+        with no samples and get skipped, like decode_packets does)"""
+        chunks, start_times = [], []
+        for row in rows:
+            key = (table, row[0])
+            value = self.get(key)
+            if value is None:
+                xyz, offsets, times = decode_packets([row[1]])
+                value = (times[0] if len(times) else None, xyz)
+                self.put(key, value)
+            if value[0] is not None:
+                start_times.append(value[0])
+                chunks.append(value[1])
+        xyz = np.concatenate(chunks) if chunks else np.empty((0, 3), dtype=np.float32)
+        return xyz, np.array(start_times)
@@ -1,15 +1,21 @@
 #!/usr/bin/env python3
 
 import re
+import time
 import socket
-import struct
+import threading
 import numpy as np
 import logging
+from collections import namedtuple
 
 from tshcal.common.time_utils import unix_to_human_time
-from tshcal.defaults import TSH_BUFFER_SEC
+from tshcal.common.sci_utils import RunningStats
+from tshcal.defaults import TSH_BUFFER_SEC, TSH_MIN_BUFFER_SEC, TSH_RING_SEC, DEFAULT_PORT
 from tshcal.common.tshes_params_packet import TshesMessage
-from tshcal.constants_tsh import TSH_RATES, TSH_GAINS, TSH_UNITS
+from tshcal.common.tshes_accel_packet import TshesAccelPacket, ACCEL_SELECTORS, ACCEL_PREFIX_END
+from tshcal.common.tshes_stream import TshesStreamFramer
+from tshcal.common.capture import TshesRecorder
+from tshcal.common.columnar import ColumnarWriter
 from tshcal.secret import IP_STUB
 
 
@@ -28,12 +34,14 @@ def divvy_up(num, divisor=16):
 
 def recvall(sock, n):
     """helper function to receive n bytes from (sock)et or return None if EOF is hit"""
-    data = b''
-    while len(data) < n:
-        packet = sock.recv(n - len(data))
-        if not packet:
+    data = bytearray(n)  # preallocate & fill in place, growing bytes object one recv at a time is quadratic
+    view = memoryview(data)
+    got = 0
+    while got < n:
+        num = sock.recv_into(view[got:], n - got)
+        if not num:
             return None
-        data += packet
+        got += num
     return data
 
 
@@ -80,6 +88,7 @@ class Tsh(object):
         self.ip = IP_STUB + self.name[-2:]
         self.rate = rate  # sample rate in sa/sec
         self.gain = gain  # gain [code?]  # FIXME figure out if we want code or actual gain value here [probably code!]
+        self.acquisition = None  # TshAcquisition object while we keep a connection streaming in the background
         module_logger.warning("Instantiated %s object but it does not really (yet) do any get/set with TSH commands."
                               % self.__class__.__name__)
 
@@ -89,6 +98,19 @@ class Tsh(object):
         s += 'gain = %.1f' % self.gain
         return s
 
+    def start_acquisition(self, ring_sec=TSH_RING_SEC, port=DEFAULT_PORT):
+        """start (or keep) background acquisition on a persistent connection to this tsh; return TshAcquisition"""
+        if self.acquisition is None:
+            self.acquisition = TshAcquisition(self, ring_sec=ring_sec, port=port)
+        self.acquisition.start()
+        return self.acquisition
+
+    def stop_acquisition(self):
+        """stop background acquisition (if any) and close its connection"""
+        if self.acquisition is not None:
+            self.acquisition.stop()
+            self.acquisition = None
+
     def _validate_name(self, name):
         regexp = re.compile(r'^es\d{2}$')
         if regexp.search(name):
@@ -100,29 +122,78 @@ class Tsh(object):
                                % (name, self.__class__.__name__))
 
 
+# a break in the sample stream found by add_packet: offset is write index of 1st sample after the break, missing is
+# number of samples lost (zero for a counter discontinuity with no lost time, e.g. a tsh restart), start is the time
+# the 1st missing sample was due and stop is the time of 1st sample after the break
+Gap = namedtuple('Gap', ['offset', 'missing', 'start', 'stop'])
+
+
 class TshAccelBuffer(object):
+    """Buffer of TSH xyz values that either fills once (default) or, when circular is True, streams continuously into
+    a fixed-size ring.  Either way, idx is the write index: it only ever increases and counts all samples added, so a
+    consumer can note idx (e.g. after a rig move) and later ask for span(start, stop) of samples added since then.
+
+    In circular mode, each sample is written twice, at ring position i and i + num, so the latest num (or fewer)
+    samples are always one contiguous slice; that is how latest and span return views (snapshots) with no copy.
+
+    A fill-once buffer keeps running stats (mean, variance) of what was added so far.  If tol (in counts) is given, it
+    also counts as full as soon as (at least min_sec seconds of data are in and) the standard error of the median is
+    within tol on every axis, so sec is just the upper bound on how long it takes to fill.
+
+    Use add_packet to add a TshesAccelPacket's samples: it checks packet counter and timestamp against the previous
+    packet and keeps a gap index (list of Gap, in write index order) so downstream code can use segments to work on
+    contiguous data instead of splicing across dropped packets.  It also stores a float64 unix time for each sample,
+    t, alongside xyz (computed per packet from its timestamp and rate), so time windows are just index lookups (see
+    index_at and wait_for_time)."""
 
     # TODO mean and std values for spreadsheet format and more robust file writing
 
-    def __init__(self, tsh, sec, logger=module_logger):
+    def __init__(self, tsh, sec, logger=module_logger, circular=False, tol=None, min_sec=TSH_MIN_BUFFER_SEC):
         self.tsh = tsh  # tsh object -- to set/get some operating parameters
         self.sec = sec  # approximate size of data buffer (in seconds)
         self.logger = logger
         self.logger.debug('Initializing %s.' % self.__class__.__name__)
-        self.num = np.int(np.ceil(self.tsh.rate * sec))  # exact size of buffer (num pts)
+        self.num = int(np.ceil(self.tsh.rate * sec))  # exact size of buffer (num pts)
+        self.circular = circular                      # True for continuous ring; otherwise, fill once
+        rows = 2 * self.num if self.circular else self.num
         # TODO BE CAREFUL: next 2 lines fill array fast, BUT np.empty will contain garbage values
-        self.xyz = np.empty((self.num, 3))  # this will contain garbage values
-        self.xyz.fill(np.nan)          # this cleans up garbage values, replacing with NaNs
-        self.is_full = False           # flag that goes True when data buffer is full
-        self.idx = 0
+        self._data = np.empty((rows, 3))  # this will contain garbage values
+        self._data.fill(np.nan)           # this cleans up garbage values, replacing with NaNs
+        self._t = np.full(rows, np.nan)   # unix time of each sample (stays NaN for samples added without times)
+        self.is_full = False              # flag that goes True when data buffer is full (never for circular)
+        self.idx = 0                      # write index, total number of samples added so far
+        self.stats = RunningStats()       # running mean and variance of samples added (not updated for circular)
+        self.tol = tol                    # if not None, call it full once standard error of median is within tol
+        self.min_num = int(np.ceil(self.tsh.rate * min_sec))  # fewest samples before we check tol
+        self.is_converged = False         # flag that goes True if buffer got full early because of tol
+        self.gaps = []                    # gap index, see Gap (for circular, only gaps still in ring are kept)
+        self._prev = None                 # (counter, end time) of previous packet added, to find next gap
+        self._cond = threading.Condition()  # lets consumers wait for data that has not arrived yet
         self.logger.debug('Done initializing %s.' % self.__class__.__name__)
 
     def __str__(self):
         s = '%s: ' % self.__class__.__name__
         s += '%s, ' % self.tsh
         s += f'sec = {self.sec:,}'  # pattern: f'{value:,}' for thousands comma separator
+        if self.circular:
+            s += ', circular'
         return s
 
+    @property
+    def xyz(self):
+        """Nx3 array of xyz values added so far (fewer than num if filled early); for circular buffer, this is a view
+        of latest (up to num) samples in time order"""
+        if self.circular:
+            return self.latest(min(self.idx, self.num))
+        return self._data[:self.idx, :]
+
+    @property
+    def t(self):
+        """array of unix times that goes with xyz (same rows)"""
+        if self.circular:
+            return self._t[self._slice(max(0, self.idx - self.num), self.idx)]
+        return self._t[:self.idx]
+
     def write_spreadsheet(self, fname):
         print('writing spreadsheet data from %s buffer to %s' % (self.tsh.name, fname))
         np.savetxt(fname, self.xyz, delimiter=',')
@@ -132,25 +203,331 @@ class TshAccelBuffer(object):
         self.logger.info('Writing %s buffer to CSV file "%s".' % (self.tsh.name, fname))
         np.savetxt(fname, self.xyz, delimiter=',', fmt=fmt)
 
-    def add(self, more):
+    def add(self, more, t=None):
+        """add more (Nx3) xyz values and, optionally, t, their N unix times"""
+
+        if self.circular:
+            self._add_circular(more, t)
+            return
 
         if self.is_full:
-            self.logger.warning('Buffer already full, array shape is %s.' % str(self.xyz.shape))
+            self.logger.warning('Buffer already full, array shape is %s.' % str(self._data.shape))
             return
 
         offset = more.shape[0]
-        if self.idx + offset > self.xyz.shape[0]:
-            offset = self.xyz[self.idx:, :].shape[0]
-            self.xyz[self.idx:self.idx + offset, :] = more[0:offset, :]
+        if self.idx + offset >= self._data.shape[0]:
+            offset = self._data[self.idx:, :].shape[0]
+            self._data[self.idx:self.idx + offset, :] = more[0:offset, :]
+            if t is not None:
+                self._t[self.idx:self.idx + offset] = t[0:offset]
             # self.logger.debug('Buffer added %d xyz records.' % offset)
             self.is_full = True
-            self.logger.warning('Buffer now full, so stop adding, the array shape is %s.' % str(self.xyz.shape))
+            self.logger.warning('Buffer now full, so stop adding, the array shape is %s.' % str(self._data.shape))
         else:
-            self.xyz[self.idx:self.idx + offset, :] = more
+            self._data[self.idx:self.idx + offset, :] = more
+            if t is not None:
+                self._t[self.idx:self.idx + offset] = t
             # self.logger.debug('Buffer added %d xyz records.' % offset)
 
+        self.stats.update(self._data[self.idx:self.idx + offset, :])
+        if self.tol is not None and not self.is_full and self.stats.is_converged(self.tol, self.min_num):
+            self.is_full = self.is_converged = True
+            self.logger.info('Buffer converged after %d of %d samples, so stop adding; %s' %
+                             (self.stats.count, self.num, self.stats))
+
         # print(self.idx, self.idx + offset)
-        self.idx = self.idx + offset
+        with self._cond:
+            self.idx = self.idx + offset
+            self._cond.notify_all()
+
+    def add_packet(self, pkt):
+        """add samples of TshesAccelPacket, pkt, noting a gap in gap index if pkt does not pick up where previous
+        packet left off (by counter or by timestamp)"""
+        if self._prev is not None and not self.is_full:
+            counter, end_time = self._prev
+            missing = int(round((pkt.timestamp - end_time) * pkt.rate)) - 1
+            if pkt.counter != (counter + 1) & 0xffffffff or missing > 0:
+                gap = Gap(self.idx, max(missing, 0), end_time + 1.0 / pkt.rate, pkt.timestamp)
+                self.gaps.append(gap)
+                self.logger.warning('Gap in %s data after counter %d (next is %d): %s' %
+                                    (self.tsh.name, counter, pkt.counter, str(gap)))
+        self._prev = (pkt.counter, pkt.end_time())
+        self.add(pkt.xyz(), pkt.t())
+        if self.circular:
+            # forget gaps that ring has already overwritten
+            oldest = self.idx - self.num
+            while self.gaps and self.gaps[0].offset <= oldest:
+                self.gaps.pop(0)
+
+    def write_columnar(self, dirname):
+        """write buffer's xyz counts, their times and gaps to columnar export directory (see ColumnarReader)"""
+        self.logger.info('Writing %s buffer to columnar export "%s".' % (self.tsh.name, dirname))
+        first = self.idx - self.xyz.shape[0]  # write index of oldest sample still in buffer
+        with ColumnarWriter(dirname, self.tsh.name, self.tsh.rate, self.tsh.gain, logger=self.logger) as writer:
+            writer.add(self.xyz, self.t)
+            for g in self.gaps_in(first, self.idx):
+                writer.add_gap(g.offset - first, g.missing, g.start, g.stop)
+
+    def gaps_in(self, start, stop):
+        """return list of gaps that fall inside of samples with write index in [start, stop)"""
+        return [g for g in self.gaps if start < g.offset < stop]
+
+    def segments(self, start=0, stop=None):
+        """return list of (start, stop) write index ranges that split [start, stop) at gaps, so each is contiguous"""
+        stop = self.idx if stop is None else stop
+        edges = [start] + [g.offset for g in self.gaps_in(start, stop)] + [stop]
+        return list(zip(edges[:-1], edges[1:]))
+
+    def _add_circular(self, more, t=None):
+        """write more (Nx3) and its times, t, into ring, overwriting oldest samples, and advance write index"""
+        count = more.shape[0]
+        if t is None:
+            t = np.full(count, np.nan)
+        if count > self.num:
+            more, t = more[-self.num:, :], t[-self.num:]  # only latest num samples of a huge chunk would survive anyway
+        pos = (self.idx + count - more.shape[0]) % self.num
+        first = min(more.shape[0], self.num - pos)
+        rest = more.shape[0] - first
+
+        # write to ring position and its mirror, wrapping around to front of ring for rest (if any)
+        for a, b in ((self._data, more), (self._t, t)):
+            a[pos:pos + first] = b[:first]
+            a[pos + self.num:pos + self.num + first] = b[:first]
+            if rest:
+                a[:rest] = b[first:]
+                a[self.num:self.num + rest] = b[first:]
+
+        # bump write index only after data is in place, so consumers never see samples that are not there yet
+        with self._cond:
+            self.idx = self.idx + count
+            self._cond.notify_all()
+
+    def latest(self, num):
+        """return view (no copy) of the latest num samples, oldest first"""
+        return self.span(self.idx - num, self.idx)
+
+    def latest_sec(self, sec):
+        """return view (no copy) of the latest sec seconds worth of samples, oldest first"""
+        return self.latest(int(np.ceil(self.tsh.rate * sec)))
+
+    def _slice(self, start, stop):
+        """return slice of _data (and _t) rows for samples with write index in [start, stop)"""
+        oldest = max(0, self.idx - self.num) if self.circular else 0
+        if start < oldest or stop > self.idx or start > stop:
+            raise ValueError('span [%d, %d) is not in buffer, which holds [%d, %d)' % (start, stop, oldest, self.idx))
+        if not self.circular:
+            return slice(start, stop)
+        end = self.num + (stop - 1) % self.num + 1  # position just past stop's mirror, so span is contiguous
+        return slice(end - (stop - start), end)
+
+    def span(self, start, stop):
+        """return view (no copy) of samples with write index in [start, stop); for circular buffer, this view is only
+        good until the ring wraps around onto it, so copy it if you need to hang on to it"""
+        return self._data[self._slice(start, stop), :]
+
+    def span_t(self, start, stop):
+        """return view (no copy) of unix times that go with span(start, stop)"""
+        return self._t[self._slice(start, stop)]
+
+    def index_at(self, t):
+        """return write index of 1st sample still in buffer with time at or after t (idx if there is none yet)"""
+        oldest = max(0, self.idx - self.num) if self.circular else 0
+        return oldest + int(np.searchsorted(self.span_t(oldest, self.idx), t, side='left'))
+
+    def wait_for_time(self, t, timeout=None):
+        """block until a sample with time at or after t has been added, then return its write index; return None if
+        timeout (in seconds) expires first"""
+        with self._cond:
+            if not self._cond.wait_for(lambda: self.idx > 0 and self._t[self._slice(self.idx - 1, self.idx)][0] >= t,
+                                       timeout=timeout):
+                return None
+            return self.index_at(t)
+
+    def fill_from(self, ring, timeout=None, start=None):
+        """fill this (fill-once) buffer with samples from ring (a circular buffer that is already streaming) starting
+        at write index start (default is ring's idx, i.e. samples that arrive after this call), adding them in chunks
+        as they come so tol gets checked along the way; return True if this buffer got full before timeout (in seconds)
+        expired"""
+        first = pos = ring.idx if start is None else start
+        offset = self.idx - first  # to go from ring's write index to ours
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while not self.is_full:
+            remaining = None if deadline is None else max(0, deadline - time.monotonic())
+            with ring._cond:
+                if not ring._cond.wait_for(lambda: ring.idx > pos, timeout=remaining):
+                    break
+                stop = min(ring.idx, pos + self.num - self.idx)
+            self.add(ring.span(pos, stop), ring.span_t(pos, stop))
+            pos = stop
+        self.gaps.extend([g._replace(offset=g.offset + offset) for g in ring.gaps_in(first, pos)])
+        return self.is_full
+
+    def wait_for_span(self, start, stop, timeout=None):
+        """block until samples with write index in [start, stop) have been added, then return their span (view);
+        return None if timeout (in seconds) expires first"""
+        with self._cond:
+            if not self._cond.wait_for(lambda: self.idx >= stop, timeout=timeout):
+                return None
+        return self.span(start, stop)
+
+
+class TshAcquisition(object):
+    """A class for long-lived, background acquisition from one tsh: we keep one connection to its data port open (on
+    a thread attached to the Tsh object as tsh.acquisition) and decode continuously.  Each decoded TshesAccelPacket
+    gets fanned out to every subscriber callable; by default, that includes our own circular TshAccelBuffer, ring,
+    so measurements can just use data that is already streaming instead of paying for connection setup and stream
+    resync every time.  If the connection drops, we log it and reconnect until stopped."""
+
+    def __init__(self, tsh, ring_sec=TSH_RING_SEC, port=DEFAULT_PORT, reconnect_sec=2, logger=module_logger):
+        self.tsh = tsh
+        self.port = port
+        self.reconnect_sec = reconnect_sec  # pause before trying to reconnect after connection trouble
+        self.logger = logger
+        self.ring = TshAccelBuffer(tsh, ring_sec, logger=logger, circular=True)
+        self.num_packets = 0                # running total of TshesAccelPackets decoded
+        self.num_connects = 0               # running total of connections made to tsh
+        self._subscribers = [self._add_to_ring]
+        self.recorder = None                # TshesRecorder, if recording raw messages to capture file
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._sock = None
+        self._thread = None
+
+    def __str__(self):
+        s = '%s: ' % self.__class__.__name__
+        s += '%s, ' % self.tsh.name
+        s += 'running = %s, ' % self.is_running()
+        s += 'connects = %d, ' % self.num_connects
+        s += 'packets = %d, ' % self.num_packets
+        s += 'subscribers = %d' % len(self._subscribers)
+        return s
+
+    def _add_to_ring(self, pkt):
+        self.ring.add_packet(pkt)
+
+    def subscribe(self, func):
+        """add func to be called with each decoded TshesAccelPacket; NOTE that func gets called on acquisition thread
+        and packet's data only stays valid during that call, so func should be quick and copy what it keeps"""
+        with self._lock:
+            self._subscribers = self._subscribers + [func]  # swap in new list, so dispatch never sees it change
+
+    def unsubscribe(self, func):
+        """stop calling func with decoded packets"""
+        with self._lock:
+            self._subscribers = [f for f in self._subscribers if f != func]
+
+    def fill(self, buff, timeout=None):
+        """subscribe buff (a fill-once TshAccelBuffer) to fresh packets until full or timeout (sec) expires; return
+        True if buff got filled"""
+        def func(pkt):
+            if not buff.is_full:
+                buff.add_packet(pkt)
+        with buff._cond:
+            self.subscribe(func)
+            try:
+                return buff._cond.wait_for(lambda: buff.is_full, timeout=timeout)
+            finally:
+                self.unsubscribe(func)
+
+    def next_packet_end_time(self, timeout=None):
+        """block until the next packet gets decoded (one that arrives after this call) and return (tsh) time of its
+        last sample; return None if timeout (sec) expires first"""
+        end_times = []
+        got = threading.Event()
+
+        def func(pkt):
+            if not got.is_set():
+                end_times.append(pkt.end_time())
+                got.set()
+        self.subscribe(func)
+        try:
+            if not got.wait(timeout):
+                return None
+            return end_times[0]
+        finally:
+            self.unsubscribe(func)
+
+    def start_recording(self, fname, **kwargs):
+        """start recording every raw message that arrives to capture file, fname; return TshesRecorder"""
+        self.stop_recording()
+        self.recorder = TshesRecorder(fname, self.tsh, logger=self.logger, **kwargs)
+        return self.recorder
+
+    def stop_recording(self):
+        """stop recording (if we are), writing out and closing capture file"""
+        recorder, self.recorder = self.recorder, None
+        if recorder is not None:
+            recorder.close()
+
+    def is_running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        """start acquisition thread (if not already running)"""
+        if self.is_running():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='acq_%s' % self.tsh.name, daemon=True)
+        self._thread.start()
+        self.logger.info('Started %s.' % self)
+
+    def stop(self, timeout=None):
+        """stop acquisition thread and close its connection"""
+        self._stop.set()
+        sock = self._sock
+        if sock is not None:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)  # this gets blocking recv to return, so thread can notice stop
+            except OSError:
+                pass
+        if self._thread is not None:
+            self._thread.join(timeout)
+        self.stop_recording()
+        self.logger.info('Stopped %s.' % self)
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                with socket.create_connection((self.tsh.ip, self.port), timeout=self.reconnect_sec * 5) as s:
+                    self._sock = s
+                    self.num_connects += 1
+                    self.logger.info('Acquisition connected to %s:%d.' % (self.tsh.ip, self.port))
+                    self._stream(s)
+            except OSError as e:
+                if not self._stop.is_set():
+                    self.logger.warning('Acquisition connection trouble with %s: %s' % (self.tsh.name, e))
+            finally:
+                self._sock = None
+            if not self._stop.is_set():
+                self._stop.wait(self.reconnect_sec)
+
+    def _stream(self, s):
+        """decode messages from connected socket, s, and dispatch packets to subscribers until EOF or stopped"""
+        framer = TshesStreamFramer(s, logger=self.logger)
+        for data in framer.messages():
+            if self._stop.is_set():
+                break
+            recorder = self.recorder
+            if recorder is not None:
+                recorder.record(data)  # every message, unchanged, before we filter or decode anything
+            if TshesMessage(data).selector() not in ACCEL_SELECTORS or len(data) < ACCEL_PREFIX_END:
+                continue
+            try:
+                pkt = TshesAccelPacket(data)
+            except ValueError as e:
+                self.logger.warning('Tshes message of %d bytes cannot be decoded (%s), skip it.' % (len(data), e))
+                continue
+            if not pkt.is_complete():
+                self.logger.warning('Tshes message of %d bytes is too short to hold %d samples, skip it.' %
+                                    (len(data), pkt.num_samples))
+                continue
+            self.num_packets += 1
+            for func in self._subscribers:
+                try:
+                    func(pkt)
+                except Exception:
+                    # one bad subscriber should not take down acquisition for everybody else
+                    self.logger.exception('Acquisition subscriber %s failed.' % func)
 
 
 # FIXME make this a method in TshAccelBuffer class
@@ -160,134 +537,55 @@ def raw_data_from_socket(ip_addr, buff, port=9750):
     # crude attempt at identifying columns in log entriess
     # module_logger.debug(get_buff_header())
 
-    previous_count = -1
-
     with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
         s.connect((ip_addr, port))
-        while not buff.is_full:
-            data = s.recv(8192)  # FIXME power of 2 is recommended, but not sure what optimum value to use here
-            if data:
-                if len(data) >= 16:  # FIXME Why 80 in Ted's code [maybe it was MySQL db goodness?]; MAYBE > ZERO??
-
-                    # get selector value
-                    byte2 = struct.unpack('c', bytes([data[40]]))[0]
-                    byte3 = struct.unpack('c', bytes([data[41]]))[0]
-                    selector = ord(byte2) * 256 + ord(byte3)
-
-                    # make sure we have selector that corresponds to a TshesAccelPacket; either real-time or replay
-                    accel_pkt = (selector == 170) or (selector == 171)
-                    if accel_pkt:
-
-                        # examine structure before "Data" payload (TshesAccelPacket), starts @ byte 44 of tshes message
-                        tm = TshesMessage(data)
-                        # tm.enum_bytes()
-
-                        # --- NOW HERE WE TRANSITION TO TshesAccelPacket ---
-
-                        # tsh identifier
-                        tshes_id = data[44:60]
-                        tshes_id = tshes_id.replace(b'-', b'').replace(b'\0', b'')  # delete dashes and nulls
-                        tshes_id = tshes_id[-4:]  # keep last 4 characters only, i.e., "es13"
-
-                        # counter
-                        counter = struct.unpack('!I', data[60:64])[0]  # Network byte order
-
-                        # let's throw in a line with dashes near counter column when we detect one or more missing count
-                        if counter - previous_count != 1:
-                            module_logger.debug(' '*60 + '-'*7)
-                        previous_count = counter
-
-                        # timestamp
-                        sec, usec = struct.unpack('!II', data[64:72])  # Network byte order
-                        timestamp = sec + usec / 1000000.0
-
-                        # packet_status
-                        packet_status = struct.unpack('!i', data[72:76])[0]  # Network byte order
-
-                        # number of samples
-                        num_samples = struct.unpack('!i', data[76:80])[0]  # Network byte order
-
-                        # get rate and cutoff_freq from packet status
-                        rate_bits = (packet_status & 0x0f00) >> 8
-                        rate, cutoff_freq = TSH_RATES[rate_bits]
-
-                        # get gain and input from packet status
-                        gain_bits = packet_status & 0x001f
-                        gain, inp = TSH_GAINS[gain_bits]
-
-                        # get unit from packet status
-                        unit_bits = (packet_status & 0x0060) >> 5
-                        unit = TSH_UNITS[unit_bits]
-
-                        # get adjustment from packet status
-                        adj_bits = (packet_status & 0x0080) >> 7
-                        adjustment = 'no-compensation'
-                        if adj_bits == 1:
-                            adjustment = 'temperature-compensation'
-
-                        # compute end time from start, number of samples and rate
-                        end_time = timestamp + (num_samples - 1) / rate
-
-                        # build array of accel data
-                        xyz = []
-
-                        # compute delta samples missing from current volley of bytes; 1 sample = 16 bytes (x,y,z,dio)
-                        received_samples, left_over_bytes = divvy_up(len(data[80:]))
-                        deficit_samples = num_samples - received_samples
-                        deficit_bytes = deficit_samples * 16 - left_over_bytes
-
-                        # append the samples we have received so far
-                        for i in range(received_samples):
-                            start = 80 + 16 * i
-                            stop = start + 16
-                            x, y, z, dio = struct.unpack('!fffI', data[start:stop])  # Network byte order
-                            # we are ignoring digital io status (dio)
-                            # self.handleDigitalIOstatus(digitalIOstatus, i)
-                            # if convert:
-                            #     x, y, z = x * mx + bx, y * my + by, z * mz + bz
-                            xyz.append((x, y, z))
-
-                        # NOTE: This next bit of code shows we now know we're dealing with stream-based protocol!
-
-                        # keep remainder bytes & prepend'em to balance of samples we'll get for TshesAccelPacket struct
-                        more_data = data[stop:]
-                        more_data += recvall(s, deficit_bytes)  # remainder of bytes we need to get num_samples filled
-
-                        # append deficit samples to get a total of num_samples (promised in TshesAccelPacket's "Prefix")
-                        for i in range(deficit_samples):
-                            start = 16 * i
-                            stop = start + 16
-                            x, y, z, dio = struct.unpack('!fffI', more_data[start:stop])  # Network byte order
-                            xyz.append((x, y, z))
-
-                        # module_logger.debug("{:>4} {} {:>4s} {:>10d} {} {:>5d} {:>3d} {:>6.1f} {:>6.2f} {:>4.1f} {:>6s}"
-                        #       " {:>6s} {:>15s} {} {:>3d} {:>3d} {:>3d} {:>4d}".format(
-                        #     len(data),
-                        #     str(tm).replace('\n', ' '),
-                        #     tshes_id.decode('utf-8'),
-                        #     counter,
-                        #     unix_to_human_time(timestamp),
-                        #     packet_status,
-                        #     num_samples,
-                        #     rate,
-                        #     cutoff_freq,
-                        #     gain,
-                        #     inp,
-                        #     unit,
-                        #     adjustment,
-                        #     unix_to_human_time(end_time),
-                        #     received_samples,
-                        #     left_over_bytes,
-                        #     deficit_samples,
-                        #     stop - left_over_bytes)
-                        # )
-
-                        buff.add(np.array(xyz))
-
-                else:
-                    print('unhandled branch with len(data) = %d' % len(data))
-
-            else:
+
+        # NOTE: this is a stream-based protocol, so framer uses msg_size to hand us whole messages, one at a time
+        framer = TshesStreamFramer(s, logger=buff.logger)
+        for data in framer.messages():
+
+            # examine structure before "Data" payload (TshesAccelPacket), starts @ byte 44 of tshes message
+            tm = TshesMessage(data)
+            # tm.enum_bytes()
+
+            # make sure we have selector that corresponds to a TshesAccelPacket; either real-time or replay
+            if tm.selector() not in ACCEL_SELECTORS or len(data) < ACCEL_PREFIX_END:
+                continue
+
+            # --- NOW HERE WE TRANSITION TO TshesAccelPacket ---
+            try:
+                pkt = TshesAccelPacket(data)
+            except ValueError as e:
+                module_logger.warning('Tshes message of %d bytes cannot be decoded (%s), skip it.' % (len(data), e))
+                continue
+
+            # msg_size has to cover all num_samples promised in TshesAccelPacket's "Prefix"; 1 sample = 16 bytes
+            if not pkt.is_complete():
+                module_logger.warning('Tshes message of %d bytes is too short to hold %d samples, skip it.' %
+                                      (len(data), pkt.num_samples))
+                continue
+
+            # module_logger.debug("{:>4} {} {:>4s} {:>10d} {} {:>5d} {:>3d} {:>6.1f} {:>6.2f} {:>4.1f} {:>6s}"
+            #       " {:>6s} {:>15s} {}".format(
+            #     len(data),
+            #     str(tm).replace('\n', ' '),
+            #     pkt.tshes_id,
+            #     pkt.counter,
+            #     unix_to_human_time(pkt.timestamp),
+            #     pkt.packet_status,
+            #     pkt.num_samples,
+            #     pkt.rate,
+            #     pkt.cutoff_freq,
+            #     pkt.gain,
+            #     pkt.input,
+            #     pkt.unit,
+            #     pkt.adjustment,
+            #     unix_to_human_time(pkt.end_time()))
+            # )
+
+            # decode all num_samples in one shot, no per-sample loop; we are ignoring digital io status (dio) here
+            buff.add_packet(pkt)
+            if buff.is_full:
                 break
 
 
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+
+import os
+import logging
+import numpy as np
+
+from tshcal.defaults import TSH_AX
+
+
+# create logger
+module_logger = logging.getLogger('tshcal')
+
+
+def axes_csv_file(out_dir, sensor, rough_home):
+    """return path of axes CSV file (x,y,z counts) that calibration writes for sensor (e.g. es13) at rough_home"""
+    return os.path.join(out_dir, 'axes_tsh' + sensor.replace('s', 's-') + '_' + rough_home)
+
+
+class TshCalibration(object):
+    """A class for one sensor's counts-to-g transform at one gain: g = M (counts - bias), where M is either diagonal
+    (just a scale factor per axis) or a full 3x3 matrix that also takes out axis misalignment."""
+
+    def __init__(self, sensor, gain, bias, scale=None, matrix=None):
+        self.sensor = sensor                                # e.g. 'es13'
+        self.gain = gain                                    # gain these numbers are good for
+        self.bias = np.asarray(bias, dtype=np.float64)      # counts at zero g, per axis
+        if matrix is None:
+            matrix = np.diag(np.asarray(scale, dtype=np.float64))
+        self.matrix = np.asarray(matrix, dtype=np.float64)  # 3x3, g per count
+
+    def __str__(self):
+        s = '%s: ' % self.__class__.__name__
+        s += '%s, ' % self.sensor
+        s += 'gain = %g, ' % self.gain
+        s += 'bias = %s, ' % np.array2string(self.bias, precision=1)
+        s += 'scale = %s' % np.array2string(np.diag(self.matrix), precision=4)
+        return s
+
+    def apply(self, counts):
+        """return Nx3 float64 array in g for Nx3 array of counts, in one matrix operation"""
+        return (np.asarray(counts, dtype=np.float64) - self.bias) @ self.matrix.T
+
+    @classmethod
+    def from_axes_files(cls, out_dir, sensor, gain, misalignment=False):
+        """return calibration from the 6 axes CSV files (one per rough home) calibration wrote to out_dir
+
+        At +ax rough home, ax axis reads +1g and at -ax, -1g, so with plus and minus median counts for each axis,
+        bias = (plus + minus) / 2 and scale = 2 / (plus - minus).  With misalignment, full 3x3 matrix is least-squares
+        fit of all 6 (x,y,z) medians, less bias, to their ideal gravity vectors (+/- 1g on one axis, zero on others).
+        """
+        homes = ['%s%s' % (sign, ax) for ax in sorted(TSH_AX, key=TSH_AX.get) for sign in '+-']
+        counts, ideal = [], []
+        for home in homes:
+            xyz = np.loadtxt(axes_csv_file(out_dir, sensor, home), delimiter=',', ndmin=2)
+            counts.append(np.median(xyz, axis=0))
+            g = np.zeros(3)
+            g[TSH_AX[home[1]]] = 1.0 if home[0] == '+' else -1.0
+            ideal.append(g)
+        counts = np.array(counts)  # 6x3 in order +x, -x, +y, -y, +z, -z
+        idx = np.arange(3)
+        plus, minus = counts[2 * idx, idx], counts[2 * idx + 1, idx]
+        bias = (plus + minus) / 2
+        scale = 2 / (plus - minus)
+        matrix = None
+        if misalignment:
+            matrix = np.linalg.lstsq(counts - bias, np.array(ideal), rcond=None)[0].T
+        return cls(sensor, gain, bias, scale=scale, matrix=matrix)
+
+
+class CalibrationTable(object):
+    """A class to look up TshCalibration by sensor and gain, so code that converts counts (e.g. packet decoding)
+    can take whichever calibrations are on hand without knowing where they came from."""
+
+    def __init__(self, calibrations=()):
+        self._cals = {}
+        for cal in calibrations:
+            self.add(cal)
+
+    def __str__(self):
+        s = '%s: ' % self.__class__.__name__
+        s += '%d calibration(s) ' % len(self._cals)
+        s += '%s' % sorted(self._cals)
+        return s
+
+    def __len__(self):
+        return len(self._cals)
+
+    @staticmethod
+    def _key(sensor, gain):
+        if isinstance(sensor, bytes):
+            sensor = sensor.decode('utf-8')
+        return sensor, float(gain)
+
+    def add(self, cal):
+        """add (or replace) calibration for its sensor and gain"""
+        self._cals[self._key(cal.sensor, cal.gain)] = cal
+
+    def get(self, sensor, gain):
+        """return calibration for sensor (str or bytes) at gain, or None if we do not have one"""
+        return self._cals.get(self._key(sensor, gain))
+
+    def load_axes_files(self, out_dir, sensor, gain, misalignment=False):
+        """add calibration from axes CSV files in out_dir (see TshCalibration.from_axes_files) and return it"""
+        cal = TshCalibration.from_axes_files(out_dir, sensor, gain, misalignment=misalignment)
+        module_logger.info('Loaded %s from "%s".' % (cal, out_dir))
+        self.add(cal)
+        return cal
@@ -0,0 +1,236 @@
+#!/usr/bin/env python3
+
+import os
+import time
+import queue
+import struct
+import logging
+import threading
+
+from tshcal.common.tshes_stream import TshesStreamFramer
+from tshcal.common.time_utils import unix_to_human_time
+
+
+# create logger
+module_logger = logging.getLogger('tshcal')
+
+# capture file is this fixed-size header followed by tshes messages exactly as they came in on data port (9750),
+# back to back; each message carries its own msg_size, so that is all the framing we need to read them back
+CAPTURE_MAGIC = b'TSHCAP01'
+CAPTURE_HEADER_STRUCT = struct.Struct('!8s16sddd')  # magic, sensor, rate, gain, start (unix time)
+
+
+class CaptureHeader(object):
+    """A class for the small header at the start of a capture file: sensor, rate, gain and start time."""
+
+    def __init__(self, sensor, rate, gain, start):
+        self.sensor = sensor  # e.g. 'es13'
+        self.rate = rate      # sample rate (sa/sec) we expected when recording started
+        self.gain = gain      # gain we expected when recording started
+        self.start = start    # unix time when recording started
+
+    def __str__(self):
+        s = '%s: ' % self.__class__.__name__
+        s += 'sensor = %s, ' % self.sensor
+        s += 'rate = %.1f, ' % self.rate
+        s += 'gain = %g, ' % self.gain
+        s += 'start = %s' % unix_to_human_time(self.start)
+        return s
+
+    def pack(self):
+        """return header bytes"""
+        return CAPTURE_HEADER_STRUCT.pack(CAPTURE_MAGIC, self.sensor.encode('utf-8'), self.rate, self.gain, self.start)
+
+    @classmethod
+    def unpack(cls, data):
+        """return CaptureHeader from header bytes, data"""
+        if len(data) < CAPTURE_HEADER_STRUCT.size:
+            raise ValueError('capture header needs %d bytes, got %d' % (CAPTURE_HEADER_STRUCT.size, len(data)))
+        magic, sensor, rate, gain, start = CAPTURE_HEADER_STRUCT.unpack_from(data)
+        if magic != CAPTURE_MAGIC:
+            raise ValueError('not a tsh capture file, magic bytes are %r' % magic)
+        return cls(sensor.rstrip(b'\0').decode('utf-8'), rate, gain, start)
+
+
+class TshesRecorder(object):
+    """A class to record raw tshes messages to an append-only capture file.
+
+    Recording must never hold up the decoder, so record just appends each message to an in-memory batch; full batches
+    (or ones older than fsync_sec) get handed to a writer thread that does the file writes and an fsync at most every
+    fsync_sec seconds; a batch that sits in memory that long because the stream went quiet gets picked up by the writer
+    thread itself.  If the file already exists (and has a header), we append to it, but only if its header is for the
+    same sensor, rate and gain as tsh (else ValueError).  If the writer thread fails, its exception gets logged and
+    raised again by the next record or close."""
+
+    def __init__(self, fname, tsh, batch_bytes=256 * 1024, fsync_sec=5, logger=module_logger):
+        self.fname = fname
+        self.batch_bytes = batch_bytes  # hand off batch to writer thread once it is this big...
+        self.fsync_sec = fsync_sec      # ...or this old; writer also fsyncs no more often than this
+        self.logger = logger
+        self.num_messages = 0           # running total of messages recorded
+        self.bytes_written = 0          # running total of message bytes written to file (by writer thread)
+        self._file = open(fname, 'ab')
+        if self._file.tell() == 0:
+            self.header = CaptureHeader(tsh.name, tsh.rate, tsh.gain, time.time())
+            self._file.write(self.header.pack())
+        else:
+            try:
+                with open(fname, 'rb') as f:
+                    self.header = CaptureHeader.unpack(f.read(CAPTURE_HEADER_STRUCT.size))
+                if (self.header.sensor, self.header.rate, self.header.gain) != (tsh.name, tsh.rate, tsh.gain):
+                    raise ValueError('cannot append %s at rate = %.1f, gain = %g to "%s", %s' %
+                                     (tsh.name, tsh.rate, tsh.gain, fname, self.header))
+            except ValueError:
+                self._file.close()
+                raise
+        self._lock = threading.Lock()
+        self._batch = bytearray()
+        self._batch_time = time.monotonic()
+        self._queue = queue.Queue()
+        self._error = None  # exception that stopped writer thread, if any
+        self._thread = threading.Thread(target=self._write_loop, name='rec_%s' % tsh.name, daemon=True)
+        self._thread.start()
+        self.logger.info('Recording to "%s", %s.' % (fname, self.header))
+
+    def __str__(self):
+        s = '%s: ' % self.__class__.__name__
+        s += '"%s", ' % self.fname
+        s += 'messages = %d, ' % self.num_messages
+        s += 'bytes written = %d' % self.bytes_written
+        return s
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.close()
+
+    def record(self, msg):
+        """append one whole tshes message (bytes-like, copied here, so a reused memoryview is fine) to capture"""
+        self._check_error()
+        with self._lock:
+            if self._batch is None:
+                return  # already closed
+            self._batch += msg
+            self.num_messages += 1
+            if len(self._batch) >= self.batch_bytes or time.monotonic() - self._batch_time >= self.fsync_sec:
+                self._hand_off()
+
+    def _hand_off(self):
+        """give current batch to writer thread and start a new one (call with lock held)"""
+        if self._batch:
+            self._queue.put(self._batch)
+            self._batch = bytearray()
+        self._batch_time = time.monotonic()
+
+    def flush(self):
+        """hand off whatever is batched so far to writer thread"""
+        with self._lock:
+            if self._batch is not None:
+                self._hand_off()
+
+    def close(self):
+        """write out everything recorded so far, fsync and close capture file"""
+        with self._lock:
+            if self._batch is None:
+                return
+            self._hand_off()
+            self._batch = None
+        self._queue.put(None)  # tells writer thread to finish up
+        self._thread.join()
+        self._file.close()
+        self._check_error()
+        self.logger.info('Done recording, %s.' % self)
+
+    def _check_error(self):
+        """raise exception that stopped writer thread, if any"""
+        if self._error is not None:
+            raise self._error
+
+    def _take_batch(self):
+        """return current batch (maybe empty) and start a new one, for writer thread when stream goes quiet"""
+        with self._lock:
+            if not self._batch:
+                return b''
+            batch = self._batch
+            self._batch = bytearray()
+            self._batch_time = time.monotonic()
+            return batch
+
+    def _sync(self):
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def _write_loop(self):
+        try:
+            self._write_batches()
+        except Exception as e:
+            self.logger.exception('Writer thread for "%s" failed.' % self.fname)
+            self._error = e
+
+    def _write_batches(self):
+        last_sync = time.monotonic()
+        dirty = True  # header (maybe)
+        while True:
+            try:
+                batch = self._queue.get(timeout=self.fsync_sec)
+            except queue.Empty:
+                batch = self._take_batch()  # nothing handed off for fsync_sec, so stream is quiet; take what is there
+            if batch is None:
+                break
+            if batch:
+                self._file.write(batch)
+                self.bytes_written += len(batch)
+                dirty = True
+            if dirty and time.monotonic() - last_sync >= self.fsync_sec:
+                self._sync()
+                last_sync, dirty = time.monotonic(), False
+        self._sync()
+
+
+class CaptureReader(object):
+    """A class to read back a capture file: header, then tshes messages one at a time, as if from data port."""
+
+    def __init__(self, fname, logger=module_logger):
+        self.fname = fname
+        self.logger = logger
+        self._file = open(fname, 'rb')
+        self.header = CaptureHeader.unpack(self._file.read(CAPTURE_HEADER_STRUCT.size))
+
+    def __str__(self):
+        return '%s: "%s", %s' % (self.__class__.__name__, self.fname, self.header)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.close()
+
+    def close(self):
+        self._file.close()
+
+    def messages(self):
+        """generator that yields memoryview of each tshes message in capture (valid until the next one is requested)"""
+        return TshesStreamFramer(self._file, logger=self.logger).messages()
+
+
+def demo_record(sensor='es13', rate=250.0, gain=0, sec=10, fname='/tmp/tsh_capture.bin'):
+    """record sec seconds of data from tsh to capture file, then read it back to show what we got"""
+
+    from tshcal.common.buffer import Tsh
+    from tshcal.common.tshes_accel_packet import TshesAccelPacket
+
+    tsh = Tsh(sensor, rate, gain)
+    acq = tsh.start_acquisition()
+    acq.start_recording(fname)
+    time.sleep(sec)
+    tsh.stop_acquisition()
+
+    with CaptureReader(fname) as reader:
+        print(reader)
+        for data in reader.messages():
+            print(TshesAccelPacket(data))
+
+
+if __name__ == '__main__':
+    demo_record()
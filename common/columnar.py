@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+
+import os
+import json
+import logging
+import numpy as np
+
+
+# create logger
+module_logger = logging.getLogger('tshcal')
+
+# columnar export is a directory with one fixed-width, little-endian binary file per column (all the same number of
+# rows, sample order), a sidecar index of packet boundaries and gaps (.npy) and a small JSON header; columns get
+# memory-mapped by the reader, so opening even hours of data is instant and slicing by time is a binary search
+COLUMN_DTYPES = [('x', '<f4'), ('y', '<f4'), ('z', '<f4'), ('t', '<f8')]  # xyz in counts, t is unix time
+PACKET_DTYPE = np.dtype([('offset', '<i8'), ('time', '<f8')])             # row of packet's 1st sample, its time
+GAP_DTYPE = np.dtype([('offset', '<i8'), ('missing', '<i8'), ('start', '<f8'), ('stop', '<f8')])  # like buffer Gap
+HEADER_FILE = 'header.json'
+PACKETS_FILE = 'packets.npy'
+GAPS_FILE = 'gaps.npy'
+
+
+class ColumnarWriter(object):
+    """A class to write decoded samples to a columnar export directory: call add as many times as you like (each
+    chunk gets appended straight to the column files), optionally noting packet boundaries and gaps along the way,
+    then close to write the sidecar index and header."""
+
+    def __init__(self, dirname, sensor, rate, gain, logger=module_logger):
+        self.dirname = dirname
+        self.sensor = sensor
+        self.rate = rate
+        self.gain = gain
+        self.logger = logger
+        self.num = 0  # rows written so far
+        os.makedirs(dirname, exist_ok=True)
+        self._files = [open(os.path.join(dirname, '%s.bin' % name), 'wb') for name, dtype in COLUMN_DTYPES]
+        self._packets = []
+        self._gaps = []
+
+    def __str__(self):
+        s = '%s: ' % self.__class__.__name__
+        s += '"%s", ' % self.dirname
+        s += '%s, ' % self.sensor
+        s += 'rows = %d' % self.num
+        return s
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.close()
+
+    def add(self, xyz, t, packet_offsets=None, packet_times=None):
+        """append Nx3 xyz and their N unix times, t, plus (optionally) boundaries of packets they came from, given as
+        offsets (relative to this chunk) and times of each packet's 1st sample; return row of 1st sample added"""
+        first = self.num
+        columns = (xyz[:, 0], xyz[:, 1], xyz[:, 2], t)
+        for f, column, (name, dtype) in zip(self._files, columns, COLUMN_DTYPES):
+            f.write(np.ascontiguousarray(column, dtype=dtype).tobytes())
+        self.num += len(t)
+        if packet_offsets is not None:
+            self._packets.append(np.rec.fromarrays([np.asarray(packet_offsets) + first, packet_times],
+                                                   dtype=PACKET_DTYPE))
+        return first
+
+    def add_gap(self, offset, missing, start, stop):
+        """note gap just before row offset: missing samples (best guess) between times start and stop"""
+        self._gaps.append((offset, missing, start, stop))
+
+    def close(self):
+        """close column files and write sidecar index and header"""
+        if self._files is None:
+            return
+        for f in self._files:
+            f.close()
+        self._files = None
+        packets = np.concatenate(self._packets) if self._packets else np.empty(0, dtype=PACKET_DTYPE)
+        np.save(os.path.join(self.dirname, PACKETS_FILE), packets.astype(PACKET_DTYPE))
+        np.save(os.path.join(self.dirname, GAPS_FILE), np.array(self._gaps, dtype=GAP_DTYPE))
+        header = {'sensor': self.sensor, 'rate': self.rate, 'gain': self.gain, 'rows': self.num,
+                  'columns': COLUMN_DTYPES}
+        with open(os.path.join(self.dirname, HEADER_FILE), 'w') as f:
+            json.dump(header, f, indent=1)
+        self.logger.info('Wrote %s.' % self)
+
+
+class ColumnarReader(object):
+    """A class to read a columnar export: x, y, z and t are read-only memory maps of the column files (nothing gets
+    read until it is touched), packets and gaps are the sidecar index; slice by time with span."""
+
+    def __init__(self, dirname):
+        self.dirname = dirname
+        with open(os.path.join(dirname, HEADER_FILE)) as f:
+            header = json.load(f)
+        self.sensor = header['sensor']
+        self.rate = header['rate']
+        self.gain = header['gain']
+        self.num = header['rows']
+        for name, dtype in header['columns']:
+            if self.num:
+                column = np.memmap(os.path.join(dirname, '%s.bin' % name), dtype=dtype, mode='r', shape=(self.num,))
+            else:
+                column = np.empty(0, dtype=dtype)  # cannot memory-map an empty file
+            setattr(self, name, column)
+        self.packets = np.load(os.path.join(dirname, PACKETS_FILE))
+        self.gaps = np.load(os.path.join(dirname, GAPS_FILE))
+
+    def __str__(self):
+        s = '%s: ' % self.__class__.__name__
+        s += '"%s", ' % self.dirname
+        s += '%s, ' % self.sensor
+        s += 'rate = %.4f, ' % self.rate
+        s += 'rows = %d, ' % self.num
+        s += 'gaps = %d' % len(self.gaps)
+        return s
+
+    def index_range(self, start=None, stop=None):
+        """return (first, stop) rows for samples with start <= t < stop (None for no limit), by binary search on t"""
+        first = 0 if start is None else int(np.searchsorted(self.t, start, side='left'))
+        last = self.num if stop is None else int(np.searchsorted(self.t, stop, side='left'))
+        return first, max(first, last)
+
+    def span(self, start=None, stop=None):
+        """return (t, x, y, z) views (no copy, nothing read until touched) of samples with start <= t < stop"""
+        first, last = self.index_range(start, stop)
+        return self.t[first:last], self.x[first:last], self.y[first:last], self.z[first:last]
+
+    def xyz(self, start=None, stop=None):
+        """return Nx3 float32 array (a copy) of samples with start <= t < stop"""
+        t, x, y, z = self.span(start, stop)
+        return np.column_stack((x, y, z))
+
+    def gaps_in(self, start=None, stop=None):
+        """return gap records for gaps just before rows of samples with start <= t < stop"""
+        first, last = self.index_range(start, stop)
+        return self.gaps[(self.gaps['offset'] > first) & (self.gaps['offset'] < last)]
+
+
+def export_packets(packets, dirname, logger=module_logger):
+    """write SAMS TSH-ES accel packets (bytes-like, in time order; others skipped) to columnar export directory, with
+    per-sample times from each packet's time and rate, packet boundaries and gaps between contiguous segments; return
+    number of rows written; segments that break only on rate or DQM (no time missing) do not get a gap"""
+
+    from tshcal.common.accel_packet import SamsTshEsHeader, header_records, header_segments, decode_packets
+
+    recs = header_records(packets)
+    xyz, offsets, times = decode_packets(packets, recs=recs)
+    rows = np.arange(len(xyz))
+    t = np.repeat(times, recs['samples']) + (rows - np.repeat(offsets, recs['samples'])) / np.repeat(recs['rate'],
+                                                                                                     recs['samples'])
+    sensor, rate, gain = '', 0.0, 0.0
+    if len(recs):
+        h = SamsTshEsHeader(packets[recs['index'][0]])
+        sensor, rate, gain = h.Id.decode('utf-8'), h.rate, h.gain()
+    with ColumnarWriter(dirname, sensor, rate, gain, logger=logger) as writer:
+        writer.add(xyz, t, offsets, times)
+        for first, stop in header_segments(recs)[1:]:
+            prev = first - 1
+            end = times[prev] + (recs['samples'][prev] - 1) / recs['rate'][prev]
+            start = end + 1.0 / recs['rate'][prev]  # time next sample was due
+            if times[first] - start < 0.5 / recs['rate'][prev]:
+                continue  # no time missing (to within half a sample), segment breaks on rate or DQM change instead
+            missing = max(int(round((times[first] - end) * recs['rate'][prev])) - 1, 0)
+            writer.add_gap(offsets[first], missing, start, times[first])
+    return len(xyz)
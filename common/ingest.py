@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+
+import asyncio
+import logging
+
+from tshcal.defaults import DEFAULT_PORT, TSH_RING_SEC
+from tshcal.common.buffer import Tsh, TshAccelBuffer
+from tshcal.common.tshes_params_packet import TshesMessage
+from tshcal.common.tshes_stream import TshesStreamFramer
+from tshcal.common.tshes_accel_packet import TshesAccelPacket, ACCEL_SELECTORS, ACCEL_PREFIX_END
+
+
+# create logger
+module_logger = logging.getLogger('tshcal')
+
+
+class TshesIngestProtocol(asyncio.BufferedProtocol):
+    """asyncio protocol for one tsh data connection; event loop writes straight into our framer's preallocated buffer
+    (the asyncio flavor of recv_into) and we hand each complete message to the engine for decode and dispatch"""
+
+    def __init__(self, engine, tsh):
+        self.engine = engine
+        self.tsh = tsh
+        self.framer = TshesStreamFramer(logger=engine.logger)
+        self.closed = asyncio.get_running_loop().create_future()
+
+    def get_buffer(self, sizehint):
+        return self.framer.free_space()
+
+    def buffer_updated(self, nbytes):
+        self.framer.advance(nbytes)
+        msg = self.framer.next_message()
+        while msg is not None:
+            self.engine.dispatch(self.tsh, msg)
+            msg = self.framer.next_message()
+
+    def connection_lost(self, exc):
+        if not self.closed.done():
+            self.closed.set_result(exc)
+
+
+class TshIngestEngine(object):
+    """A class to ingest data from several tsh units at once, all on one asyncio event loop (one thread, one core):
+    one stream reader (connection) per Tsh, with decode and dispatch shared by all of them.  Each sensor gets its own
+    circular TshAccelBuffer in rings (keyed by tsh name) and every subscriber callable gets called with (tsh, pkt) for
+    each decoded TshesAccelPacket from any sensor.  Dropped connections get logged and reconnected until stopped;
+    stop also cancels connection attempts still pending (each one gives up after connect_sec anyway) and any pause
+    before reconnect, so run returns right away."""
+
+    def __init__(self, tshs, port=DEFAULT_PORT, ring_sec=TSH_RING_SEC, reconnect_sec=2, connect_sec=5,
+                 logger=module_logger):
+        self.tshs = list(tshs)
+        self.port = port
+        self.reconnect_sec = reconnect_sec  # pause before trying to reconnect after connection trouble
+        self.connect_sec = connect_sec      # give up on a connection attempt after this long (and try again)
+        self.logger = logger
+        self.rings = dict([(tsh.name, TshAccelBuffer(tsh, ring_sec, logger=logger, circular=True))
+                           for tsh in self.tshs])
+        self.num_packets = dict([(tsh.name, 0) for tsh in self.tshs])  # running total of packets per sensor
+        self.recorders = {}  # TshesRecorder (if recording raw messages to capture file) keyed by tsh name
+        self._subscribers = []
+        self._transports = {}
+        self._tasks = []  # one _read_sensor task per tsh while running
+        self._loop = None
+        self._stopping = False
+
+    def __str__(self):
+        s = '%s: ' % self.__class__.__name__
+        s += ', '.join(['%s = %d packets' % (name, num) for name, num in self.num_packets.items()])
+        return s
+
+    def subscribe(self, func):
+        """add func to be called with (tsh, pkt) for each decoded TshesAccelPacket; it runs on event loop thread and
+        packet's data only stays valid during that call, so func should be quick and copy what it keeps"""
+        self._subscribers = self._subscribers + [func]
+
+    def unsubscribe(self, func):
+        """stop calling func with decoded packets"""
+        self._subscribers = [f for f in self._subscribers if f != func]
+
+    def dispatch(self, tsh, data):
+        """decode one whole tshes message, data, from tsh and pass it along to ring and subscribers"""
+        recorder = self.recorders.get(tsh.name)
+        if recorder is not None:
+            recorder.record(data)
+        if TshesMessage(data).selector() not in ACCEL_SELECTORS or len(data) < ACCEL_PREFIX_END:
+            return
+        try:
+            pkt = TshesAccelPacket(data)
+        except ValueError as e:
+            self.logger.warning('Tshes message of %d bytes from %s cannot be decoded (%s), skip it.' %
+                                (len(data), tsh.name, e))
+            return
+        if not pkt.is_complete():
+            self.logger.warning('Tshes message of %d bytes from %s is too short to hold %d samples, skip it.' %
+                                (len(data), tsh.name, pkt.num_samples))
+            return
+        self.num_packets[tsh.name] += 1
+        self.rings[tsh.name].add_packet(pkt)
+        for func in self._subscribers:
+            try:
+                func(tsh, pkt)
+            except Exception:
+                # one bad subscriber should not take down ingest for everybody else
+                self.logger.exception('Ingest subscriber %s failed.' % func)
+
+    async def _read_sensor(self, tsh):
+        """keep a connection to tsh's data port streaming into a TshesIngestProtocol until stopped"""
+        while not self._stopping:
+            try:
+                transport, protocol = await asyncio.wait_for(self._loop.create_connection(
+                    lambda: TshesIngestProtocol(self, tsh), tsh.ip, self.port), timeout=self.connect_sec)
+            except (OSError, asyncio.TimeoutError) as e:
+                self.logger.warning('Ingest connection trouble with %s: %s' % (tsh.name, str(e) or 'timed out'))
+            else:
+                self._transports[tsh.name] = transport
+                self.logger.info('Ingest connected to %s at %s:%d.' % (tsh.name, tsh.ip, self.port))
+                exc = await protocol.closed
+                self._transports.pop(tsh.name, None)
+                if not self._stopping:
+                    self.logger.warning('Ingest connection to %s closed: %s' % (tsh.name, exc))
+            if not self._stopping:
+                await asyncio.sleep(self.reconnect_sec)
+
+    async def run(self):
+        """run one stream reader per sensor until stop is called"""
+        self._loop = asyncio.get_running_loop()
+        self._stopping = False
+        self.logger.info('Starting %s for %s.' % (self.__class__.__name__, ', '.join([t.name for t in self.tshs])))
+        self._tasks = [self._loop.create_task(self._read_sensor(tsh)) for tsh in self.tshs]
+        try:
+            results = await asyncio.gather(*self._tasks, return_exceptions=True)
+        finally:
+            self._tasks = []
+            self._transports.clear()
+        for result in results:
+            if isinstance(result, Exception) and not isinstance(result, asyncio.CancelledError):
+                raise result
+        self.logger.info('Stopped %s.' % self)
+
+    def _close_all(self):
+        self._stopping = True
+        for transport in list(self._transports.values()):
+            transport.close()
+        for task in self._tasks:
+            task.cancel()  # e.g. connect still pending to a tsh that is not answering, or sleep before reconnect
+
+    def stop(self):
+        """stop ingest and close all connections; safe to call from any thread"""
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._close_all)
+
+
+def demo_ingest(names=('es13', 'es14', 'es19'), rate=1000.0, gain=0, sec=10):
+    """ingest from several sensors at once for sec seconds and show how many packets we got from each"""
+
+    tshs = [Tsh(name, rate, gain) for name in names]
+    engine = TshIngestEngine(tshs)
+
+    async def run_for_a_while():
+        asyncio.get_running_loop().call_later(sec, engine.stop)
+        await engine.run()
+
+    asyncio.run(run_for_a_while())
+    print(engine)
+
+
+if __name__ == '__main__':
+    demo_ingest()
@@ -46,10 +46,12 @@ class RealtimePlot(object):
         # self.axes.fmt_xdata = mdates.DateFormatter('%M:%s')
         self.fig.autofmt_xdate()
 
-    def get_relative_times(self, y):
-        # helper = np.vectorize(lambda x: x.total_seconds())
-        # return helper(t - t[0])
-        return np.arange(len(y)) / self.fs
+    def get_relative_times(self, t):
+        """return seconds relative to 1st of t (unix times as floats or datetimes), so any gaps in data stay gaps"""
+        t = np.array(t)
+        if t.dtype == object:
+            return np.array([dt.total_seconds() for dt in t - t[0]])  # datetime objects
+        return t - t[0]
 
     def add(self, xvals, yvals):
         self.axis_x.extend(xvals)
@@ -72,7 +74,7 @@ class RealtimePlot(object):
 
         # make x-values relative as needed
         if self.relative:
-            x_values = self.get_relative_times(y_values)
+            x_values = self.get_relative_times(self.axis_x)
         else:
             x_values = np.array(self.axis_x)
 
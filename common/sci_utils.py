@@ -34,6 +34,93 @@ def is_outlier(points, thresh=3.5):
     return modified_z_score > thresh
 
 
+class RunningStats(object):
+    """Streaming mean and variance (per column) that get updated one chunk of rows at a time as data arrives, without
+    keeping the data around.  Each chunk's own mean and sum of squared deviations get merged in with the running ones
+    (Chan et al. pairwise form of Welford's algorithm), so updates are vectorized and numerically stable.  We also keep
+    a running sum of lag-1 products (rows shifted by the first row, carried across chunk boundaries) for the lag-1
+    autocorrelation, since samples of a lowpass filtered sensor are far from independent."""
+
+    def __init__(self, ncols=3):
+        self.count = 0
+        self.mean = np.zeros(ncols)
+        self._m2 = np.zeros(ncols)     # running sum of squared deviations from mean
+        self._shift = None             # first row, subtracted before lag-1 products to keep them small
+        self._first = np.zeros(ncols)  # first and last rows (less shift)...
+        self._last = np.zeros(ncols)
+        self._lag1 = np.zeros(ncols)   # ...and running sum of products of consecutive rows (less shift)
+
+    def __str__(self):
+        s = '%s: ' % self.__class__.__name__
+        s += 'count = %d, ' % self.count
+        s += 'mean = %s, ' % np.array2string(self.mean, precision=3)
+        s += 'sem = %s' % np.array2string(self.sem, precision=3)
+        return s
+
+    def update(self, chunk):
+        """merge rows of chunk (NxM array) into running stats"""
+        num = chunk.shape[0]
+        if num == 0:
+            return
+        if self._shift is None:
+            self._shift = np.array(chunk[0], dtype=np.float64)
+        shifted = chunk - self._shift
+        self._lag1 = self._lag1 + (shifted[1:] * shifted[:-1]).sum(axis=0)
+        if self.count:
+            self._lag1 = self._lag1 + self._last * shifted[0]
+        else:
+            self._first = shifted[0]
+        self._last = shifted[-1]
+        chunk_mean = chunk.mean(axis=0)
+        chunk_m2 = ((chunk - chunk_mean) ** 2).sum(axis=0)
+        total = self.count + num
+        delta = chunk_mean - self.mean
+        self.mean = self.mean + delta * num / total
+        self._m2 = self._m2 + chunk_m2 + delta ** 2 * self.count * num / total
+        self.count = total
+
+    @property
+    def var(self):
+        """sample variance (NaN until we have at least 2 rows)"""
+        if self.count < 2:
+            return np.full(self.mean.shape, np.nan)
+        return self._m2 / (self.count - 1)
+
+    @property
+    def std(self):
+        """sample standard deviation"""
+        return np.sqrt(self.var)
+
+    @property
+    def sem(self):
+        """standard error of the mean (for independent samples)"""
+        return self.std / np.sqrt(max(self.count, 1))
+
+    @property
+    def autocorr(self):
+        """lag-1 autocorrelation (NaN until we have at least 2 rows)"""
+        if self.count < 2:
+            return np.full(self.mean.shape, np.nan)
+        mean = self.mean - self._shift
+        autocov = self._lag1 - mean * (2 * self.count * mean - self._first - self._last) + (self.count - 1) * mean ** 2
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return np.where(self._m2 > 0, autocov / self._m2, 0.0)
+
+    @property
+    def median_sem(self):
+        """standard error of the median, which for (near) gaussian noise is sqrt(pi/2) times that of the mean; that
+        gets inflated by sqrt((1 + r1) / (1 - r1)) for lag-1 autocorrelation r1 (effective sample size of an AR(1)
+        series, only ever inflated, and infinite as r1 goes to 1)"""
+        r1 = np.clip(self.autocorr, 0.0, 1.0)
+        with np.errstate(divide='ignore'):
+            inflation = np.sqrt((1 + r1) / (1 - r1))
+        return np.sqrt(np.pi / 2) * self.sem * inflation
+
+    def is_converged(self, tol, min_count=2):
+        """return True if we have at least min_count rows and standard error of median is within tol in every column"""
+        return self.count >= max(min_count, 2) and bool(np.all(self.median_sem <= tol))
+
+
 def demo_masked_deque():
 
     vals = deque(maxlen=100)
@@ -0,0 +1,232 @@
+#!/usr/bin/env python3
+
+import re
+import queue
+import logging
+import threading
+from time import sleep, perf_counter
+import MySQLdb as sql
+from MySQLdb.cursors import SSCursor
+
+from tshcal.secret import SDB, SUSER, SPASSWD
+
+
+# create logger
+module_logger = logging.getLogger('tshcal')
+
+_IDENTIFIER = re.compile(r'^\w+$')
+
+# MySQL client error codes for a lost or refused connection (cannot connect via socket, cannot connect to server, server
+# has gone away, lost connection during query); any other OperationalError (bad column, access denied, lock wait
+# timeout and so on) is about the query or the account, so reconnecting would not help
+CONNECTION_ERRORS = (2002, 2003, 2006, 2013)
+
+
+def sql_identifier(name):
+    """return name (e.g. table) if it is safe to put in SQL text as an identifier, else raise ValueError; identifiers
+    cannot be query parameters, so this is the guard for the few we have to format into queries"""
+    if not _IDENTIFIER.match(name):
+        raise ValueError('not a valid SQL identifier: %r' % name)
+    return name
+
+
+class SqlPool(object):
+    """A class for a small pool of persistent MySQL connections to one database, so a caller that queries in a tight
+    loop (e.g. live plot) does not pay for a TCP connect and auth handshake each time.
+
+    Queries take parameters (MySQLdb %s placeholders) instead of having values formatted into SQL text.  When a query
+    fails because of the connection (server went away, say; see CONNECTION_ERRORS), that connection gets dropped and we
+    reconnect and retry, backing off exponentially from backoff_sec up to max_backoff_sec between tries, at most
+    max_retries times; any other error gets raised right away.  We keep counts and timing of queries for a look at db
+    latency."""
+
+    def __init__(self, host='localhost', user=SUSER, passwd=SPASSWD, db=SDB, size=2, max_retries=5, backoff_sec=0.5,
+                 max_backoff_sec=30.0, logger=module_logger):
+        self.host = host
+        self.user = user
+        self.passwd = passwd
+        self.db = db
+        self.size = size                        # most idle connections we hold on to
+        self.max_retries = max_retries
+        self.backoff_sec = backoff_sec
+        self.max_backoff_sec = max_backoff_sec
+        self.logger = logger
+        self.num_queries = 0                    # running totals for successful queries...
+        self.total_sec = 0.0                    # ...and their time (sec)
+        self.max_sec = 0.0                      # slowest query (sec)
+        self.num_errors = 0                     # connection errors (each one leads to reconnect or giving up)
+        self.num_connects = 0
+        self._idle = []
+        self._lock = threading.Lock()
+
+    def __str__(self):
+        s = '%s: ' % self.__class__.__name__
+        s += '%s@%s/%s, ' % (self.user, self.host, self.db)
+        s += 'queries = %d, ' % self.num_queries
+        s += 'mean = %.1f ms, ' % (1000 * self.mean_sec)
+        s += 'max = %.1f ms, ' % (1000 * self.max_sec)
+        s += 'errors = %d, ' % self.num_errors
+        s += 'connects = %d' % self.num_connects
+        return s
+
+    @property
+    def mean_sec(self):
+        """mean time (sec) of successful queries"""
+        return self.total_sec / self.num_queries if self.num_queries else 0.0
+
+    def _connect(self):
+        con = sql.Connection(host=self.host, user=self.user, passwd=self.passwd, db=self.db)
+        con.autocommit(True)  # else a long-lived connection keeps reading from the same (stale) snapshot
+        with self._lock:
+            self.num_connects += 1
+        return con
+
+    def _checkout(self):
+        with self._lock:
+            if self._idle:
+                return self._idle.pop()
+        return self._connect()
+
+    def _checkin(self, con):
+        with self._lock:
+            if len(self._idle) < self.size:
+                self._idle.append(con)
+                return
+        con.close()
+
+    def query(self, command, params=None):
+        """run command (with params for its %s placeholders, if any) and return all results"""
+        attempt = 0
+        while True:
+            con = None
+            try:
+                con = self._checkout()
+                tzero = perf_counter()
+                cursor = con.cursor()
+                try:
+                    cursor.execute(command, params)
+                    results = cursor.fetchall()
+                finally:
+                    cursor.close()
+                elapsed = perf_counter() - tzero
+            except (sql.OperationalError, sql.InterfaceError) as e:
+                code = e.args[0] if e.args else None
+                if isinstance(e, sql.OperationalError) and code not in CONNECTION_ERRORS:
+                    if con is not None:
+                        self._checkin(con)  # connection is fine, it is the query (or account) that is not
+                    raise
+                with self._lock:
+                    self.num_errors += 1
+                if con is not None:
+                    try:
+                        con.close()
+                    except sql.MySQLError:
+                        pass
+                if attempt >= self.max_retries:
+                    self.logger.error('MySQL query failed after %d retries: %s' % (attempt, e))
+                    raise
+                wait = min(self.backoff_sec * 2 ** attempt, self.max_backoff_sec)
+                self.logger.warning('MySQL query failed (%s), will try again in %.1f seconds.' % (e, wait))
+                sleep(wait)
+                attempt += 1
+                continue
+            self._checkin(con)
+            with self._lock:
+                self.num_queries += 1
+                self.total_sec += elapsed
+                self.max_sec = max(self.max_sec, elapsed)
+            return results
+
+    def stream(self, command, params=None, chunk_rows=1000):
+        """generator that yields lists of up to chunk_rows result rows from command, read with a server-side
+        (unbuffered) cursor, so results never have to fit in memory all at once; the connection is tied up until the
+        stream is used up (if it gets abandoned early, the connection gets closed rather than drained).  No retries
+        here, since we cannot know where to pick up a stream that broke off."""
+        con = self._checkout()
+        done = False
+        try:
+            tzero = perf_counter()
+            cursor = con.cursor(SSCursor)
+            cursor.execute(command, params)
+            elapsed = perf_counter() - tzero
+            with self._lock:
+                self.num_queries += 1
+                self.total_sec += elapsed
+                self.max_sec = max(self.max_sec, elapsed)
+            while True:
+                rows = cursor.fetchmany(chunk_rows)
+                if not rows:
+                    break
+                yield rows
+            cursor.close()
+            done = True
+        finally:
+            if done:
+                self._checkin(con)
+            else:
+                con.close()
+
+    def close(self):
+        """close idle connections (ones in use get closed when they come back, if pool is full)"""
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for con in idle:
+            con.close()
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(host='localhost', user=SUSER, passwd=SPASSWD, db=SDB):
+    """return the shared SqlPool for host, user and db, creating it on first use"""
+    key = (host, user, passwd, db)
+    with _pools_lock:
+        if key not in _pools:
+            _pools[key] = SqlPool(host, user, passwd, db)
+        return _pools[key]
+
+
+def prefetch(iterable, depth=2):
+    """generator that yields items of iterable, while a background thread works up to depth items ahead (e.g. reads
+    next chunk of rows off the network while this one gets decoded); exceptions come through to the consumer"""
+    q = queue.Queue(maxsize=depth)
+    stop = threading.Event()
+    end = object()
+
+    def put(item):
+        while not stop.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def produce():
+        try:
+            for item in iterable:
+                if not put((item, None)):
+                    break
+        except Exception as e:
+            put((end, e))
+            return
+        finally:
+            close = getattr(iterable, 'close', None)
+            if close is not None:
+                close()
+        put((end, None))
+
+    thread = threading.Thread(target=produce, name='prefetch', daemon=True)
+    thread.start()
+    try:
+        while True:
+            item, error = q.get()
+            if error is not None:
+                raise error
+            if item is end:
+                break
+            yield item
+    finally:
+        stop.set()
+        thread.join()
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+
+import struct
+import numpy as np
+
+from tshcal.constants_tsh import TSH_RATES, TSH_GAINS, TSH_UNITS
+
+# TshesAccelPacket starts at byte 44 of a tshes message; its "Prefix" (tshes_id, counter, timestamp, packet_status and
+# num_samples) runs thru byte 79, then the "Data" payload of AccelSample structs starts at byte 80
+ACCEL_PREFIX_END = 80  # byte offset in tshes message where accel samples start
+SAMPLE_BYTES = 16      # 1 sample = 16 bytes (x, y, z, dio)
+ACCEL_SELECTORS = (170, 171)  # selector values for TshesAccelPacket; either real-time or replay
+
+# one AccelSample in network byte order (big-endian): float32 x, y, z accel values, then uint32 digital io status
+SAMPLE_DTYPE = np.dtype([('x', '>f4'), ('y', '>f4'), ('z', '>f4'), ('dio', '>u4')])
+
+
+def sample_records(data, num_samples, offset=ACCEL_PREFIX_END):
+    """return structured array view (no copy) of num_samples AccelSample records found in data starting at offset
+
+    :param data: bytes-like object (bytes, bytearray or memoryview) with tshes message or just the samples payload
+    :param num_samples: integer number of samples to decode (e.g. num_samples from TshesAccelPacket's "Prefix")
+    :param offset: integer byte offset in data where samples start (default is 80 for a full tshes message)
+    :return: read-only structured array with fields x, y, z and dio
+    """
+    return np.frombuffer(data, dtype=SAMPLE_DTYPE, count=num_samples, offset=offset)
+
+
+def decode_xyz(data, num_samples, offset=ACCEL_PREFIX_END):
+    """return Nx3 array view (no copy) of x, y, z values for num_samples found in data starting at offset; this is
+    suitable to feed directly to TshAccelBuffer.add (which does the one and only copy into its float64 array)
+
+    :param data: bytes-like object (bytes, bytearray or memoryview) with tshes message or just the samples payload
+    :param num_samples: integer number of samples to decode (e.g. num_samples from TshesAccelPacket's "Prefix")
+    :param offset: integer byte offset in data where samples start (default is 80 for a full tshes message)
+    :return: Nx3 array of big-endian float32 values, with 3 columns for x, y and z
+    """
+    # reinterpret each 16-byte record as 4 big-endian float32 values and drop the 4th column (dio bits)
+    return sample_records(data, num_samples, offset=offset).view('>f4').reshape(num_samples, 4)[:, :3]
+
+
+class TshesAccelPacket(object):
+    """A class to decode TshesAccelPacket, which starts at byte 44 of a (whole) tshes message, like the ones handed
+    out by TshesStreamFramer.  The 36-byte "Prefix" gets decoded up front with one precompiled struct; samples only
+    get decoded when asked for (and then in one vectorized step).  Raises ValueError if packet status has rate, gain
+    or unit bits we do not know or num_samples is negative (e.g. corrupt message), so stream readers can skip just
+    that message."""
+
+    # tshes_id, counter, timestamp (sec & usec), packet_status and num_samples; all in network byte order
+    prefix_struct = struct.Struct('!16sIIIii')
+
+    def __init__(self, data):
+        self.data = data  # bytes-like object with whole tshes message (careful, framer's memoryview gets reused)
+        tshes_id, self.counter, sec, usec, self.packet_status, self.num_samples = \
+            self.prefix_struct.unpack_from(data, 44)
+        tshes_id = tshes_id.replace(b'-', b'').replace(b'\0', b'')  # delete dashes and nulls
+        self.tshes_id = tshes_id[-4:].decode('utf-8')               # keep last 4 characters only, i.e., "es13"
+        self.timestamp = sec + usec / 1000000.0
+        if self.num_samples < 0:
+            raise ValueError('bogus num_samples %d' % self.num_samples)
+
+        # get rate and cutoff_freq from packet status
+        rate_bits = (self.packet_status & 0x0f00) >> 8
+        if rate_bits >= len(TSH_RATES):
+            raise ValueError('bogus rate bits %d in packet status 0x%04x' % (rate_bits, self.packet_status))
+        self.rate, self.cutoff_freq = TSH_RATES[rate_bits]
+
+        # get gain and input from packet status
+        gain_bits = self.packet_status & 0x001f
+        if gain_bits not in TSH_GAINS:
+            raise ValueError('bogus gain bits %d in packet status 0x%04x' % (gain_bits, self.packet_status))
+        self.gain, self.input = TSH_GAINS[gain_bits]
+
+        # get unit from packet status
+        unit_bits = (self.packet_status & 0x0060) >> 5
+        if unit_bits >= len(TSH_UNITS):
+            raise ValueError('bogus unit bits %d in packet status 0x%04x' % (unit_bits, self.packet_status))
+        self.unit = TSH_UNITS[unit_bits]
+
+        # get adjustment from packet status
+        adj_bits = (self.packet_status & 0x0080) >> 7
+        self.adjustment = 'temperature-compensation' if adj_bits == 1 else 'no-compensation'
+
+    def __str__(self):
+        s = '%s: ' % self.__class__.__name__
+        s += '%s, ' % self.tshes_id
+        s += 'counter = %d, ' % self.counter
+        s += 'time = %.4f, ' % self.timestamp
+        s += 'samples = %d, ' % self.num_samples
+        s += 'rate = %.4f sa/sec' % self.rate
+        return s
+
+    def end_time(self):
+        """compute end time from start, number of samples and rate"""
+        return self.timestamp + (self.num_samples - 1) / self.rate
+
+    def is_complete(self):
+        """return True if data holds all num_samples promised in "Prefix" (1 sample = 16 bytes)"""
+        return len(self.data) >= ACCEL_PREFIX_END + SAMPLE_BYTES * self.num_samples
+
+    def xyz(self):
+        """return Nx3 array view (no copy) of this packet's x, y, z values"""
+        return decode_xyz(self.data, self.num_samples)
+
+    def t(self):
+        """return array of float64 unix times for this packet's samples, computed from timestamp and rate in one shot"""
+        return self.timestamp + np.arange(self.num_samples) / self.rate
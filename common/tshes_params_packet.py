@@ -1,6 +1,10 @@
 import struct
 import socket
 
+TSHES_SYNC = b'\xac\xd3'  # two sync bytes at start of every tshes message
+TSHES_HEADER_SIZE = 44    # sync, msg_size, seq_num, chk_sum, source, destination, selector & data_size (in bytes)
+
+
 class TshesParamsPacket(object):
     """A class used in TSH-ES command messages to send values and password info to the TSH-ES.
     Note that since byte ordering might not be same on sending and receiving machines, the user should be sure to
@@ -41,7 +45,19 @@ class TshesMessage(object):
     """A class to handle tshes message packets."""
 
     def __init__(self, p):
-        self.p = p
+        self.p = p  # bytes-like object (bytes, bytearray or memoryview) that starts with tshes message header
+
+    def has_sync(self):
+        """return True if message starts with the two tshes sync bytes (0xac, 0xd3)"""
+        return self.p[0] == TSHES_SYNC[0] and self.p[1] == TSHES_SYNC[1]
+
+    def msg_size(self):
+        """return total number of bytes in message (includes sync bytes and msg_size)"""
+        return self.p[2] * 256 + self.p[3]
+
+    def selector(self):
+        """return selector value, which tells what kind of data follows header (e.g. 170 for TshesAccelPacket)"""
+        return self.p[40] * 256 + self.p[41]
 
     def enum_bytes(self):
         for idx, b in enumerate(self.p):
@@ -73,12 +89,12 @@ class TshesMessage(object):
         chk_sum = ord(byte6) * 256 + ord(byte7)
 
         # source identifier
-        src = self.p[8:24]
+        src = bytes(self.p[8:24])
         src = src.replace(b'-', b'').replace(b'\0', b'')  # delete dashes and nulls
         # src = src[-4:]  # keep last 4 characters only, i.e., "es13"
 
         # destination identifier
-        dst = self.p[24:40]
+        dst = bytes(self.p[24:40])
         dst = dst.replace(b'-', b'').replace(b'\0', b'')  # delete dashes and nulls
 
         # get selector value
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+
+import logging
+
+from tshcal.common.tshes_params_packet import TshesMessage, TSHES_SYNC, TSHES_HEADER_SIZE
+
+
+# create logger
+module_logger = logging.getLogger('tshcal')
+
+TSHES_MAX_MSG_SIZE = 65535  # msg_size is a 2-byte field, so no tshes message can be bigger than this
+
+
+class TshesStreamFramer(object):
+    """A class to reassemble whole tshes messages from the byte stream we get on a (tcp) socket.
+
+    The tsh data port is a stream, so one recv can hold several messages, a message can be split across recvs and
+    a recv need not start on a message boundary.  We recv_into one preallocated bytearray and use the msg_size field
+    in each message header to cut complete messages out of it (as memoryviews, no copies).  If the stream ever gets
+    out of step, we hunt forward for the sync bytes and count the bytes we skipped to get back in step.  Since a
+    capture file holds the same back-to-back messages, sock can also be a binary file object (we use its readinto).
+
+    With no sock, somebody else fills the buffer: write into free_space(), call advance(num), then call next_message()
+    until it returns None (that is how asyncio's BufferedProtocol drives it)."""
+
+    def __init__(self, sock=None, bufsize=2 * (TSHES_MAX_MSG_SIZE + 1), logger=module_logger):
+        if bufsize <= TSHES_MAX_MSG_SIZE:
+            raise ValueError('bufsize = %d is too small to hold biggest possible tshes message' % bufsize)
+        self.sock = sock
+        self._recv_into = None if sock is None else getattr(sock, 'recv_into', None) or sock.readinto
+        self.logger = logger
+        self._buf = bytearray(bufsize)
+        self._view = memoryview(self._buf)
+        self._start = 0             # index of first byte not yet handed out as (part of) a message
+        self._end = 0               # index one past last byte received
+        self.bytes_received = 0     # running total of bytes received on socket
+        self.bytes_skipped = 0      # running total of bytes thrown away while hunting for sync
+        self.num_messages = 0       # running total of complete messages handed out
+
+    def __str__(self):
+        s = '%s: ' % self.__class__.__name__
+        s += 'messages = %d, ' % self.num_messages
+        s += 'bytes received = %d, ' % self.bytes_received
+        s += 'bytes skipped = %d' % self.bytes_skipped
+        return s
+
+    def _skip_to_sync(self):
+        """advance start index to next sync bytes (not counting the ones at start index, if any)"""
+        idx = self._buf.find(TSHES_SYNC, self._start + 1, self._end)
+        if idx < 0:
+            idx = self._end - 1  # keep last byte, it could be 1st of 2 sync bytes split across recvs
+        self.logger.warning('Skipped %d bytes hunting for tshes sync bytes.' % (idx - self._start))
+        self.bytes_skipped += idx - self._start
+        self._start = idx
+
+    def next_message(self):
+        """return memoryview of next complete message already in buffer or None if we need to recv more bytes"""
+        while self._end - self._start >= TSHES_HEADER_SIZE:
+            tm = TshesMessage(self._view[self._start:self._end])
+            if not tm.has_sync():
+                self._skip_to_sync()
+                continue
+            msg_size = tm.msg_size()
+            if msg_size < TSHES_HEADER_SIZE:
+                self._skip_to_sync()  # bogus msg_size means these were not really sync bytes
+                continue
+            if self._end - self._start < msg_size:
+                return None  # rest of this message has not arrived yet
+            msg = self._view[self._start:self._start + msg_size]
+            self._start += msg_size
+            self.num_messages += 1
+            return msg
+        return None
+
+    def free_space(self):
+        """return memoryview of free space at end of buffer to write (e.g. recv_into) more bytes, moving partial
+        message to front of buffer first as needed so there is always room to finish it"""
+        if self._start == self._end:
+            # nothing pending, so start over at front of buffer (no bytes to move)
+            self._start = self._end = 0
+        elif len(self._buf) - self._end <= TSHES_MAX_MSG_SIZE:
+            pending = self._end - self._start
+            self._view[:pending] = self._view[self._start:self._end]
+            self._start, self._end = 0, pending
+        return self._view[self._end:]
+
+    def advance(self, num):
+        """account for num bytes just written into free space"""
+        self._end += num
+        self.bytes_received += num
+
+    def fill(self):
+        """recv_into free space at end of buffer and return number of bytes received (zero means EOF)"""
+        num = self._recv_into(self.free_space())
+        self.advance(num)
+        return num
+
+    def messages(self):
+        """generator that yields memoryview of each complete tshes message in the order received; stops at EOF
+
+        NOTE: each memoryview points into our (reused) buffer, so it is only valid until the next one is requested;
+        decode it (or copy it) before asking for another
+        """
+        while True:
+            msg = self.next_message()
+            if msg is not None:
+                yield msg
+            elif not self.fill():
+                if self._end > self._start:
+                    self.logger.warning('Stream closed with %d bytes of partial tshes message left over.' %
+                                        (self._end - self._start))
+                return
@@ -16,7 +16,10 @@ DEFAULT_UNITS = 'counts'  # {counts|volts|ug}
 TSH_AX = {'x': 0, 'y': 1, 'z': 2}  # map axis letter to index for TSH axes
 TSH_SETTLE_SEC = 3        # amount of time allocated for accelerometer to "settle" after a move & before reading
 TSH_BUFFER_SEC = 20       # amount of time to take median (for example) with calibration find min/max
+TSH_MIN_BUFFER_SEC = 2    # least amount of time before TSH_BUFFER_SEC buffer can stop early on TSH_COUNTS_TOL
+TSH_COUNTS_TOL = 0.5      # stop early once standard error of median counts is this small (None for fixed duration)
 AXES_FILE_SEC = 60        # amount of time to gather data and write to CSV output file when cal is done for a given axis
+TSH_RING_SEC = 120        # amount of time kept in ring buffer of background acquisition (must cover buffers above)
 
 # ---------------------------------------------------------------------------------------------------------------------
 # --- TIME DEFAULTS ---------------------------------------------------------------------------------------------------
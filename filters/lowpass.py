@@ -9,7 +9,9 @@ import scipy.signal
 import matplotlib.pyplot as plt
 
 from tshcal.filters.pylive import live_plot_xy
-from tshcal.common.accel_packet import guess_packet, sql_connect
+from tshcal.common.accel_packet import guess_packet, decode_packets, decode_packets_parallel, sql_connect
+from tshcal.common.accel_packet import DecodedPacketCache
+from tshcal.common.sql_utils import sql_identifier
 from tshcal.common.time_utils import unix_to_human_time
 
 
@@ -140,34 +142,25 @@ def demo_lowpass():
     plt.show()
 
 
-def get_accel_from_db(table, ax, num_pkts):
-    """get ax'th column from num_pkts from db table"""
+def get_accel_from_db(table, ax, num_pkts, cache=None, parallel=False, workers=None):
+    """get ax'th column from num_pkts from db table, decoding only packets not already in cache (if given) or, with
+    parallel, decoding on a pool of worker processes (workers of them, None for one per core); not both"""
+    if cache is not None and parallel:
+        raise ValueError('cache and parallel decode do not mix, use one or the other')
     
-    results = sql_connect('select * from %s order by time desc limit %d' % (table, num_pkts), 'localhost')
+    results = sql_connect('select * from %s order by time desc limit %%s' % sql_identifier(table), 'localhost',
+                          params=(num_pkts,))
     
-    # initialize list array to be returned in flattened form
-    x = []
-    
-    # special handling of first packet to get start time
-    # NOTE: we used "desc" in query so gotta index from the "end"
-    i1 = results[-1]
-    p1 = guess_packet(i1[1])
-    start_time = p1.time()
-    #print UnixToHumanTime(start_time)
-    
-    # append first packet's worth to output
-    x.append( [ a[ax] for a in p1.txyz() ] )
+    # NOTE: we used "desc" in query so gotta go backwards here; i[0] is time, i[1] is the blob, i[2] is the type
+    if cache is not None:
+        xyz, start_times = cache.decode(table, results[::-1])
+    elif parallel:
+        xyz, offsets, start_times = decode_packets_parallel([ i[1] for i in results[::-1] ], workers=workers)
+    else:
+        xyz, offsets, start_times = decode_packets([ i[1] for i in results[::-1] ])
     
-    # NOTE: we used "desc" in query so gotta loop backwards here
-    # now iterate over remaining packets to build output
-    for i in results[-2::-1]:  # i[0] is time, i[1] is the blob, i[2] is the type
-        p = guess_packet(i[1])
-        #start_time2 = p.time()
-        #print UnixToHumanTime(start_time2)
-        x.append( [ a[ax] for a in p.txyz() ] )
-        
-    # returned flattened array version of x and the start_time for this chunk
-    return [ item for sublist in x for item in sublist ], start_time
+    # return ax'th column (x=1, y=2, z=3) and the start_time for this chunk
+    return xyz[:, ax - 1], start_times[0]
 
 
 def display_accel(table, k=0, sleep_sec=1):
@@ -176,7 +169,7 @@ def display_accel(table, k=0, sleep_sec=1):
     stdout.write(bytes(title))
     stdout.flush()
     while 1:
-        results = sql_connect('select * from %s order by time desc limit 1' % table, 'localhost')
+        results = sql_connect('select * from %s order by time desc limit 1' % sql_identifier(table), 'localhost')
         os.system('clear')
         os.system('date')
     
@@ -212,12 +205,15 @@ def OLDrun(table, fs, fc, ax, num_pkts, xlabel, ylabel, pause_sec):
     norder = 4  # order of LPF
     b, a = get_butter_digital(fs, fc, norder=norder)
 
+    # cache decoded packets, so each pass through loop only decodes the packets that are new since the last one
+    cache = DecodedPacketCache()
+
     # endless plot loop
     line1 = []
     while True:
         
         # get latest set of data from db table (just ax axis)
-        data, start_time = get_accel_from_db(table, ax, num_pkts)
+        data, start_time = get_accel_from_db(table, ax, num_pkts, cache=cache)
         xn = np.array(data)
         
         # generate time vector sequence (FIXME assuming no gaps)
@@ -246,11 +242,14 @@ def run(table, fs, fc, ax, num_pkts, xlabel, ylabel, pause_sec):
     # create 4th order low-pass butterworth filter
     blowpass_filt = ButterworthLowpassFilt(fs, fc, norder=4, has_nan=True)
 
+    # cache decoded packets, so each pass through loop only decodes the packets that are new since the last one
+    cache = DecodedPacketCache()
+
     # endless plot loop
     line1 = []
     while True:
         # get latest set of data from db table (just ax axis)
-        data, start_time = get_accel_from_db(table, ax, num_pkts)
+        data, start_time = get_accel_from_db(table, ax, num_pkts, cache=cache)
         xn = np.array(data)
 
         # generate time vector sequence (FIXME assuming no gaps)
@@ -9,7 +9,9 @@ import scipy.signal
 import matplotlib.pyplot as plt
 
 from tshcal.filters.pylive import live_plot_xy
-from tshcal.common.accel_packet import guess_packet, sql_connect
+from tshcal.common.accel_packet import guess_packet, decode_packets, decode_packets_parallel, sql_connect
+from tshcal.common.accel_packet import DecodedPacketCache
+from tshcal.common.sql_utils import sql_identifier
 from tshcal.common.time_utils import unix_to_human_time
 
 
@@ -71,6 +73,22 @@ def lowpass_filtfilt(t, xn, fs, fc, b, a):
     return y
 
 
+def lowpass_chunks(chunks, fs, fc, ax, norder=4):
+    """generator that yields (start_times, y) for each decoded chunk (e.g. from iter_accel_chunks), where y is lowpass
+    filtered ax'th column; filter state carries from chunk to chunk, so this is one continuous (causal) filter over
+    the whole span without ever holding it all in memory, unlike filtfilt"""
+    b, a = get_butter_digital(fs, fc, norder=norder)
+    zi = None
+    for xyz, offsets, start_times in chunks:
+        x = xyz[:, ax - 1]
+        if len(x) == 0:
+            continue
+        if zi is None:
+            zi = scipy.signal.lfilter_zi(b, a) * x[0]  # start in steady state at first value
+        y, zi = scipy.signal.lfilter(b, a, x, zi=zi)
+        yield start_times, y
+
+
 def demo_lowpass():
     """demo filtfilt (like MATLAB) scheme for lowpass filtering"""
     
@@ -101,34 +119,93 @@ def demo_lowpass():
     plt.show()
 
 
-def get_accel_from_db(table, ax, num_pkts):
-    """get ax'th column from num_pkts from db table"""
-    
-    results = sql_connect('select * from %s order by time desc limit %d' % (table, num_pkts), 'localhost')
-    
-    # initialize list array to be returned in flattened form
-    x = []
+def get_accel_from_db(table, ax, num_pkts, cache=None, parallel=False, workers=None):
+    """get ax'th column from num_pkts from db table, decoding only packets not already in cache (if given) or, with
+    parallel, decoding on a pool of worker processes (workers of them, None for one per core); not both"""
+    if cache is not None and parallel:
+        raise ValueError('cache and parallel decode do not mix, use one or the other')
     
-    # special handling of first packet to get start time
-    # NOTE: we used "desc" in query so gotta index from the "end"
-    i1 = results[-1]
-    p1 = guess_packet(i1[1])
-    start_time = p1.time()
-    #print UnixToHumanTime(start_time)
+    results = sql_connect('select * from %s order by time desc limit %%s' % sql_identifier(table), 'localhost',
+                          params=(num_pkts,))
     
-    # append first packet's worth to output
-    x.append( [ a[ax] for a in p1.txyz() ] )
+    # NOTE: we used "desc" in query so gotta go backwards here; i[0] is time, i[1] is the blob, i[2] is the type
+    if cache is not None:
+        xyz, start_times = cache.decode(table, results[::-1])
+    elif parallel:
+        xyz, offsets, start_times = decode_packets_parallel([ i[1] for i in results[::-1] ], workers=workers)
+    else:
+        xyz, offsets, start_times = decode_packets([ i[1] for i in results[::-1] ])
     
-    # NOTE: we used "desc" in query so gotta loop backwards here
-    # now iterate over remaining packets to build output
-    for i in results[-2::-1]:  # i[0] is time, i[1] is the blob, i[2] is the type
-        p = guess_packet(i[1])
-        #start_time2 = p.time()
-        #print UnixToHumanTime(start_time2)
-        x.append( [ a[ax] for a in p.txyz() ] )
-        
-    # returned flattened array version of x and the start_time for this chunk
-    return [ item for sublist in x for item in sublist ], start_time
+    # return ax'th column (x=1, y=2, z=3) and the start_time for this chunk
+    return xyz[:, ax - 1], start_times[0]
+
+
+class TailReader(object):
+    """A class to follow the tail of a db table: remembers time of last packet it has seen and each update fetches only
+    rows newer than that (at most num_pkts of the newest, since that is more than the window holds anyway), decodes
+    just those and rolls their ax'th column into a fixed-size window, so db load and decode cost go with new data, not
+    with window size or with how far behind we fell.  Window size is however many samples the first num_pkts packets
+    held (window stays empty until table has any)."""
+
+    def __init__(self, table, ax, num_pkts, fs):
+        self.table = sql_identifier(table)
+        self.ax = ax
+        self.num_pkts = num_pkts
+        self.fs = fs
+        self.num_new = 0       # number of new samples from last update
+        self._end_time = None  # time of last sample in window
+        results = sql_connect('select * from %s order by time desc limit %%s' % self.table, 'localhost',
+                              params=(num_pkts,))
+        self.last_time = results[0][0] if results else None  # db time of newest packet seen so far
+        self.window = self._decode(results[::-1]).astype(np.float64)
+
+    def __str__(self):
+        s = '%s: ' % self.__class__.__name__
+        s += '%s, ' % self.table
+        s += 'ax = %d, ' % self.ax
+        s += 'window = %d samples, ' % len(self.window)
+        s += 'new = %d' % self.num_new
+        return s
+
+    def _decode(self, results):
+        """return ax'th column of samples from results (in time order) and note time of last sample"""
+        xyz, offsets, start_times = decode_packets([i[1] for i in results])
+        if len(start_times):
+            self._end_time = start_times[-1] + (len(xyz) - offsets[-1] - 1) / self.fs
+        return xyz[:, self.ax - 1]
+
+    @property
+    def start_time(self):
+        """time of first sample in window (assuming no gaps)"""
+        return self._end_time - (len(self.window) - 1) / self.fs
+
+    def update(self):
+        """fetch and decode only (up to num_pkts of the newest) packets newer than the last one seen, roll them into
+        window; return num new samples"""
+        if self.last_time is None:
+            results = sql_connect('select * from %s order by time desc limit %%s' % self.table, 'localhost',
+                                  params=(self.num_pkts,))
+        else:
+            results = sql_connect('select * from %s where time > %%s order by time desc limit %%s' % self.table,
+                                  'localhost', params=(self.last_time, self.num_pkts))
+        self.num_new = 0
+        if not results:
+            return 0
+        self.last_time = results[0][0]
+        new = self._decode(results[::-1])
+        n = len(new)
+        if n == 0:
+            return 0
+        size = len(self.window)
+        if size == 0:
+            self.window = new.astype(np.float64)  # table was empty until now, so this sets window size
+        elif n >= size:
+            self.window[:] = new[-size:]
+        else:
+            self.window[:-n] = self.window[n:]  # shift older samples down in place
+            self.window[-n:] = new
+        self.num_new = n
+        return n
 
 
 def display_accel(table, k=0, sleep_sec=1):
@@ -137,7 +214,7 @@ def display_accel(table, k=0, sleep_sec=1):
     stdout.write(bytes(title))
     stdout.flush()
     while 1:
-        results = sql_connect('select * from %s order by time desc limit 1' % table, 'localhost')
+        results = sql_connect('select * from %s order by time desc limit 1' % sql_identifier(table), 'localhost')
         os.system('clear')
         os.system('date')
     
@@ -173,20 +250,26 @@ def run(table, fs, fc, ax, num_pkts, xlabel, ylabel, pause_sec):
     norder = 4  # order of LPF
     b, a = get_butter_digital(fs, fc, norder=norder)
 
+    # follow tail of db table, so each pass through loop only fetches and decodes packets that are new since last one
+    reader = TailReader(table, ax, num_pkts, fs)
+    while len(reader.window) == 0:
+        sleep(pause_sec)  # table is empty so far
+        reader.update()
+
+    # generate time vector sequence (FIXME assuming no gaps)
+    t = np.linspace(0.0, (len(reader.window)-1)/fs, len(reader.window), endpoint=True)
+
     # endless plot loop
     line1 = []
     while True:
         
-        # get latest set of data from db table (just ax axis)
-        data, start_time = get_accel_from_db(table, ax, num_pkts)
-        xn = np.array(data)
-        
-        # generate time vector sequence (FIXME assuming no gaps)
-        #t = np.linspace(start_time, start_time+(len(xn)-1)/fs, len(xn), endpoint=True)
-        t = np.linspace(0.0, (len(xn)-1)/fs, len(xn), endpoint=True)
+        # roll latest data from db table (just ax axis) into window; nothing new means nothing new to filter or plot
+        if line1 != [] and reader.update() == 0:
+            plt.pause(pause_sec)
+            continue
         
         # apply LPF
-        y = lowpass_filtfilt(t, xn, fs, fc, b, a)
+        y = lowpass_filtfilt(t, reader.window, fs, fc, b, a)
         
         ## plot the original signal and the filtered version
         #plt.figure
@@ -197,7 +280,7 @@ def run(table, fs, fc, ax, num_pkts, xlabel, ylabel, pause_sec):
         #plt.show()
         
         # call live plotter    
-        ident = unix_to_human_time(start_time) + '   [ now: %s ]' % datetime.datetime.now()
+        ident = unix_to_human_time(reader.start_time) + '   [ now: %s ]' % datetime.datetime.now()
         line1 = live_plot_xy(t, y, line1, xlabel=xlabel, ylabel=ylabel, identifier=ident, pause_sec=pause_sec)
 
 
@@ -207,11 +290,14 @@ def NEWrun(table, fs, fc, ax, num_pkts, xlabel, ylabel, pause_sec):
     # create 4th order low-pass butterworth filter
     blowpass_filt = ButterworthLowpassFilt(fs, fc, norder=4, has_nan=True)
 
+    # cache decoded packets, so each pass through loop only decodes the packets that are new since the last one
+    cache = DecodedPacketCache()
+
     # endless plot loop
     line1 = []
     while True:
         # get latest set of data from db table (just ax axis)
-        data, start_time = get_accel_from_db(table, ax, num_pkts)
+        data, start_time = get_accel_from_db(table, ax, num_pkts, cache=cache)
         xn = np.array(data)
 
         # generate time vector sequence (FIXME assuming no gaps)
@@ -27,11 +27,9 @@ import os
 import sys
 import time
 import datetime
-import platform
 import logging
 import logging.config
 import numpy as np
-import multiprocessing
 
 from tshcal.inputs import argparser
 from tshcal.inputs import user_menu
@@ -116,8 +114,9 @@ def wait_for_start_time(s, mod_logger):
     mod_logger.info('Faking that the calibration start time, %s, has been reached.  Begin calibrating now.' % s)
 
 
-def show_tsh_buffer_summary(tsh, sec=3, logger=None):
-    """this does not much beyond demonstrate instantiation of TshAccelBuffer with logging"""
+def show_tsh_buffer_summary(tsh, sec=3, timeout=None, logger=None):
+    """this does not much beyond demonstrate instantiation of TshAccelBuffer with logging; return True if buffer got
+    filled (before timeout, if tsh has background acquisition running); otherwise, return False"""
 
     # FIXME significant parts of this function are for quick demo purposes only, so scrub and fix
 
@@ -125,7 +124,11 @@ def show_tsh_buffer_summary(tsh, sec=3, logger=None):
 
     # create data buffer
     buff = buffer.TshAccelBuffer(tsh, sec, logger=logger)
-    raw_data_from_socket(tsh.ip, buff, port=DEFAULT_PORT)  # this populates 2nd arg, buff
+    if tsh.acquisition is not None:
+        if not tsh.acquisition.fill(buff, timeout=timeout):  # this populates buff from already-streaming data
+            return False
+    else:
+        raw_data_from_socket(tsh.ip, buff, port=DEFAULT_PORT)  # this populates 2nd arg, buff
 
     logger.debug('Done capturing quick data summary from tsh.')
 
@@ -136,6 +139,8 @@ def show_tsh_buffer_summary(tsh, sec=3, logger=None):
     # show/log summary
     logger.info(s)
 
+    return True
+
 
 def main():
     """return status/exit code that results from running tshcal main application"""
@@ -182,41 +187,27 @@ def main():
             # TODO give more info here -- what exactly does not match?
             raise AssertionError('The tsh actual state does NOT match our desired state.')
 
-    # if OS allows, then we can do quick tsh data check (must be linux)
-    pform = platform.platform()
-    if pform.lower().startswith('linux'):
-
-        module_logger.info('Perform quick tsh data test since OS detected is linux.')
-
-        # FIXME this next multiprocessing feature does not work on mac os
-        # create buffer to capture 2 seconds of TSH data and show user a summary of what we got (do as process for timeout)
-        buff_sec = 2
-        p = multiprocessing.Process(target=show_tsh_buffer_summary,
-                                    args=(tsh, ),
-                                    kwargs={'sec': buff_sec, 'logger': module_logger})
-        p.start()
+    # start background acquisition, so we keep one connection to tsh streaming for the rest of this session
+    tsh.start_acquisition()
 
-        # wait for double buff_sec or until process finishes
-        p.join(buff_sec * 2)
+    # create buffer to capture 2 seconds of TSH data and show user a summary of what we got (with a timeout)
+    module_logger.info('Perform quick tsh data test.')
+    buff_sec = 2
+    if not show_tsh_buffer_summary(tsh, sec=buff_sec, timeout=buff_sec * 2, logger=module_logger):
 
-        # if thread still active, that is, active for too long, then we log it and quit out
-        if p.is_alive():
-            timeout_msg = 'A %d-sec tsh data buffer still not filled after %d sec...' % (buff_sec, buff_sec * 2)
-            timeout_msg += 'Too long, something went wrong...kill it!'
-            module_logger.info(timeout_msg)
+        # buffer not filled in time, so we log it and quit out
+        timeout_msg = 'A %d-sec tsh data buffer still not filled after %d sec...' % (buff_sec, buff_sec * 2)
+        timeout_msg += 'Too long, something went wrong...kill it!'
+        module_logger.info(timeout_msg)
 
-            p.terminate()
-            p.join()
+        tsh.stop_acquisition()
 
-            module_logger.info('Why did it take %d seconds or more to fill a %d-second TSH buffer?' %
-                               (buff_sec * 2, buff_sec))
+        module_logger.info('Why did it take %d seconds or more to fill a %d-second TSH buffer?' %
+                           (buff_sec * 2, buff_sec))
 
-            print('See log for early exit due to tsh buffer issue.')
+        print('See log for early exit due to tsh buffer issue.')
 
-            sys.exit(-2)
-
-    else:
-        module_logger.info('Skip quick tsh data test since OS is not Linux.')
+        sys.exit(-2)
 
     # FIXME Do we need to do anything prep/config for ESP here? (e.g. GENERAL MODE SELECTION or STATUS FUNCTIONS...
     # FIXME ...maybe from Table 3.5.1 of ESP301 User Guide or possibly something else)?  Will may have answered this?
@@ -246,6 +237,9 @@ def main():
 
     # FIXME are there any commands we need to send to TSH at this point after running calibration?
 
+    # done with tsh data, so close persistent connection
+    tsh.stop_acquisition()
+
     module_logger.info('- - - Calibration Complete - - - - - - - - - - - - - - - - - - - - - -')
 
     return 0  # return zero for success (typical Linux command line behavior)
@@ -0,0 +1,240 @@
+#!/usr/bin/env python3
+
+"""Local fake TSH-ES data server: streams correctly formed tshes messages (with TshesAccelPacket) like a tsh does on
+its data port, either replayed from a capture file or made up from a synthetic signal, so ingest code can be run,
+benchmarked and regression-tested with no hardware around.
+
+For example, stream synthetic 1000 sa/sec data at 10x real time, dropping 2 packets every 100 and splitting frames:
+    python3 fake_tshes_server.py --rate 1000 --speed 10 --gap-every 100 --gap-packets 2 --split 500
+"""
+
+import time
+import socket
+import struct
+import logging
+import argparse
+import threading
+import numpy as np
+
+from tshcal.defaults import DEFAULT_PORT
+from tshcal.constants_tsh import TSH_RATES
+from tshcal.common.capture import CaptureReader
+from tshcal.common.tshes_params_packet import TshesMessage
+from tshcal.common.tshes_accel_packet import TshesAccelPacket, SAMPLE_DTYPE, ACCEL_SELECTORS, ACCEL_PREFIX_END
+
+
+# create logger
+module_logger = logging.getLogger('tshcal')
+
+HEADER_STRUCT = struct.Struct('!2sHHH16s16sHH')  # sync, msg_size, seq, cksum, source, destination, selector, data_size
+PREFIX_STRUCT = TshesAccelPacket.prefix_struct    # tshes_id, counter, sec, usec, packet_status, num_samples
+
+
+def rate_bits(rate):
+    """return rate bits (of packet status) for sample rate in sa/sec"""
+    for bits, (r, cutoff) in enumerate(TSH_RATES):
+        if r == rate:
+            return bits
+    raise ValueError('no tsh sample rate of %s sa/sec' % rate)
+
+
+def tshes_accel_message(counter, xyz, timestamp, rate=250.0, gain_bits=0, selector=170, sensor='es13', dio=0):
+    """return bytes for one tshes message with TshesAccelPacket holding Nx3 xyz samples (counts, no compensation)"""
+    samples = np.zeros(len(xyz), dtype=SAMPLE_DTYPE)
+    samples['x'], samples['y'], samples['z'] = xyz[:, 0], xyz[:, 1], xyz[:, 2]
+    samples['dio'] = dio
+    payload = samples.tobytes()
+    tshes_id = ('tshes-%s' % sensor[-2:]).encode('utf-8')
+    sec, usec = int(timestamp), int(round((timestamp - int(timestamp)) * 1000000))
+    if usec >= 1000000:
+        sec, usec = sec + 1, usec - 1000000
+    status = (rate_bits(rate) << 8) | gain_bits
+    prefix = PREFIX_STRUCT.pack(tshes_id, counter & 0xffffffff, sec, usec, status, len(xyz))
+    data_size = len(prefix) + len(payload)
+    header = HEADER_STRUCT.pack(b'\xac\xd3', HEADER_STRUCT.size + data_size, counter & 0xffff, 0, tshes_id,
+                                b'ground', selector, data_size)
+    return header + prefix + payload
+
+
+def synthetic_messages(rate=250.0, samples_per_packet=None, num_packets=None, start=None, signal=None,
+                       noise=5.0, gain_bits=0, sensor='es13', gap_every=0, gap_packets=1, seed=0):
+    """generator that yields (send_time, message bytes) for synthetic signal, num_packets of them (None = forever)
+
+    samples_per_packet defaults to about 1/8 sec worth; start defaults to now, so with real time pacing, the wall
+    clock time a packet is received minus its end time is ingest latency; signal is a function of Nx1 array of
+    times that returns Nx3 counts (default is constant 1g-ish on z); noise is std of gaussian noise added (counts);
+    out of every gap_every packets (zero for never), last gap_packets get dropped (their counter and time still pass)
+    """
+    rng = np.random.RandomState(seed)
+    n = samples_per_packet or max(1, int(rate / 8))
+    t0 = time.time() if start is None else start
+    if signal is None:
+        def signal(t):
+            return np.column_stack((np.full(len(t), 100.0), np.full(len(t), -200.0), np.full(len(t), 4.0e5)))
+    counter = 0
+    sent = 0
+    while num_packets is None or sent < num_packets:
+        t = t0 + (counter * n + np.arange(n)) / rate
+        if gap_every and counter % gap_every >= gap_every - gap_packets:
+            counter += 1  # drop this packet
+            continue
+        xyz = signal(t) + rng.normal(scale=noise, size=(n, 3))
+        yield t[-1], tshes_accel_message(counter, xyz, t[0], rate=rate, gain_bits=gain_bits, sensor=sensor)
+        counter += 1
+        sent += 1
+
+
+def capture_messages(fname):
+    """generator that yields (send_time, message bytes) for each message in capture file (None time = send now)"""
+    with CaptureReader(fname) as reader:
+        for data in reader.messages():
+            t = None
+            if TshesMessage(data).selector() in ACCEL_SELECTORS and len(data) >= ACCEL_PREFIX_END:
+                try:
+                    t = TshesAccelPacket(data).end_time()
+                except ValueError:
+                    pass  # corrupt status bits (or num_samples), so no time to pace by; send it as is, right away
+            yield t, bytes(data)
+
+
+class FakeTshesServer(object):
+    """A class for a local server that streams tshes messages to each client that connects (one at a time).
+
+    make_messages is a function that returns an iterable of (send_time, message bytes), e.g. synthetic_messages or
+    capture_messages; each connection gets a fresh one.  With speed 1, messages go out at send_time pace (real time),
+    with speed N, at N times real time and with speed None, as fast as possible.  With split, each message is sent in
+    random-sized pieces of at most split bytes, so frames get split across sends."""
+
+    def __init__(self, make_messages, host='127.0.0.1', port=0, speed=1.0, split=None, seed=0, logger=module_logger):
+        self.make_messages = make_messages
+        self.speed = speed
+        self.split = split
+        self.logger = logger
+        self.num_messages = 0  # running total of messages sent
+        self.bytes_sent = 0    # running total of bytes sent
+        self._rng = np.random.RandomState(seed)
+        self._stop = threading.Event()
+        self._thread = None
+        self._sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._sock.bind((host, port))
+        self._sock.listen(1)
+        self.host, self.port = self._sock.getsockname()
+
+    def __str__(self):
+        s = '%s: ' % self.__class__.__name__
+        s += '%s:%d, ' % (self.host, self.port)
+        s += 'speed = %s, ' % ('max' if not self.speed else '%gx' % self.speed)
+        s += 'messages = %d, ' % self.num_messages
+        s += 'bytes = %d' % self.bytes_sent
+        return s
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.stop()
+
+    def start(self):
+        """start serving on background thread"""
+        self._thread = threading.Thread(target=self.serve_forever, name='fake_tshes_server', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """stop serving and close listening socket"""
+        self._stop.set()
+        try:
+            self._sock.shutdown(socket.SHUT_RDWR)  # this gets blocking accept to return
+        except OSError:
+            pass
+        self._sock.close()
+        if self._thread is not None:
+            self._thread.join()
+
+    def serve_forever(self):
+        while not self._stop.is_set():
+            try:
+                conn, addr = self._sock.accept()
+            except OSError:
+                break  # listening socket closed
+            self.logger.info('%s connected by %s.' % (self.__class__.__name__, addr))
+            with conn:
+                conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+                try:
+                    self._stream(conn)
+                except OSError as e:
+                    self.logger.info('%s client went away: %s' % (self.__class__.__name__, e))
+
+    def _stream(self, conn):
+        wall0 = data0 = None
+        for t, msg in self.make_messages():
+            if self._stop.is_set():
+                return
+            if self.speed and t is not None:
+                if wall0 is None:
+                    wall0, data0 = time.monotonic(), t
+                delay = wall0 + (t - data0) / self.speed - time.monotonic()
+                if delay > 0:
+                    self._stop.wait(delay)
+            self._send(conn, msg)
+
+    def _send(self, conn, msg):
+        if not self.split:
+            conn.sendall(msg)
+        else:
+            i = 0
+            while i < len(msg):
+                n = self._rng.randint(1, self.split + 1)
+                conn.sendall(msg[i:i + n])
+                i += n
+        self.num_messages += 1
+        self.bytes_sent += len(msg)
+
+
+def benchmark_ingest(rate=1000.0, sec=600, speed=None, split=None):
+    """time how long raw_data_from_socket takes to ingest sec seconds of synthetic data streamed at speed"""
+
+    from tshcal.common.buffer import Tsh, TshAccelBuffer, raw_data_from_socket
+
+    tsh = Tsh('es13', rate, 0)
+    buff = TshAccelBuffer(tsh, sec)
+    with FakeTshesServer(lambda: synthetic_messages(rate=rate), speed=speed, split=split) as server:
+        tzero = time.perf_counter()
+        raw_data_from_socket(server.host, buff, port=server.port)
+        elapsed = time.perf_counter() - tzero
+    print(server)
+    print('ingested %d samples in %.3f sec = %.0f sa/sec (%.0fx real time)' %
+          (buff.idx, elapsed, buff.idx / elapsed, buff.idx / elapsed / rate))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Stream fake tshes messages like a tsh does on its data port.')
+    parser.add_argument('--capture', help='replay this capture file (default is synthetic data)')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT, help='port to listen on')
+    parser.add_argument('--rate', type=float, default=250.0, help='synthetic sample rate (sa/sec)')
+    parser.add_argument('--speed', type=float, default=1.0, help='times real time (zero for as fast as possible)')
+    parser.add_argument('--split', type=int, default=None, help='send each message in pieces of at most this size')
+    parser.add_argument('--gap-every', type=int, default=0, help='drop packets every this many (zero for never)')
+    parser.add_argument('--gap-packets', type=int, default=1, help='how many packets to drop each time')
+    args = parser.parse_args()
+
+    if args.capture:
+        def make_messages():
+            return capture_messages(args.capture)
+    else:
+        def make_messages():
+            return synthetic_messages(rate=args.rate, gap_every=args.gap_every, gap_packets=args.gap_packets)
+
+    logging.basicConfig(level=logging.INFO)
+    server = FakeTshesServer(make_messages, host='', port=args.port, speed=args.speed or None, split=args.split)
+    print('Serving on port %d, hit Ctrl-C to quit.' % server.port)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    print(server)
+
+
+if __name__ == '__main__':
+    main()
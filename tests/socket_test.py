@@ -12,6 +12,7 @@ import matplotlib.pyplot as plt
 from tshcal.secret import TSHES14_IPADDR
 from tshcal.filters.lowpass import ButterworthLowpassFilt
 from tshcal.common.tshes_params_packet import TshesMessage
+from tshcal.common.tshes_accel_packet import decode_xyz
 from tshcal.common.time_utils import unix_to_human_time
 from tshcal.common.plot_utils import TshRealtimePlot
 from tshcal.common.buffer import TshAccelBuffer, Tsh
@@ -52,12 +53,14 @@ def divvy_up(num, divisor=16):
 
 def recvall(sock, n):
     """helper function to receive n bytes from (sock)et or return None if EOF is hit"""
-    data = b''
-    while len(data) < n:
-        packet = sock.recv(n - len(data))
-        if not packet:
+    data = bytearray(n)  # preallocate & fill in place, growing bytes object one recv at a time is quadratic
+    view = memoryview(data)
+    got = 0
+    while got < n:
+        num = sock.recv_into(view[got:], n - got)
+        if not num:
             return None
-        data += packet
+        got += num
     return data
 
 
@@ -164,42 +167,29 @@ def raw_data_from_socket(ip_addr, buff, port=9750):
                         # compute end time from start, number of samples and rate
                         end_time = timestamp + (num_samples - 1) / rate
 
-                        # build array of accel data
-                        xyz = []
-
                         # compute delta samples missing from current volley of bytes; 1 sample = 16 bytes (x,y,z,dio)
                         received_samples, left_over_bytes = divvy_up(len(data[80:]))
                         deficit_samples = num_samples - received_samples
                         deficit_bytes = deficit_samples * 16 - left_over_bytes
 
-                        # append the samples we have received so far
-                        for i in range(received_samples):
-                            start = 80 + 16 * i
-                            stop = start + 16
-                            x, y, z, dio = struct.unpack('!fffI', data[start:stop])  # Network byte order
-                            # we are ignoring digital io status (dio)
-                            # self.handleDigitalIOstatus(digitalIOstatus, i)
-                            # if convert:
-                            #     x, y, z = x * mx + bx, y * my + by, z * mz + bz
-                            xyz.append((x, y, z))
-
                         # NOTE: This next bit of code shows we now know we're dealing with stream-based protocol!
 
-                        # keep remainder bytes & prepend'em to balance of samples we'll get for TshesAccelPacket struct
-                        more_data = data[stop:]
-                        more_data += recvall(s, deficit_bytes)  # remainder of bytes we need to get num_samples filled
+                        # keep bytes we got so far & append balance of bytes needed to get num_samples filled
+                        payload = data[80:]
+                        if deficit_bytes > 0:
+                            more_data = recvall(s, deficit_bytes)
+                            if more_data is None:
+                                break
+                            payload += more_data
 
-                        # append deficit samples to get a total of num_samples (promised in TshesAccelPacket's "Prefix")
-                        for i in range(deficit_samples):
-                            start = 16 * i
-                            stop = start + 16
-                            x, y, z, dio = struct.unpack('!fffI', more_data[start:stop])  # Network byte order
-                            xyz.append((x, y, z))
+                        # decode all num_samples (promised in TshesAccelPacket's "Prefix") in one shot, no per-sample
+                        # loop; we are ignoring digital io status (dio) here
+                        xyz = decode_xyz(payload, num_samples, offset=0)
 
                         # print('len(data) = %d' % len(data), 'tm:[', str(tm).replace('\n', ' '), ']', tshes_id, counter,
                         #       unix_to_human_time(timestamp), packet_status, num_samples, rate, cutoff_freq, gain,
                         #       input, unit, adjustment, unix_to_human_time(end_time), received_samples, left_over_bytes,
-                        #       deficit_samples, stop)
+                        #       deficit_samples, deficit_bytes)
 
                         print("{:>4} {} {:>4s} {:>10d} {} {:>5d} {:>3d} {:>6.1f} {:>6.2f} {:>4.1f} {:>6s}"
                               " {:>6s} {:>15s} {} {:>3d} {:>3d} {:>3d} {:>4d}".format(
@@ -220,10 +210,10 @@ def raw_data_from_socket(ip_addr, buff, port=9750):
                             received_samples,
                             left_over_bytes,
                             deficit_samples,
-                            stop - left_over_bytes)
+                            deficit_bytes)
                         )
 
-                        buff.add(np.array(xyz))
+                        buff.add(xyz)
 
                 else:
                     print('unhandled branch with len(data) = %d' % len(data))
@@ -324,42 +314,29 @@ def plot_raw_data_from_socket(fs, fc, ax, ip_addr, port=9750, norder=4, has_nan=
                         # compute end time from start, number of samples and rate
                         end_time = timestamp + (num_samples - 1) / rate
 
-                        # build array of accel data
-                        xyz = []
-
                         # compute delta samples missing from current volley of bytes; 1 sample = 16 bytes (x,y,z,dio)
                         received_samples, left_over_bytes = divvy_up(len(data[80:]))
                         deficit_samples = num_samples - received_samples
                         deficit_bytes = deficit_samples * 16 - left_over_bytes
 
-                        # append the samples we have received so far
-                        for i in range(received_samples):
-                            start = 80 + 16 * i
-                            stop = start + 16
-                            x, y, z, dio = struct.unpack('!fffI', data[start:stop])  # Network byte order
-                            # we are ignoring digital io status (dio)
-                            # self.handleDigitalIOstatus(digitalIOstatus, i)
-                            # if convert:
-                            #     x, y, z = x * mx + bx, y * my + by, z * mz + bz
-                            xyz.append((x, y, z))
-
-                        # NOTE: This next bit of code shows that we know we're dealing with stream-based protocol!
-
-                        # keep remainder bytes & prepend'em to balance of samples we'll get for TshesAccelPacket struct
-                        more_data = data[stop:]
-                        more_data += recvall(s, deficit_bytes)  # remainder of bytes we need to get num_samples filled
-
-                        # append deficit samples to get a total of num_samples (promised in TshesAccelPacket's "Prefix")
-                        for i in range(deficit_samples):
-                            start = 16 * i
-                            stop = start + 16
-                            x, y, z, dio = struct.unpack('!fffI', more_data[start:stop])  # Network byte order
-                            xyz.append((x, y, z))
+                        # NOTE: This next bit of code shows we now know we're dealing with stream-based protocol!
+
+                        # keep bytes we got so far & append balance of bytes needed to get num_samples filled
+                        payload = data[80:]
+                        if deficit_bytes > 0:
+                            more_data = recvall(s, deficit_bytes)
+                            if more_data is None:
+                                break
+                            payload += more_data
+
+                        # decode all num_samples (promised in TshesAccelPacket's "Prefix") in one shot, no per-sample
+                        # loop; we are ignoring digital io status (dio) here
+                        xyz = decode_xyz(payload, num_samples, offset=0)
 
                         # print('len(data) = %d' % len(data), 'tm:[', str(tm).replace('\n', ' '), ']', tshes_id, counter,
                         #       unix_to_human_time(timestamp), packet_status, num_samples, rate, cutoff_freq, gain,
                         #       input, unit, adjustment, unix_to_human_time(end_time), received_samples, left_over_bytes,
-                        #       deficit_samples, stop)
+                        #       deficit_samples, deficit_bytes)
 
                         print("{:>4} {} {:>4s} {:>10d} {} {:>5d} {:>3d} {:>6.1f} {:>6.2f} {:>4.1f} {:>6s}"
                               " {:>6s} {:>15s} {} {:>3d} {:>3d} {:>3d} {:>4d}".format(
@@ -380,7 +357,7 @@ def plot_raw_data_from_socket(fs, fc, ax, ip_addr, port=9750, norder=4, has_nan=
                             received_samples,
                             left_over_bytes,
                             deficit_samples,
-                            stop - left_over_bytes
+                            deficit_bytes
                         )
                         )
 
@@ -388,10 +365,9 @@ def plot_raw_data_from_socket(fs, fc, ax, ip_addr, port=9750, norder=4, has_nan=
                         idx = axis_str2idx(ax)
 
                         # dispense with most recent values
-                        base_time = datetime.datetime.utcfromtimestamp(timestamp)
-                        t_values = np.array([base_time + datetime.timedelta(seconds=i/fs) for i in range(len(xyz))])
+                        t_values = timestamp + np.arange(len(xyz)) / fs  # unix times, in one array op
                         # print(t_values[0], t_values[-1], len(xyz))
-                        y_values = np.array([i[idx] for i in xyz])
+                        y_values = xyz[:, idx]
                         display.add(t_values, y_values)
                         # base_time = t_values[-1] + datetime.timedelta(seconds=delta_sec)
                         plt.pause(sleep_sec)
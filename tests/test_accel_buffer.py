@@ -0,0 +1,301 @@
+#!/usr/bin/env python3
+
+import time
+import socket
+import struct
+import threading
+import numpy as np
+import pytest
+
+from tshcal.common.buffer import Tsh, TshAccelBuffer
+from tshcal.common.tshes_accel_packet import TshesAccelPacket
+from tshcal.tests.test_tshes_stream import fake_accel_message
+from tshcal.tests.fake_tshes_server import tshes_accel_message
+
+
+def ramp(start, num):
+    """return Nx3 array with x = sample number (from start), y = -x and z = 10x"""
+    x = np.arange(start, start + num, dtype=float)
+    return np.column_stack((x, -x, 10 * x))
+
+
+class TestFillOnceBuffer(object):
+    """class to test default (fill once) flavor of TshAccelBuffer"""
+
+    def setup_method(self, method):
+        """setup for general use in test methods of this class"""
+        self.buff = TshAccelBuffer(Tsh('es13', 10.0, 0), 1)  # 10 sa/sec for 1 sec = 10 pts
+
+    def test_fill_once(self):
+        """test buffer fills, then ignores more data"""
+        self.buff.add(ramp(0, 4))
+        assert not self.buff.is_full
+        self.buff.add(ramp(4, 8))
+        assert self.buff.is_full
+        assert self.buff.idx == 10
+        np.testing.assert_array_equal(self.buff.xyz, ramp(0, 10))
+        self.buff.add(ramp(12, 3))
+        assert self.buff.idx == 10
+
+    def test_span(self):
+        """test span of what was added so far"""
+        self.buff.add(ramp(0, 6))
+        np.testing.assert_array_equal(self.buff.span(2, 5), ramp(2, 3))
+        np.testing.assert_array_equal(self.buff.latest(2), ramp(4, 2))
+        with pytest.raises(ValueError):
+            self.buff.span(4, 7)  # not there yet
+
+
+class TestCircularBuffer(object):
+    """class to test circular (ring) flavor of TshAccelBuffer"""
+
+    def setup_method(self, method):
+        """setup for general use in test methods of this class"""
+        self.buff = TshAccelBuffer(Tsh('es13', 10.0, 0), 1, circular=True)  # ring of 10 pts
+
+    def test_never_full(self):
+        """test ring keeps accepting data and keeps latest num samples in time order"""
+        for i in range(0, 95, 7):
+            self.buff.add(ramp(i, 7))
+        assert not self.buff.is_full
+        assert self.buff.idx == 98
+        np.testing.assert_array_equal(self.buff.xyz, ramp(88, 10))
+
+    def test_partially_filled(self):
+        """test xyz only shows what was added so far"""
+        self.buff.add(ramp(0, 3))
+        np.testing.assert_array_equal(self.buff.xyz, ramp(0, 3))
+
+    def test_snapshot_is_view(self):
+        """test latest returns view, not a copy, even when it spans wrap around point of ring"""
+        self.buff.add(ramp(0, 8))
+        self.buff.add(ramp(8, 5))  # wraps around
+        snap = self.buff.latest_sec(0.6)
+        np.testing.assert_array_equal(snap, ramp(7, 6))
+        assert np.shares_memory(snap, self.buff._data)
+
+    def test_huge_chunk(self):
+        """test chunk bigger than ring keeps only its tail"""
+        self.buff.add(ramp(0, 3))
+        self.buff.add(ramp(3, 25))
+        assert self.buff.idx == 28
+        np.testing.assert_array_equal(self.buff.xyz, ramp(18, 10))
+
+    def test_span_overwritten(self):
+        """test span that has been overwritten is rejected"""
+        self.buff.add(ramp(0, 15))
+        np.testing.assert_array_equal(self.buff.span(5, 15), ramp(5, 10))
+        with pytest.raises(ValueError):
+            self.buff.span(4, 9)
+
+    def test_wait_for_span(self):
+        """test consumer waiting for data that another thread adds"""
+        self.buff.add(ramp(0, 4))
+        start = self.buff.idx
+        feeder = threading.Timer(0.05, self.buff.add, args=(ramp(4, 6),))
+        feeder.start()
+        np.testing.assert_array_equal(self.buff.wait_for_span(start, start + 5, timeout=5), ramp(4, 5))
+        assert self.buff.wait_for_span(start, start + 50, timeout=0.01) is None
+
+
+class TestTshAcquisition(object):
+    """class to test background acquisition service against a local server that streams fake tshes messages"""
+
+    def setup_method(self, method):
+        """setup for general use in test methods of this class"""
+        self.server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.server.bind(('127.0.0.1', 0))
+        self.server.listen(1)
+        self.stream = b''.join([fake_accel_message(i, ramp(10 * i, 10)) for i in range(30)])
+        self.tsh = Tsh('es13', 250.0, 0)
+        self.tsh.ip = '127.0.0.1'  # point at our local server instead of real tsh
+
+    def teardown_method(self, method):
+        self.tsh.stop_acquisition()
+        self.server.close()
+
+    def serve_once(self):
+        conn, addr = self.server.accept()
+        with conn:
+            for i in range(0, len(self.stream), 1000):
+                conn.sendall(self.stream[i:i + 1000])
+            time.sleep(0.5)  # hold connection open a bit so acquisition does not have to reconnect
+
+    def test_fan_out(self):
+        """test ring, fill-once buffer and plain subscriber all get data from one connection"""
+        threading.Thread(target=self.serve_once, daemon=True).start()
+        counters = []
+        acq = self.tsh.start_acquisition(port=self.server.getsockname()[1])
+        acq.subscribe(lambda pkt: counters.append(pkt.counter))
+        buff = TshAccelBuffer(self.tsh, 0.4)  # 100 pts
+        assert acq.fill(buff, timeout=5)
+        assert acq.ring.wait_for_span(0, 300, timeout=5) is not None
+        np.testing.assert_array_equal(acq.ring.xyz, ramp(0, 300))
+        assert counters == list(range(len(counters)))
+        assert acq.num_connects == 1
+
+    def test_bad_status_bits(self):
+        """test message with bogus rate bits gets skipped and acquisition keeps running"""
+        msgs = [fake_accel_message(i, ramp(10 * i, 10)) for i in range(30)]
+        msgs[5] = msgs[5][:72] + struct.pack('!i', 0x0f00) + msgs[5][76:]  # packet status, rate bits = 15
+        self.stream = b''.join(msgs)
+        threading.Thread(target=self.serve_once, daemon=True).start()
+        acq = self.tsh.start_acquisition(port=self.server.getsockname()[1])
+        assert acq.ring.wait_for_span(0, 290, timeout=5) is not None
+        np.testing.assert_array_equal(acq.ring.xyz, np.vstack((ramp(0, 50), ramp(60, 240))))
+        assert acq.num_packets == 29 and acq.is_running()
+
+    def test_next_packet_end_time(self):
+        """test we get end time of 1st packet that arrives after the call, not of one already in ring"""
+        msgs = [tshes_accel_message(i, ramp(10 * i, 10), 1000.0 + 0.04 * i) for i in range(30)]
+        resume = threading.Event()
+
+        def serve():
+            conn, addr = self.server.accept()
+            with conn:
+                conn.sendall(b''.join(msgs[:10]))
+                resume.wait(5)
+                conn.sendall(b''.join(msgs[10:]))
+                time.sleep(0.5)
+        threading.Thread(target=serve, daemon=True).start()
+        acq = self.tsh.start_acquisition(port=self.server.getsockname()[1])
+        assert acq.ring.wait_for_span(0, 100, timeout=5) is not None
+        threading.Timer(0.1, resume.set).start()
+        assert acq.next_packet_end_time(timeout=5) == pytest.approx(1000.0 + 0.04 * 10 + 9 / 250.0)
+        assert acq.next_packet_end_time(timeout=0.2) is None  # nothing more after last packet
+
+
+class TestConvergedBuffer(object):
+    """class to test fill-once TshAccelBuffer that can stop early once its median is pinned down well enough"""
+
+    def setup_method(self, method):
+        """setup for general use in test methods of this class"""
+        rng = np.random.RandomState(0)
+        self.xyz = rng.normal(loc=[100.0, 200.0, 300.0], scale=2.0, size=(2500, 3))
+        self.tsh = Tsh('es13', 100.0, 0)
+
+    def test_stops_early(self):
+        """test buffer with tol stops well short of its full duration"""
+        buff = TshAccelBuffer(self.tsh, 20, tol=0.5, min_sec=1)  # 2000 pts at most
+        for i in range(0, 2000, 50):
+            buff.add(self.xyz[i:i + 50, :])
+            if buff.is_full:
+                break
+        assert buff.is_converged
+        assert 100 <= buff.idx < 2000
+        assert buff.xyz.shape == (buff.idx, 3)
+        assert not np.any(np.isnan(buff.xyz))
+        assert np.all(buff.stats.median_sem <= 0.5)
+
+    def test_fixed_duration_is_upper_bound(self):
+        """test buffer with tol it cannot reach still fills to its full duration"""
+        buff = TshAccelBuffer(self.tsh, 5, tol=0.01)
+        buff.add(self.xyz[:1000, :])
+        assert buff.is_full and not buff.is_converged
+        assert buff.idx == 500
+        assert buff.stats.count == 500
+
+    def test_fill_from_ring(self):
+        """test filling from a streaming ring uses only samples that arrive after the call"""
+        ring = TshAccelBuffer(self.tsh, 30, circular=True)
+        ring.add(self.xyz[:100, :])
+        buff = TshAccelBuffer(self.tsh, 20, tol=0.5, min_sec=1)
+        feeder = threading.Timer(0.05, lambda: [ring.add(self.xyz[i:i + 25, :]) or time.sleep(0.001)
+                                                for i in range(100, 2500, 25)])
+        feeder.start()
+        assert buff.fill_from(ring, timeout=10)
+        feeder.join()
+        assert buff.is_converged
+        np.testing.assert_array_equal(buff.xyz, self.xyz[100:100 + buff.idx, :])
+        assert not TshAccelBuffer(self.tsh, 1).fill_from(ring, timeout=0.01)
+
+
+class TestGapIndex(object):
+    """class to test gap index that add_packet keeps from packet counter and timestamp"""
+
+    def setup_method(self, method):
+        """setup for general use in test methods of this class"""
+        self.tsh = Tsh('es13', 250.0, 0)
+
+    def packets(self, counters):
+        """return list of TshesAccelPacket, 10 samples each at 250 sa/sec, timed to go with their counter"""
+        return [TshesAccelPacket(fake_accel_message(c, ramp(10 * c, 10), timestamp=1000.0 + c * 10 / 250.0))
+                for c in counters]
+
+    def test_no_gaps(self):
+        """test contiguous packets give empty gap index and one segment"""
+        buff = TshAccelBuffer(self.tsh, 1)
+        for pkt in self.packets(range(5)):
+            buff.add_packet(pkt)
+        assert buff.gaps == []
+        assert buff.segments() == [(0, 50)]
+
+    def test_dropped_packets(self):
+        """test dropped packets show up as gap with offset, missing count and time span"""
+        buff = TshAccelBuffer(self.tsh, 1)
+        for pkt in self.packets([0, 1, 4, 5, 7]):
+            buff.add_packet(pkt)
+        assert len(buff.gaps) == 2
+        gap = buff.gaps[0]
+        assert gap.offset == 20 and gap.missing == 20
+        assert gap.start == pytest.approx(1000.0 + 20 / 250.0)
+        assert gap.stop == pytest.approx(1000.0 + 40 / 250.0)
+        assert buff.gaps[1].offset == 40 and buff.gaps[1].missing == 10
+        assert buff.segments() == [(0, 20), (20, 40), (40, 50)]
+        assert buff.segments(25, 45) == [(25, 40), (40, 45)]
+        np.testing.assert_array_equal(buff.xyz[20:40, :], ramp(40, 20))  # what did arrive, nothing spliced in
+
+    def test_ring_forgets_overwritten_gaps(self):
+        """test ring keeps only gaps that are still in ring and fill_from carries them along"""
+        ring = TshAccelBuffer(self.tsh, 0.2, circular=True)  # 50 pts
+        for pkt in self.packets([0, 2, 3, 4, 5]):
+            ring.add_packet(pkt)
+        assert [g.offset for g in ring.gaps] == [10]
+        for pkt in self.packets([7, 8, 9, 10, 12]):
+            ring.add_packet(pkt)
+        assert [g.offset for g in ring.gaps] == [90]  # gaps at 10 and 50 are not inside latest 50 pts
+
+        buff = TshAccelBuffer(self.tsh, 0.2)
+        feeder = threading.Timer(0.05, lambda: [ring.add_packet(p) for p in self.packets([13, 14, 16, 17, 18])])
+        feeder.start()
+        assert buff.fill_from(ring, timeout=5)
+        assert buff.gaps == [ring.gaps[-1]._replace(offset=20)]
+
+
+class TestTimeColumn(object):
+    """class to test per-sample unix times that add_packet stores alongside xyz"""
+
+    def setup_method(self, method):
+        """setup for general use in test methods of this class"""
+        self.tsh = Tsh('es13', 250.0, 0)
+        self.ring = TshAccelBuffer(self.tsh, 0.2, circular=True)  # 50 pts
+        for c in [0, 1, 2, 4, 5, 6, 7]:
+            xyz = ramp(10 * c, 10)
+            self.ring.add_packet(TshesAccelPacket(fake_accel_message(c, xyz, timestamp=1000.0 + c * 10 / 250.0)))
+
+    def test_times_follow_xyz(self):
+        """test times are in step with xyz in ring, gap included"""
+        assert self.ring.t.shape == (50,)
+        np.testing.assert_allclose(self.ring.t, 1000.0 + self.ring.xyz[:, 0] / 250.0)
+        assert np.all(np.diff(self.ring.t) > 0)
+
+    def test_index_at(self):
+        """test time lookups give write index of 1st sample at or after time"""
+        assert self.ring.index_at(1000.0) == 20  # oldest still in ring
+        assert self.ring.index_at(1000.0 + 25 / 250.0) == 25
+        assert self.ring.index_at(1000.0 + 35 / 250.0) == 30  # sample 35 was in dropped packet, so next is sample 40
+        assert self.ring.index_at(1000.0 + 45 / 250.0) == 35
+        assert self.ring.index_at(1000.0 + 45.5 / 250.0) == 36
+        assert self.ring.index_at(2000.0) == self.ring.idx
+
+    def test_wait_for_time(self):
+        """test waiting for time that is not in ring yet, then filling from there"""
+        later = TshesAccelPacket(fake_accel_message(8, ramp(80, 10), timestamp=1000.0 + 80 / 250.0))
+        threading.Timer(0.05, self.ring.add_packet, args=(later,)).start()
+        start = self.ring.wait_for_time(1000.0 + 85 / 250.0, timeout=5)
+        assert start == 75
+        buff = TshAccelBuffer(self.tsh, 0.02)  # 5 pts
+        assert buff.fill_from(self.ring, timeout=5, start=start)
+        np.testing.assert_array_equal(buff.xyz, ramp(85, 5))
+        np.testing.assert_allclose(buff.t, 1000.0 + np.arange(85, 90) / 250.0)
+        assert self.ring.wait_for_time(3000.0, timeout=0.01) is None
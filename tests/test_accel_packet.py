@@ -0,0 +1,340 @@
+#!/usr/bin/env python3
+
+import io
+import struct
+import numpy as np
+
+from tshcal.common.accel_packet import guess_packet, scan_headers, header_records, decode_packets, SamsTshEs
+from tshcal.common.accel_packet import Sams2Packet, AccelPacket
+from tshcal.common.accel_packet import DigitalIOTracker, contiguous_segments, header_segments
+from tshcal.common.accel_packet import hex_dump, dump_packets, DecodedPacketCache, iter_accel_chunks
+from tshcal.common.accel_packet import decode_packets_parallel
+from tshcal.common import accel_packet
+from tshcal.tests.fake_tshes_server import tshes_accel_message
+
+
+class TestSamsTshEs(object):
+    """class to test vectorized (and cached) accel data of SamsTshEs packet"""
+
+    def setup_method(self, method):
+        """setup for general use in test methods of this class"""
+        self.xyz = np.arange(30, dtype=np.float32).reshape(10, 3) - 12.5
+        self.pkt = guess_packet(tshes_accel_message(3, self.xyz, 1000.0, rate=500.0, dio=0x0005))
+
+    def test_xyz(self):
+        """test xyz comes back as cached Nx3 float32 array"""
+        assert isinstance(self.pkt, SamsTshEs)
+        xyz = self.pkt.xyz()
+        assert xyz.dtype == np.float32 and xyz.shape == (10, 3)
+        np.testing.assert_array_equal(xyz, self.xyz)
+        assert self.pkt.xyz() is xyz
+
+    def test_dio(self):
+        """test dio comes back as cached uint32 array"""
+        dio = self.pkt.dio()
+        assert dio.dtype == np.uint32 and dio.tolist() == [5] * 10
+        assert self.pkt.dio() is dio
+
+    def test_txyz(self):
+        """test txyz has relative time column and xyz as float64"""
+        txyz = self.pkt.txyz()
+        assert txyz.dtype == np.float64 and txyz.shape == (10, 4)
+        np.testing.assert_allclose(txyz[:, 0], np.arange(10) / 500.0)
+        np.testing.assert_array_equal(txyz[:, 1:], self.xyz)
+        assert self.pkt.txyz() is txyz
+
+
+class TestSamsTshEsHeader(object):
+    """class to test one-shot prefix decode and table-driven status bits of SamsTshEs packet"""
+
+    def test_header(self):
+        """test header values, including falsy ones (counter zero) that must still come from cache"""
+        msg = tshes_accel_message(0, np.zeros((4, 3)), 1234567890.25, rate=1000.0, gain_bits=18, sensor='es19')
+        pkt = SamsTshEs(msg)
+        prefix = pkt._prefix()
+        assert pkt.Id() == b'es19'
+        assert pkt.counter() == 0
+        assert pkt.time() == 1234567890.25
+        assert pkt.samples() == 4
+        assert pkt.rate() == 1000.0 and pkt._cutoffFreq_ == 408.5
+        assert pkt.gain() == 8.5 and pkt._input_ == 'Signal'
+        assert pkt.unit() == 'counts'
+        assert pkt.adjustment() == 'no-compensation'
+        assert pkt.endTime() == 1234567890.25 + 3 / 1000.0
+        assert pkt._prefix() is prefix
+
+    def test_bogus_status_bits(self):
+        """test fallback values for status bits that are not in tables"""
+        msg = bytearray(tshes_accel_message(1, np.zeros((2, 3)), 0.0, gain_bits=0x1f))
+        msg[74] = 0x0f  # rate bits of packet status
+        pkt = SamsTshEs(bytes(msg))
+        assert pkt.rate() == 1000.0
+        assert pkt.gain() == 1.0
+
+
+class TestScanHeaders(object):
+    """class to test lightweight header records (SamsTshEsHeader) for bulk scans"""
+
+    def setup_method(self, method):
+        """setup for general use in test methods of this class"""
+        self.xyz = np.arange(24, dtype=np.float32).reshape(8, 3)
+        self.msgs = [tshes_accel_message(c, self.xyz, 1000.0 + c * 8 / 250.0) for c in (0, 1, 2, 300)]
+
+    def test_scan(self):
+        """test scan skips non-tshes packets and header records agree with full packet objects"""
+        hdrs = list(scan_headers([self.msgs[0], b'\x00' * 100, self.msgs[1], self.msgs[1][:-1]]))
+        assert len(hdrs) == 2
+        full = SamsTshEs(self.msgs[1])
+        assert (hdrs[1].Id, hdrs[1].counter, hdrs[1].time, hdrs[1].rate) == \
+               (full.Id(), full.counter(), full.time(), full.rate())
+        assert hdrs[1].endTime() == full.endTime()
+        assert (hdrs[1].gain(), hdrs[1].unit(), hdrs[1].adjustment()) == (full.gain(), full.unit(), full.adjustment())
+        assert not hasattr(hdrs[1], '__dict__')
+
+    def test_contiguous_and_deferred_samples(self):
+        """test contiguity matches SamsTshEs and samples get decoded on demand"""
+        hdrs = list(scan_headers(self.msgs))
+        fulls = [SamsTshEs(m) for m in self.msgs]
+        for i in range(1, len(hdrs)):
+            assert bool(hdrs[i].contiguous(hdrs[i - 1])) == bool(fulls[i].contiguous(fulls[i - 1]))
+        assert hdrs[1].contiguous(hdrs[0]) and not hdrs[3].contiguous(hdrs[2])
+        np.testing.assert_array_equal(hdrs[2].xyz(), self.xyz)
+        np.testing.assert_array_equal(hdrs[2].txyz(), fulls[2].txyz())
+        assert hdrs[2].packet().counter() == 2
+
+    def test_header_records(self):
+        """test structured array of header records agrees with header objects"""
+        packets = [self.msgs[0], b'\x00' * 100] + self.msgs[1:]
+        recs = header_records(packets)
+        hdrs = list(scan_headers(packets))
+        assert recs['index'].tolist() == [0, 2, 3, 4]
+        assert recs['counter'].tolist() == [h.counter for h in hdrs]
+        assert recs['time'].tolist() == [h.time for h in hdrs]
+        assert recs['rate'].tolist() == [h.rate for h in hdrs]
+        assert len(header_records([])) == 0
+
+
+class TestDecodePackets(object):
+    """class to test batch decode of many packets into one sample array"""
+
+    def test_decode_packets(self):
+        """test samples land in one array at per-packet offsets, other packets skipped"""
+        xyzs = [np.arange(3 * n, dtype=np.float32).reshape(n, 3) + 100 * c for c, n in enumerate([5, 1, 7])]
+        msgs = [tshes_accel_message(c, xyz, 2000.0 + c) for c, xyz in enumerate(xyzs)]
+        xyz, offsets, times = decode_packets([msgs[0], b'\x00' * 100, msgs[1], msgs[2]])
+        assert xyz.shape == (13, 3) and xyz.dtype == np.float32
+        assert offsets.tolist() == [0, 5, 6]
+        assert times.tolist() == [2000.0, 2001.0, 2002.0]
+        np.testing.assert_array_equal(xyz, np.vstack(xyzs))
+        assert decode_packets([])[0].shape == (0, 3)
+
+    def test_negative_samples(self):
+        """test corrupt packet with negative num_samples gets skipped instead of failing whole batch"""
+        xyzs = [np.full((4, 3), c, dtype=np.float32) for c in range(3)]
+        msgs = [tshes_accel_message(c, xyz, 2000.0 + c) for c, xyz in enumerate(xyzs)]
+        msgs[1] = msgs[1][:76] + struct.pack('!i', -5) + msgs[1][80:]
+        assert len(header_records(msgs)) == 2
+        xyz, offsets, times = decode_packets(msgs)
+        np.testing.assert_array_equal(xyz, np.vstack((xyzs[0], xyzs[2])))
+        assert offsets.tolist() == [0, 4]
+        assert times.tolist() == [2000.0, 2002.0]
+
+
+def sams2_accel_message(xyz, timestamp, rate_bits=2, unit=3):
+    """return bytes for one SAMS2 accel packet holding Nx3 xyz samples"""
+    head = bytearray(52)
+    head[0:2] = b'\xda\xbe'
+    head[12:14] = b'\x64\x00'
+    head[16:24] = b'121f-02\0'
+    head[24:32] = b'se-f03\0\0'
+    sec = int(timestamp)
+    struct.pack_into('IIIi', head, 36, sec, int(round((timestamp - sec) * 1e6)), 0, len(xyz))
+    body = b''.join(struct.pack('fffBBBB', x, y, z, rate_bits, unit, 0, 0) for x, y, z in xyz)
+    return bytes(head) + body
+
+
+class TestGuessPacket(object):
+    """class to test guess_packet dispatch on sync bytes and selector"""
+
+    def test_tshes(self):
+        """test tshes accel message (both selectors) gets SamsTshEs"""
+        xyz = np.ones((4, 3), dtype=np.float32)
+        for selector in [170, 171]:
+            assert type(guess_packet(tshes_accel_message(1, xyz, 100.0, selector=selector))) is SamsTshEs
+
+    def test_sams2(self):
+        """test sams2 accel packet gets Sams2Packet with its header decoded"""
+        pkt = guess_packet(sams2_accel_message([(1.0, 2.0, 3.0), (4.0, 5.0, 6.0)], 500.5))
+        assert type(pkt) is Sams2Packet
+        assert (pkt.name(), pkt.rate(), pkt.unit(), pkt.samples(), pkt.time()) == ('sef03', 250.0, 'g', 2, 500.5)
+        assert pkt.xyz() == [(1.0, 2.0, 3.0), (4.0, 5.0, 6.0)]
+
+    def test_unknown(self):
+        """test wrong selector, unknown sync bytes and truncated packets fall back to plain AccelPacket"""
+        msg = tshes_accel_message(1, np.ones((4, 3), dtype=np.float32), 100.0)
+        sams2 = sams2_accel_message([(1.0, 2.0, 3.0)], 500.5)
+        for data in [tshes_accel_message(1, np.ones((4, 3)), 100.0, selector=177), b'\x00' * 100, msg[:-16],
+                     sams2[:-16], b'']:
+            assert type(guess_packet(data)) is AccelPacket
+
+
+class TestDigitalIOTracker(object):
+    """class to test vectorized digital IO event extraction with state carried between updates"""
+
+    def setup_method(self, method):
+        """setup for general use in test methods of this class"""
+        self.tracker = DigitalIOTracker()
+
+    def test_update(self):
+        """test edges found within and across updates, input bit ignored while not enabled"""
+        events = self.tracker.update(b'es13', [1, 1, 5, 5, 4, 0, 1], np.arange(7.0))
+        assert events['time'].tolist() == [2.0, 4.0, 6.0]
+        assert events['enabled'].tolist() == [True, False, True]
+        assert events['state'].tolist() == [True, False, False]
+        assert events['sensor'].tolist() == ['es13'] * 3
+        events = self.tracker.update('es13', [1, 5], [7.0, 8.0])
+        assert events['time'].tolist() == [8.0] and events['state'].tolist() == [True]
+        assert len(self.tracker.update('es13', [5, 5], [9.0, 10.0])) == 0
+        assert len(self.tracker.update('es13', [], [])) == 0
+        assert self.tracker.num_events == 4
+
+    def test_packet_events(self):
+        """test batch of packets gives one time-ordered table, same as packet at a time"""
+        xyz = np.zeros((4, 3), dtype=np.float32)
+        msgs = [tshes_accel_message(0, xyz, 100.0, rate=7.8125, dio=1),
+                tshes_accel_message(1, xyz, 101.0, rate=7.8125, dio=5, sensor='es09'),
+                tshes_accel_message(2, xyz, 101.0, rate=7.8125, dio=5),
+                tshes_accel_message(3, xyz, 102.0, rate=7.8125, dio=1, sensor='es09')]
+        events = self.tracker.packet_events(msgs + [b'\x00' * 100])
+        assert events.tolist() == [('es13', 101.0, True, True), ('es09', 102.0, True, False)]
+        other = DigitalIOTracker()
+        per_packet = np.concatenate([guess_packet(m).dioEvents(other) for m in msgs])
+        assert sorted(per_packet.tolist()) == sorted(events.tolist())
+
+
+class TestContiguousSegments(object):
+    """class to test vectorized contiguity segmentation of packet sequences"""
+
+    def test_rules(self):
+        """test segments break on gap too big, rate change, dqm change and time going backwards"""
+        start = np.array([0.0, 1.0, 2.0, 4.5, 5.5, 6.0, 7.0, 6.5, 8.0])
+        end = start + 0.996
+        rate = np.array([250.0] * 5 + [500.0] * 4)
+        dqm = np.array([0, 0, 0, 0, 1, 1, 1, 1, 1])
+        segments = contiguous_segments(start, end, rate, dqm)
+        assert segments.tolist() == [[0, 3], [3, 4], [4, 5], [5, 7], [7, 9]]
+        assert contiguous_segments([], [], [], []).shape == (0, 2)
+
+    def test_matches_pairwise(self):
+        """test segments agree with pairwise contiguous method of packets, starting from header records"""
+        xyz = np.zeros((64, 3), dtype=np.float32)
+        times = [100.0, 100.256, 100.512, 101.8, 102.056, 102.312]
+        msgs = [tshes_accel_message(i, xyz, t) for i, t in enumerate(times)]
+        segments = header_segments(header_records(msgs))
+        pkts = [guess_packet(m) for m in msgs]
+        pairwise = [bool(pkts[i].contiguous(pkts[i - 1])) for i in range(1, len(pkts))]
+        assert pairwise == [True, True, False, True, True]
+        assert segments.tolist() == [[0, 3], [3, 6]]
+
+
+class TestDumps(object):
+    """class to test hex dump and streaming dumps of packets"""
+
+    def test_hex_dump(self):
+        """test hex dump lines: offset, 2 groups of hex bytes, padded, then bytes repr with unprintables nulled"""
+        lines = hex_dump(b'AB\x01' + bytes(range(64, 80))).splitlines()
+        assert lines[0] == '0000  41 42 01 40 41 42 43 44   45 46 47 48 49 4a 4b 4c   "b\'AB\\x00@ABCDEFGHIJKL\'"'
+        assert lines[1] == '0010  4d 4e 4f' + ' ' * 44 + '"b\'MNO\'"'
+        assert hex_dump(b'') == ''
+
+    def test_dump_packets(self):
+        """test dumps of many packets get written to file one after another"""
+        msg = tshes_accel_message(1, np.ones((2, 3), dtype=np.float32), 100.0)
+        f = io.StringIO()
+        assert dump_packets([msg, b'\x00' * 20], f, accelData=1, hexDump=1) == 2
+        text = f.getvalue()
+        assert text.startswith('SamsTshEs( name:')
+        assert '\ndata:\n1.0000000e+00 1.0000000e+00 1.0000000e+00\n' in text
+        assert 'AccelPacket( type:unknown length:20)\n0000  00 00' in text
+        assert text.count('\n') == 1 + 3 + 7 + 1 + 2
+
+
+class TestDecodedPacketCache(object):
+    """class to test LRU cache of decoded packets for sliding window reads"""
+
+    def setup_method(self, method):
+        """setup for general use in test methods of this class"""
+        self.xyz = [np.full((4, 3), i, dtype=np.float32) for i in range(6)]
+        self.rows = [(100.0 + i, tshes_accel_message(i, xyz, 100.0 + i), 'tshes') for i, xyz in enumerate(self.xyz)]
+
+    def test_sliding_window(self):
+        """test window sliding by one packet decodes just the new one, same result as decode_packets"""
+        cache = DecodedPacketCache()
+        xyz, times = cache.decode('es13', self.rows[:4])
+        assert (cache.hits, cache.misses) == (0, 4)
+        xyz, times = cache.decode('es13', self.rows[1:5] + [(99.0, b'\x00' * 100, 'other')])
+        assert (cache.hits, cache.misses) == (3, 6)
+        np.testing.assert_array_equal(xyz, decode_packets([r[1] for r in self.rows[1:5]])[0])
+        assert times.tolist() == [101.0, 102.0, 103.0, 104.0]
+        assert ('es13', 104.0) in cache and ('es09', 104.0) not in cache
+
+    def test_eviction(self):
+        """test least recently used packets get evicted once over max_bytes"""
+        cache = DecodedPacketCache(max_bytes=3 * self.xyz[0].nbytes)
+        cache.decode('es13', self.rows[:3])
+        cache.get(('es13', 100.0))  # now most recently used
+        cache.decode('es13', self.rows[3:4])
+        assert len(cache) == 3 and cache.evictions == 1 and cache.nbytes == 3 * self.xyz[0].nbytes
+        assert ('es13', 101.0) not in cache and ('es13', 100.0) in cache
+
+
+class TestIterAccelChunks(object):
+    """class to test chunked decode of db rows streamed off server-side cursor"""
+
+    def test_chunks(self, monkeypatch):
+        """test query gets time limits as params and each chunk of rows gets batch decoded"""
+        calls = []
+        rows = [(100.0 + i, tshes_accel_message(i, np.full((4, 3), i, dtype=np.float32), 100.0 + i), 'tshes')
+                for i in range(5)]
+
+        class FakePool(object):
+            def stream(self, command, params, chunk_rows):
+                calls.append((command, params))
+                return (rows[i:i + chunk_rows] for i in range(0, len(rows), chunk_rows))
+
+        monkeypatch.setattr(accel_packet, 'get_pool', lambda shost: FakePool())
+        chunks = list(iter_accel_chunks('es13', start=100.0, stop=200.0, chunk_packets=2))
+        assert calls == [('select * from es13 where time >= %s and time < %s order by time', (100.0, 200.0))]
+        assert [len(c[0]) for c in chunks] == [8, 8, 4]
+        assert chunks[2][2].tolist() == [104.0] and chunks[1][0][4].tolist() == [3.0, 3.0, 3.0]
+        list(iter_accel_chunks('es13'))
+        assert calls[-1] == ('select * from es13 order by time', None)
+
+
+class TestDecodePacketsParallel(object):
+    """class to test batch decode split across worker processes"""
+
+    def test_same_as_decode_packets(self):
+        """test parallel decode gives same samples, offsets and times as decode_packets, across chunk boundaries"""
+        rng = np.random.RandomState(0)
+        msgs = [tshes_accel_message(i, rng.normal(size=(1 + i % 5, 3)), 100.0 + i) for i in range(23)]
+        msgs[7] = b'\x00' * 100
+        xyz, offsets, times = decode_packets_parallel(msgs, workers=2, chunk_packets=4)
+        expected = decode_packets(msgs)
+        np.testing.assert_array_equal(xyz, expected[0])
+        np.testing.assert_array_equal(offsets, expected[1])
+        np.testing.assert_array_equal(times, expected[2])
+        assert decode_packets_parallel([], workers=2)[0].shape == (0, 3)
+
+    def test_compaction(self):
+        """test big non-accel packets (room for samples reserved, none written) do not leave holes between chunks"""
+        msgs = [tshes_accel_message(i, np.full((3, 3), float(i)), 100.0 + i) for i in range(10)]
+        msgs[1] = b'\x00' * 1600
+        msgs[6] = b'\x00' * 800
+        xyz, offsets, times = decode_packets_parallel(msgs, workers=2, chunk_packets=3)
+        expected = decode_packets(msgs)
+        assert xyz.shape == (24, 3)
+        np.testing.assert_array_equal(xyz, expected[0])
+        np.testing.assert_array_equal(offsets, expected[1])
+        np.testing.assert_array_equal(times, expected[2])
+        assert decode_packets_parallel([b'\x00' * 50], workers=2)[0].shape == (0, 3)
@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+
+import struct
+import numpy as np
+
+from tshcal.common.accel_packet import guess_packet
+from tshcal.common.calibration import TshCalibration, CalibrationTable, axes_csv_file
+from tshcal.tests.fake_tshes_server import tshes_accel_message
+
+
+class TestTshCalibration(object):
+    """class to test counts-to-g calibration loaded from axes CSV files"""
+
+    def setup_method(self, method):
+        """setup for general use in test methods of this class"""
+        self.bias = np.array([100.0, -200.0, 50.0])
+        self.scale = np.array([1.0e-5, 2.0e-5, 4.0e-5])  # g per count
+
+    def write_axes_files(self, out_dir, matrix):
+        """write 6 axes files with counts that give ideal +/- 1g per rough home through matrix (g per count)"""
+        inv = np.linalg.inv(matrix)
+        for ax, i in [('x', 0), ('y', 1), ('z', 2)]:
+            for sign, g in [('+', 1.0), ('-', -1.0)]:
+                ideal = np.zeros(3)
+                ideal[i] = g
+                counts = inv @ ideal + self.bias
+                np.savetxt(axes_csv_file(out_dir, 'es13', sign + ax), np.tile(counts, (5, 1)), delimiter=',')
+
+    def test_from_axes_files(self, tmpdir):
+        """test bias and scale from plus/minus medians, then apply in one matrix operation"""
+        self.write_axes_files(str(tmpdir), np.diag(self.scale))
+        cal = TshCalibration.from_axes_files(str(tmpdir), 'es13', 1.0)
+        np.testing.assert_allclose(cal.bias, self.bias)
+        np.testing.assert_allclose(np.diag(cal.matrix), self.scale)
+        g = cal.apply(self.bias + np.array([[1.0e5, 0.0, 0.0], [0.0, 0.0, -2.5e4]]))
+        np.testing.assert_allclose(g, [[1.0, 0.0, 0.0], [0.0, 0.0, -1.0]], atol=1e-12)
+
+    def test_misalignment(self, tmpdir):
+        """test full 3x3 matrix comes back from misaligned axes files"""
+        matrix = np.diag(self.scale) + 1.0e-7 * np.array([[0, 1, 2], [3, 0, 4], [5, 6, 0]])
+        self.write_axes_files(str(tmpdir), matrix)
+        cal = TshCalibration.from_axes_files(str(tmpdir), 'es13', 1.0, misalignment=True)
+        np.testing.assert_allclose(cal.matrix, matrix, rtol=1e-6)
+
+    def test_packet(self):
+        """test packet gives calibrated xyz (cached) only when table has sensor and gain"""
+        xyz = np.array([[100.0, -200.0, 50.0], [200.0, -100.0, 150.0]], dtype=np.float32)
+        pkt = guess_packet(tshes_accel_message(0, xyz, 100.0))
+        table = CalibrationTable([TshCalibration('es13', 10.0, self.bias, scale=self.scale)])
+        assert pkt.xyzCalibrated(table) is None
+        table.add(TshCalibration('es13', pkt.gain(), self.bias, scale=self.scale))
+        g = pkt.xyzCalibrated(table)
+        np.testing.assert_allclose(g, [[0.0, 0.0, 0.0], [1.0e-3, 2.0e-3, 4.0e-3]])
+        assert pkt.xyzCalibrated(table) is g
+        assert len(table) == 2 and table.get(b'es13', 10) is not None
+
+    def test_packet_not_counts(self):
+        """test packet already in volts or g does not get converted again"""
+        xyz = np.array([[100.0, -200.0, 50.0]], dtype=np.float32)
+        msg = tshes_accel_message(0, xyz, 100.0)
+        status = struct.unpack_from('!i', msg, 72)[0]
+        table = CalibrationTable([TshCalibration('es13', guess_packet(msg).gain(), self.bias, scale=self.scale)])
+        for unit_bits in [1, 2]:
+            pkt = guess_packet(msg[:72] + struct.pack('!i', status | unit_bits << 5) + msg[76:])
+            assert pkt.unit() != 'counts'
+            assert pkt.xyzCalibrated(table) is None
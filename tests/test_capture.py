@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+
+import os
+import time
+import shutil
+import tempfile
+import pytest
+
+from tshcal.common.buffer import Tsh
+from tshcal.common.capture import TshesRecorder, CaptureReader, CaptureHeader, CAPTURE_HEADER_STRUCT
+from tshcal.tests.test_accel_buffer import ramp
+from tshcal.tests.test_tshes_stream import fake_accel_message
+
+
+class TestCapture(object):
+    """class to test recording raw tshes messages to capture file and reading them back"""
+
+    def setup_method(self, method):
+        """setup for general use in test methods of this class"""
+        self.tmp_dir = tempfile.mkdtemp()
+        self.fname = os.path.join(self.tmp_dir, 'capture.bin')
+        self.tsh = Tsh('es13', 250.0, 0)
+        self.msgs = [fake_accel_message(i, ramp(10 * i, 10 + i % 3)) for i in range(50)]
+
+    def teardown_method(self, method):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_round_trip(self):
+        """test messages come back unchanged, in order, with header that matches tsh"""
+        with TshesRecorder(self.fname, self.tsh, batch_bytes=1000) as rec:
+            for msg in self.msgs:
+                rec.record(memoryview(msg))
+        assert rec.num_messages == 50
+        assert rec.bytes_written == sum([len(m) for m in self.msgs])
+        with CaptureReader(self.fname) as reader:
+            assert reader.header.sensor == 'es13'
+            assert reader.header.rate == 250.0
+            assert [bytes(m) for m in reader.messages()] == self.msgs
+
+    def test_append(self):
+        """test 2nd recorder for same sensor, rate and gain appends messages to same file and keeps original header"""
+        with TshesRecorder(self.fname, self.tsh) as rec:
+            for msg in self.msgs[:20]:
+                rec.record(msg)
+        start = rec.header.start
+        with TshesRecorder(self.fname, Tsh('es13', 250.0, 0)) as rec:
+            for msg in self.msgs[20:]:
+                rec.record(msg)
+        rec.record(b'ignored')  # nothing gets recorded after close
+        with CaptureReader(self.fname) as reader:
+            assert reader.header.sensor == 'es13' and reader.header.start == start
+            assert [bytes(m) for m in reader.messages()] == self.msgs
+
+    def test_append_mismatch(self):
+        """test appending under a header for another sensor, rate or gain gets rejected and leaves file alone"""
+        with TshesRecorder(self.fname, self.tsh) as rec:
+            for msg in self.msgs[:20]:
+                rec.record(msg)
+        size = os.path.getsize(self.fname)
+        for tsh in [Tsh('es14', 250.0, 0), Tsh('es13', 500.0, 0), Tsh('es13', 250.0, 1)]:
+            with pytest.raises(ValueError):
+                TshesRecorder(self.fname, tsh)
+        assert os.path.getsize(self.fname) == size
+
+    def test_quiet_stream(self):
+        """test partial batch gets written out within about fsync_sec even if nothing else gets recorded"""
+        with TshesRecorder(self.fname, self.tsh, fsync_sec=0.1) as rec:
+            for msg in self.msgs[:3]:
+                rec.record(msg)
+            expected = sum([len(m) for m in self.msgs[:3]])
+            deadline = time.monotonic() + 5
+            while rec.bytes_written < expected and time.monotonic() < deadline:
+                time.sleep(0.05)
+            assert rec.bytes_written == expected
+            assert os.path.getsize(self.fname) == CAPTURE_HEADER_STRUCT.size + expected
+
+    def test_writer_error(self):
+        """test exception in writer thread comes back from next record and from close"""
+        rec = TshesRecorder(self.fname, self.tsh)
+        rec._file.close()  # so writer thread fails on its next write
+        rec.record(self.msgs[0])
+        rec.flush()
+        rec._thread.join(timeout=5)
+        with pytest.raises(ValueError):
+            rec.record(self.msgs[1])
+        with pytest.raises(ValueError):
+            rec.close()
+
+    def test_bad_header(self):
+        """test file that is not a capture gets rejected"""
+        with pytest.raises(ValueError):
+            CaptureHeader.unpack(b'NOTACAPT' + bytes(CAPTURE_HEADER_STRUCT.size))
+        with pytest.raises(ValueError):
+            CaptureHeader.unpack(b'short')
@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+
+import numpy as np
+
+from tshcal.common.buffer import Tsh, TshAccelBuffer, Gap
+from tshcal.common.columnar import ColumnarWriter, ColumnarReader, export_packets
+from tshcal.common.accel_packet import decode_packets
+from tshcal.tests.fake_tshes_server import tshes_accel_message
+
+
+class TestColumnar(object):
+    """class to test columnar export and memory-mapped, time-sliced reader"""
+
+    def test_round_trip(self, tmpdir):
+        """test columns written in chunks come back memory-mapped, sliced by time with gaps and packets"""
+        dirname = str(tmpdir.join('cols'))
+        xyz = np.arange(30, dtype=np.float64).reshape(10, 3)
+        t = 1000.0 + np.arange(10) / 4.0
+        with ColumnarWriter(dirname, 'es13', 4.0, 1.0) as writer:
+            assert writer.add(xyz[:6], t[:6], [0, 3], t[[0, 3]]) == 0
+            writer.add_gap(6, 2, 1001.5, 1002.0)
+            assert writer.add(xyz[6:], t[6:], [0], t[[6]]) == 6
+        reader = ColumnarReader(dirname)
+        assert (reader.sensor, reader.rate, reader.gain, reader.num) == ('es13', 4.0, 1.0, 10)
+        assert isinstance(reader.x, np.memmap) and reader.x.dtype == np.float32 and reader.t.dtype == np.float64
+        np.testing.assert_array_equal(reader.xyz(), xyz)
+        ts, x, y, z = reader.span(1000.5, 1001.75)
+        assert ts.tolist() == [1000.5, 1000.75, 1001.0, 1001.25, 1001.5] and x.tolist() == [6, 9, 12, 15, 18]
+        assert reader.packets['offset'].tolist() == [0, 3, 6] and reader.packets['time'][2] == 1001.5
+        assert reader.gaps_in(1001.0, 1002.0).tolist() == [(6, 2, 1001.5, 1002.0)]
+        assert len(reader.gaps_in(1000.0, 1001.5)) == 0
+        assert reader.index_range(2000.0, 3000.0) == (10, 10)
+
+    def test_export_packets(self, tmpdir):
+        """test export of packets gets per-sample times, packet boundaries and a gap at dropped packet"""
+        msgs = [tshes_accel_message(i, np.full((4, 3), i, dtype=np.float32), 100.0 + 4 * i / 250.0)
+                for i in [0, 1, 2, 70, 71]]
+        dirname = str(tmpdir.join('pkts'))
+        assert export_packets(msgs + [b'\x00' * 100], dirname) == 20
+        reader = ColumnarReader(dirname)
+        assert (reader.sensor, reader.rate) == ('es13', 250.0)
+        np.testing.assert_array_equal(reader.xyz(), decode_packets(msgs)[0])
+        np.testing.assert_allclose(reader.t[:12], 100.0 + np.arange(12) / 250.0)
+        assert reader.t[12] == 101.12
+        assert reader.packets['offset'].tolist() == [0, 4, 8, 12, 16]
+        assert reader.gaps['offset'].tolist() == [12] and reader.gaps['missing'].tolist() == [268]
+        np.testing.assert_allclose(reader.gaps['start'], [100.048])
+
+    def test_export_rate_change(self, tmpdir):
+        """test segment break on rate change with no time missing does not get noted as a gap"""
+        msgs = [tshes_accel_message(i, np.full((4, 3), i, dtype=np.float32), 100.0 + 4 * i / 250.0)
+                for i in range(3)]
+        msgs.append(tshes_accel_message(3, np.full((4, 3), 3, dtype=np.float32), 100.0 + 12 / 250.0, rate=500.0))
+        dirname = str(tmpdir.join('rate'))
+        assert export_packets(msgs, dirname) == 16
+        reader = ColumnarReader(dirname)
+        assert len(reader.gaps) == 0
+        assert reader.packets['offset'].tolist() == [0, 4, 8, 12]
+
+    def test_buffer(self, tmpdir):
+        """test buffer writes its xyz, times and gaps"""
+        buff = TshAccelBuffer(Tsh('es13', 250.0, 0), 1)
+        buff.add(np.ones((100, 3)), 100.0 + np.arange(100) / 250.0)
+        buff.gaps.append(Gap(40, 3, 100.16, 100.172))
+        dirname = str(tmpdir.join('buff'))
+        buff.write_columnar(dirname)
+        reader = ColumnarReader(dirname)
+        assert reader.num == 100 and reader.gaps.tolist() == [(40, 3, 100.16, 100.172)]
+        np.testing.assert_array_equal(reader.t, buff.t)
+
+    def test_empty(self, tmpdir):
+        """test empty export reads back"""
+        export_packets([], str(tmpdir))
+        reader = ColumnarReader(str(tmpdir))
+        assert reader.num == 0 and reader.xyz().shape == (0, 3) and len(reader.packets) == 0
@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+
+import os
+import time
+import struct
+import numpy as np
+import pytest
+
+from tshcal.common.buffer import Tsh, TshAccelBuffer, raw_data_from_socket
+from tshcal.common.capture import TshesRecorder
+from tshcal.tests.fake_tshes_server import FakeTshesServer, synthetic_messages, capture_messages
+
+
+class TestFakeTshesServer(object):
+    """class to test ingest against local fake tsh data server"""
+
+    def setup_method(self, method):
+        """setup for general use in test methods of this class"""
+        self.tsh = Tsh('es13', 500.0, 0)
+        self.tsh.ip = '127.0.0.1'
+
+    def test_gaps_and_split_frames(self):
+        """test ingest at max speed copes with frames split across sends and finds dropped packets"""
+        def make_messages():
+            return synthetic_messages(rate=500.0, samples_per_packet=50, start=1000.0, noise=0.0,
+                                      signal=lambda t: np.column_stack((t, -t, 2 * t)), gap_every=10, gap_packets=2)
+        buff = TshAccelBuffer(self.tsh, 4)  # 2000 pts = 40 packets
+        with FakeTshesServer(make_messages, speed=None, split=300) as server:
+            raw_data_from_socket(server.host, buff, port=server.port)
+        assert buff.is_full
+        assert [(g.offset, g.missing) for g in buff.gaps] == [(400, 100), (800, 100), (1200, 100), (1600, 100)]
+        np.testing.assert_allclose(buff.xyz[:, 0], buff.t, rtol=1e-6)  # float32 samples carry their own time
+        np.testing.assert_allclose(buff.xyz[:, 2], 2 * buff.t, rtol=1e-6)
+
+    def test_paced(self):
+        """test speed paces stream at multiple of real time"""
+        buff = TshAccelBuffer(self.tsh, 2)  # 1000 pts, 2 sec of data
+        with FakeTshesServer(lambda: synthetic_messages(rate=500.0), speed=10.0) as server:
+            tzero = time.monotonic()
+            raw_data_from_socket(server.host, buff, port=server.port)
+            elapsed = time.monotonic() - tzero
+        assert buff.is_full
+        assert 0.15 < elapsed < 1.0  # about 0.2 sec at 10x
+
+    def test_capture_bad_status_bits(self, tmpdir):
+        """test replay of capture sends message with bogus status bits unpaced instead of ending the stream"""
+        msgs = [msg for t, msg in synthetic_messages(rate=500.0, samples_per_packet=50, num_packets=3, start=1000.0)]
+        msgs[1] = msgs[1][:72] + struct.pack('!i', 0x0f00) + msgs[1][76:]
+        fname = os.path.join(str(tmpdir), 'capture.bin')
+        with TshesRecorder(fname, self.tsh) as rec:
+            for msg in msgs:
+                rec.record(msg)
+        replay = list(capture_messages(fname))
+        assert [msg for t, msg in replay] == msgs
+        assert replay[0][0] == pytest.approx(1000.0 + 49 / 500.0) and replay[1][0] is None and replay[2][0] is not None
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+
+import socket
+import time
+import struct
+import asyncio
+import threading
+import numpy as np
+
+from tshcal.common.buffer import Tsh
+from tshcal.common.ingest import TshIngestEngine
+from tshcal.tests.test_accel_buffer import ramp
+from tshcal.tests.test_tshes_stream import fake_accel_message
+
+
+class TestTshIngestEngine(object):
+    """class to test asyncio ingest from several sensors at once against local servers, one per fake sensor"""
+
+    def setup_method(self, method):
+        """setup for general use in test methods of this class"""
+        self.server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.server.bind(('127.0.0.1', 0))
+        self.server.listen(2)
+        self.tshs = [Tsh('es13', 250.0, 0), Tsh('es14', 250.0, 0)]
+        for tsh in self.tshs:
+            tsh.ip = '127.0.0.1'  # both fake sensors share our local server (and port)
+
+    def teardown_method(self, method):
+        self.server.close()
+
+    def serve(self, num_conns, num_packets):
+        for i in range(num_conns):
+            conn, addr = self.server.accept()
+            stream = b''.join([fake_accel_message(j, ramp(10 * j, 10)) for j in range(num_packets)])
+            threading.Thread(target=self.send_in_chunks, args=(conn, stream), daemon=True).start()
+
+    @staticmethod
+    def send_in_chunks(conn, stream):
+        with conn:
+            for i in range(0, len(stream), 777):
+                conn.sendall(stream[i:i + 777])
+            conn.recv(1)  # wait for client to hang up
+
+    def test_two_sensors(self):
+        """test one engine ingests whole stream from each of two connections into its own ring and subscriber"""
+        threading.Thread(target=self.serve, args=(2, 40), daemon=True).start()
+        engine = TshIngestEngine(self.tshs, port=self.server.getsockname()[1])
+        got = dict([(tsh.name, []) for tsh in self.tshs])
+        engine.subscribe(lambda tsh, pkt: got[tsh.name].append(pkt.counter))
+
+        def stop_when_done(tsh, pkt):
+            if all([len(counters) == 40 for counters in got.values()]):
+                engine.stop()
+        engine.subscribe(stop_when_done)
+
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        try:
+            loop.run_until_complete(asyncio.wait_for(engine.run(), timeout=10))
+        finally:
+            loop.close()
+
+        for tsh in self.tshs:
+            assert got[tsh.name] == list(range(40))
+            assert engine.num_packets[tsh.name] == 40
+            np.testing.assert_array_equal(engine.rings[tsh.name].latest(400), ramp(0, 400))
+
+    def test_stop_while_reconnecting(self):
+        """test stop cancels pause before reconnect instead of waiting it out"""
+        port = self.server.getsockname()[1]
+        self.server.close()  # nobody listening, so connection gets refused
+        engine = TshIngestEngine(self.tshs, port=port, reconnect_sec=60)
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        try:
+            loop.call_later(0.2, engine.stop)
+            tzero = time.monotonic()
+            loop.run_until_complete(asyncio.wait_for(engine.run(), timeout=10))
+            assert time.monotonic() - tzero < 5
+        finally:
+            loop.close()
+
+    def test_bad_status_bits(self):
+        """test message with bogus rate bits in its status gets skipped and dispatch of later ones carries on"""
+        engine = TshIngestEngine(self.tshs[:1])
+        tsh = self.tshs[0]
+        got = []
+        engine.subscribe(lambda tsh, pkt: got.append(pkt.counter))
+        msgs = [fake_accel_message(j, ramp(10 * j, 10)) for j in range(3)]
+        msgs[1] = msgs[1][:72] + struct.pack('!i', 0x0f00) + msgs[1][76:]
+        for msg in msgs:
+            engine.dispatch(tsh, msg)
+        assert got == [0, 2]
+        assert engine.num_packets[tsh.name] == 2
+        np.testing.assert_array_equal(engine.rings[tsh.name].latest(20), np.vstack((ramp(0, 10), ramp(20, 10))))
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+
+import numpy as np
+import pytest
+import scipy.signal
+
+from tshcal.filters import lowpass_main
+from tshcal.filters.lowpass_main import TailReader, lowpass_chunks, get_butter_digital
+from tshcal.common.accel_packet import DecodedPacketCache
+from tshcal.tests.fake_tshes_server import tshes_accel_message
+
+
+class FakeTable(object):
+    """stand-in for sql_connect on one db table of tshes packets, answering just the queries TailReader makes"""
+
+    def __init__(self):
+        self.rows = []
+        self.num_fetched = 0  # rows handed back so far
+
+    def add(self, num_samples=4):
+        i = len(self.rows)
+        xyz = np.arange(3 * i * num_samples, 3 * (i + 1) * num_samples, dtype=np.float32).reshape(num_samples, 3)
+        self.rows.append((100.0 + i * num_samples / 250.0, tshes_accel_message(i, xyz, 100.0 + i * num_samples / 250.0),
+                          'tshes'))
+
+    def __call__(self, command, shost='localhost', params=None):
+        if 'where time >' in command:
+            results = [r for r in self.rows if r[0] > params[0]][::-1][:params[1]]
+        else:
+            results = self.rows[::-1][:params[0]]
+        self.num_fetched += len(results)
+        return results
+
+
+class TestTailReader(object):
+    """class to test tail-follow reader that rolls only new packets into fixed-size window"""
+
+    @pytest.fixture(autouse=True)
+    def fake_db(self, monkeypatch):
+        self.table = FakeTable()
+        for i in range(5):
+            self.table.add()
+        monkeypatch.setattr(lowpass_main, 'sql_connect', self.table)
+
+    def test_update(self):
+        """test window stays fixed size and matches latest samples, while only new rows get fetched"""
+        reader = TailReader('es13', 3, 3, 250.0)
+        np.testing.assert_array_equal(reader.window, np.arange(26, 60, 3))
+        assert reader.start_time == pytest.approx(100.0 + 8 / 250.0)
+        assert reader.update() == 0 and self.table.num_fetched == 3
+        self.table.add()
+        self.table.add()
+        assert reader.update() == 8 and self.table.num_fetched == 5
+        np.testing.assert_array_equal(reader.window, np.arange(50, 84, 3))
+        assert reader.start_time == pytest.approx(100.0 + 16 / 250.0)
+        for i in range(4):
+            self.table.add()
+        assert reader.update() == 12  # only newest num_pkts packets get fetched, that is all window can hold
+        np.testing.assert_array_equal(reader.window, np.arange(98, 132, 3))
+
+    def test_backlog(self):
+        """test update after falling far behind fetches only the newest num_pkts packets"""
+        reader = TailReader('es13', 3, 3, 250.0)
+        for i in range(20):
+            self.table.add()
+        assert reader.update() == 12 and self.table.num_fetched == 6
+        np.testing.assert_array_equal(reader.window, np.arange(26 + 240, 60 + 240, 3))
+        assert reader.start_time == pytest.approx(100.0 + 88 / 250.0)
+
+    def test_empty_table(self):
+        """test reader on empty table starts with empty window and sizes it from first packets that show up"""
+        self.table.rows = []
+        reader = TailReader('es13', 3, 3, 250.0)
+        assert len(reader.window) == 0 and reader.update() == 0
+        self.table.add()
+        self.table.add()
+        assert reader.update() == 8 and len(reader.window) == 8
+        self.table.add()
+        assert reader.update() == 4 and len(reader.window) == 8
+        np.testing.assert_array_equal(reader.window, np.arange(14, 38, 3))
+
+    def test_bad_table(self):
+        """test table name gets checked before going into SQL text"""
+        with pytest.raises(ValueError):
+            TailReader('es13 where 1', 3, 3, 250.0)
+
+
+class TestGetAccelFromDb(object):
+    """class to test ax'th column read of newest packets from db table"""
+
+    def test_cache_and_parallel(self):
+        """test asking for both cache and parallel decode gets rejected instead of one being ignored"""
+        with pytest.raises(ValueError):
+            lowpass_main.get_accel_from_db('es13', 3, 3, cache=DecodedPacketCache(), parallel=True)
+
+
+class TestLowpassChunks(object):
+    """class to test lowpass filter carried across decoded chunks"""
+
+    def test_same_as_one_pass(self):
+        """test filtering chunk by chunk gives same result as one pass over whole span"""
+        x = np.random.RandomState(0).normal(size=(1000, 3))
+        chunks = [(x[i:i + 128], np.array([0]), np.array([i / 250.0])) for i in range(0, 1000, 128)]
+        chunks.insert(2, (np.empty((0, 3)), np.array([]), np.array([])))
+        y = np.concatenate([c[1] for c in lowpass_chunks(iter(chunks), 250.0, 5.0, 2)])
+        b, a = get_butter_digital(250.0, 5.0)
+        expected, _ = scipy.signal.lfilter(b, a, x[:, 1], zi=scipy.signal.lfilter_zi(b, a) * x[0, 1])
+        np.testing.assert_allclose(y, expected)
@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+
+import numpy as np
+
+from tshcal.common.sci_utils import RunningStats
+
+
+class TestRunningStats(object):
+    """class to test streaming mean and variance that get updated chunk by chunk"""
+
+    def setup_method(self, method):
+        """setup for general use in test methods of this class"""
+        rng = np.random.RandomState(42)
+        self.data = rng.normal(loc=[1e6, -2e5, 3.0], scale=[5.0, 0.5, 50.0], size=(1000, 3))
+
+    def test_matches_batch(self):
+        """test uneven chunks give same mean and variance as computing them on all data at once"""
+        rs = RunningStats()
+        for start, stop in [(0, 1), (1, 17), (17, 17), (17, 500), (500, 1000)]:
+            rs.update(self.data[start:stop, :])
+        assert rs.count == 1000
+        np.testing.assert_allclose(rs.mean, self.data.mean(axis=0), rtol=1e-12)
+        np.testing.assert_allclose(rs.var, self.data.var(axis=0, ddof=1), rtol=1e-9)
+        np.testing.assert_allclose(rs.sem, self.data.std(axis=0, ddof=1) / np.sqrt(1000), rtol=1e-9)
+
+    def test_converged(self):
+        """test convergence needs every column within tol and at least min_count rows"""
+        rs = RunningStats()
+        assert not rs.is_converged(100.0)
+        rs.update(self.data)
+        assert np.all(np.isfinite(rs.median_sem))
+        assert rs.is_converged(3.0)  # worst column is about 1.25 * 50 / sqrt(1000) = 2
+        assert not rs.is_converged(1.0)
+        assert not rs.is_converged(3.0, min_count=2000)
+
+    def test_autocorr(self):
+        """test lag-1 autocorrelation across uneven chunks matches batch value and inflates standard error of median"""
+        rng = np.random.RandomState(7)
+        ar1 = np.zeros((5000, 3))
+        noise = rng.normal(scale=2.0, size=ar1.shape)
+        for i in range(1, len(ar1)):
+            ar1[i] = 0.9 * ar1[i - 1] + noise[i]
+        ar1 += [1e6, -2e5, 3.0]
+        rs = RunningStats()
+        for start, stop in [(0, 1), (1, 2), (2, 333), (333, 333), (333, 5000)]:
+            rs.update(ar1[start:stop, :])
+        dev = ar1 - ar1.mean(axis=0)
+        expected = (dev[1:] * dev[:-1]).sum(axis=0) / (dev ** 2).sum(axis=0)
+        np.testing.assert_allclose(rs.autocorr, expected, rtol=1e-6)
+        assert np.all(np.abs(rs.autocorr - 0.9) < 0.05)
+        np.testing.assert_allclose(rs.median_sem / rs.sem, np.sqrt(np.pi / 2 * (1 + expected) / (1 - expected)),
+                                   rtol=1e-6)
+        assert not rs.is_converged(np.sqrt(np.pi / 2) * rs.sem.max() * 1.01)  # iid guess would say converged
+
+    def test_autocorr_iid(self):
+        """test independent samples get (next to) no inflation"""
+        rs = RunningStats()
+        rs.update(self.data)
+        assert np.all(np.abs(rs.autocorr) < 0.1)
+        assert np.all(rs.median_sem >= np.sqrt(np.pi / 2) * rs.sem)
+        assert np.all(rs.median_sem < 1.1 * np.sqrt(np.pi / 2) * rs.sem)
@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+
+import pytest
+
+from tshcal.common import sql_utils
+from tshcal.common.sql_utils import SqlPool, sql_identifier, prefetch, SSCursor
+
+
+class FakeCursor(object):
+    """stand-in for MySQLdb cursor that just echoes back query and params"""
+
+    def __init__(self, con):
+        self.con = con
+        self.results = None
+        self.closed = False
+
+    def execute(self, command, params=None):
+        if self.con.fail:
+            self.con.fail -= 1
+            raise sql_utils.sql.OperationalError(2006, 'MySQL server has gone away')
+        if command.startswith('bad'):
+            raise sql_utils.sql.OperationalError(1054, "Unknown column 'bad' in 'field list'")
+        if command.startswith('stream'):
+            self.results = [(i,) for i in range(params[0])]
+        else:
+            self.results = ((command, params),)
+
+    def fetchall(self):
+        return self.results
+
+    def fetchmany(self, size):
+        rows, self.results = self.results[:size], self.results[size:]
+        return rows
+
+    def close(self):
+        self.closed = True
+
+
+class FakeConnection(object):
+    """stand-in for MySQLdb connection; class attribute fail is how many new connections fail on their 1st query"""
+
+    fail = 0
+    made = []
+
+    def __init__(self, **kwargs):
+        self.kwargs = kwargs
+        self.fail = 1 if FakeConnection.fail > 0 else 0
+        FakeConnection.fail -= self.fail
+        self.is_autocommit = False
+        self.closed = False
+        FakeConnection.made.append(self)
+
+    def autocommit(self, on):
+        self.is_autocommit = on
+
+    def cursor(self, cursorclass=None):
+        self.cursorclass = cursorclass
+        return FakeCursor(self)
+
+    def close(self):
+        self.closed = True
+
+
+class TestSqlPool(object):
+    """class to test pooled, parameterized queries with reconnect and backoff"""
+
+    def setup_method(self, method):
+        """setup for general use in test methods of this class"""
+        FakeConnection.fail = 0
+        FakeConnection.made = []
+        self.waits = []
+        self.pool = SqlPool('dbhost', 'me', 'pw', 'pimsdb', max_retries=3, backoff_sec=0.5, max_backoff_sec=1.0)
+
+    @pytest.fixture(autouse=True)
+    def fake_mysql(self, monkeypatch):
+        monkeypatch.setattr(sql_utils.sql, 'Connection', FakeConnection)
+        monkeypatch.setattr(sql_utils, 'sleep', self.waits.append)
+
+    def test_reuses_connection(self):
+        """test queries share one persistent (autocommit) connection and pass params through"""
+        assert self.pool.query('select * from es13 limit %s', (5,)) == (('select * from es13 limit %s', (5,)),)
+        self.pool.query('select 1')
+        assert len(FakeConnection.made) == 1 and FakeConnection.made[0].is_autocommit
+        assert FakeConnection.made[0].kwargs == {'host': 'dbhost', 'user': 'me', 'passwd': 'pw', 'db': 'pimsdb'}
+        assert self.pool.num_queries == 2 and self.pool.num_connects == 1
+        assert 0 <= self.pool.mean_sec <= self.pool.max_sec
+
+    def test_reconnect_with_backoff(self):
+        """test failed connection gets dropped, then reconnect with exponential (bounded) backoff"""
+        self.pool.query('select 1')
+        FakeConnection.made[0].fail = 1
+        FakeConnection.fail = 2
+        assert self.pool.query('select 2') == (('select 2', None),)
+        assert self.waits == [0.5, 1.0, 1.0]
+        assert [c.closed for c in FakeConnection.made] == [True, True, True, False]
+        assert self.pool.num_errors == 3 and self.pool.num_connects == 4
+
+    def test_gives_up(self):
+        """test we give up (and raise) after max_retries"""
+        self.pool.query('select 1')
+        FakeConnection.made[0].fail = 1
+        FakeConnection.fail = 10
+        with pytest.raises(sql_utils.sql.OperationalError):
+            self.pool.query('select 2')
+        assert len(self.waits) == 3
+
+    def test_query_error_not_retried(self):
+        """test error that is not about the connection gets raised right away and connection is kept"""
+        self.pool.query('select 1')
+        with pytest.raises(sql_utils.sql.OperationalError):
+            self.pool.query('bad query')
+        assert self.waits == [] and self.pool.num_errors == 0
+        self.pool.query('select 2')
+        assert len(FakeConnection.made) == 1 and not FakeConnection.made[0].closed
+
+    def test_sql_identifier(self):
+        """test table names get checked before going into SQL text"""
+        assert sql_identifier('es13') == 'es13'
+        with pytest.raises(ValueError):
+            sql_identifier('es13; drop table es13')
+
+    def test_stream(self):
+        """test stream yields chunks off server-side cursor, then connection goes back to pool"""
+        chunks = list(self.pool.stream('stream %s', (5,), chunk_rows=2))
+        assert chunks == [[(0,), (1,)], [(2,), (3,)], [(4,)]]
+        assert FakeConnection.made[0].cursorclass is SSCursor and not FakeConnection.made[0].closed
+        self.pool.query('select 1')
+        assert len(FakeConnection.made) == 1
+
+    def test_stream_abandoned(self):
+        """test stream abandoned early closes its connection instead of draining it"""
+        stream = self.pool.stream('stream %s', (5,), chunk_rows=2)
+        next(stream)
+        stream.close()
+        assert FakeConnection.made[0].closed
+
+
+class TestPrefetch(object):
+    """class to test background read-ahead of an iterable"""
+
+    def test_items(self):
+        """test all items come through in order"""
+        assert list(prefetch(iter(range(100)), depth=3)) == list(range(100))
+
+    def test_error(self):
+        """test exception in iterable comes through to consumer"""
+        def items():
+            yield 1
+            raise KeyError('oops')
+        it = prefetch(items())
+        assert next(it) == 1
+        with pytest.raises(KeyError):
+            next(it)
+
+    def test_abandoned(self):
+        """test consumer stopping early stops background thread and closes iterable"""
+        closed = []
+
+        def items():
+            try:
+                for i in range(1000):
+                    yield i
+            finally:
+                closed.append(True)
+        it = prefetch(items(), depth=2)
+        assert next(it) == 0
+        it.close()
+        assert closed == [True]
@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+
+import struct
+import numpy as np
+import pytest
+
+from tshcal.common.tshes_accel_packet import decode_xyz, sample_records, TshesAccelPacket
+from tshcal.tests.test_tshes_stream import fake_accel_message
+
+
+def fake_samples_payload(xyz, dio=0):
+    """return bytes for accel samples packed the way a tsh does it (network byte order), 16 bytes per sample"""
+    return b''.join([struct.pack('!fffI', x, y, z, dio) for x, y, z in xyz])
+
+
+class TestDecodeXyz(object):
+    """class to test vectorized decoding of TshesAccelPacket samples"""
+
+    def setup_method(self, method):
+        """setup for general use in test methods of this class"""
+        self.xyz = np.arange(30, dtype=np.float32).reshape(10, 3) * 1.5 - 7.0
+        self.payload = fake_samples_payload(self.xyz, dio=5)
+        self.message = bytes(80) + self.payload  # fake prefix, all zeros, followed by samples
+
+    def test_decode_payload(self):
+        """test decoding samples payload by itself (offset zero)"""
+        xyz = decode_xyz(self.payload, 10, offset=0)
+        assert xyz.shape == (10, 3)
+        np.testing.assert_array_equal(xyz, self.xyz)
+
+    def test_decode_message(self):
+        """test decoding samples from full tshes message (default offset of 80 bytes)"""
+        xyz = decode_xyz(self.message, 10)
+        np.testing.assert_array_equal(xyz, self.xyz)
+
+    def test_decode_fewer_than_available(self):
+        """test decoding only the number of samples asked for when more bytes are available"""
+        xyz = decode_xyz(self.payload + b'extra bytes', 4, offset=0)
+        np.testing.assert_array_equal(xyz, self.xyz[:4, :])
+
+    def test_sample_records_dio(self):
+        """test digital io status column of structured view"""
+        recs = sample_records(self.message, 10)
+        assert np.all(recs['dio'] == 5)
+        np.testing.assert_array_equal(recs['y'], self.xyz[:, 1])
+
+
+class TestTshesAccelPacket(object):
+    """class to test decoding TshesAccelPacket "Prefix" from whole tshes message"""
+
+    def setup_method(self, method):
+        """setup for general use in test methods of this class"""
+        self.xyz = np.arange(12, dtype=np.float32).reshape(4, 3)
+        self.pkt = TshesAccelPacket(fake_accel_message(77, self.xyz))
+
+    def test_prefix(self):
+        """test prefix fields and values derived from packet status"""
+        assert self.pkt.tshes_id == 'es13'
+        assert self.pkt.counter == 77
+        assert self.pkt.timestamp == 1234567890.0
+        assert self.pkt.num_samples == 4
+        assert self.pkt.rate == 250.0
+        assert self.pkt.gain == 1.0
+        assert self.pkt.unit == 'counts'
+        assert self.pkt.end_time() == 1234567890.0 + 3 / 250.0
+
+    def test_samples(self):
+        """test samples and completeness"""
+        assert self.pkt.is_complete()
+        np.testing.assert_array_equal(self.pkt.xyz(), self.xyz)
+        assert not TshesAccelPacket(bytes(self.pkt.data[:-1])).is_complete()
+
+    def test_bogus_status_bits(self):
+        """test unknown rate, gain or unit bits raise ValueError instead of IndexError or KeyError"""
+        msg = bytes(self.pkt.data)
+        for status in [0x0f00, 0x0507, 0x0560]:
+            with pytest.raises(ValueError):
+                TshesAccelPacket(msg[:72] + struct.pack('!i', status) + msg[76:])
+
+    def test_negative_num_samples(self):
+        """test negative num_samples raises ValueError instead of passing for a complete packet"""
+        msg = bytes(self.pkt.data)
+        with pytest.raises(ValueError):
+            TshesAccelPacket(msg[:76] + struct.pack('!i', -1) + msg[80:])
@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+
+import numpy as np
+
+from tshcal.common.tshes_params_packet import TshesMessage
+from tshcal.common.tshes_stream import TshesStreamFramer
+from tshcal.common.tshes_accel_packet import decode_xyz
+from tshcal.tests.fake_tshes_server import tshes_accel_message
+
+
+def fake_accel_message(counter, xyz, selector=170, timestamp=1234567890.0):
+    """return bytes for a tshes message with TshesAccelPacket (250 sa/sec, gain 1, counts) holding xyz samples"""
+    return tshes_accel_message(counter, np.asarray(xyz), timestamp, selector=selector)
+
+
+class FakeSocket(object):
+    """socket stand-in that hands out a byte string in chunks of prescribed sizes via recv_into"""
+
+    def __init__(self, data, chunks):
+        self.data = data
+        self.chunks = list(chunks)
+        self.pos = 0
+
+    def recv_into(self, buf, nbytes=0):
+        if self.pos >= len(self.data):
+            return 0
+        n = self.chunks.pop(0) if self.chunks else len(self.data)
+        n = min(n, len(buf), len(self.data) - self.pos)
+        buf[:n] = self.data[self.pos:self.pos + n]
+        self.pos += n
+        return n
+
+
+class TestTshesStreamFramer(object):
+    """class to test reassembly of tshes messages from stream"""
+
+    def setup_method(self, method):
+        """setup for general use in test methods of this class"""
+        self.xyzs = [np.arange(3 * n, dtype=np.float32).reshape(n, 3) + 100 * n for n in [5, 64, 1, 17]]
+        self.msgs = [fake_accel_message(i, xyz) for i, xyz in enumerate(self.xyzs)]
+        self.stream = b''.join(self.msgs)
+
+    def get_messages(self, stream, chunks):
+        framer = TshesStreamFramer(FakeSocket(stream, chunks))
+        return [bytes(m) for m in framer.messages()], framer
+
+    def test_msg_size(self):
+        """test msg_size parsed by TshesMessage is total size of message"""
+        for msg in self.msgs:
+            assert TshesMessage(msg).msg_size() == len(msg)
+            assert TshesMessage(msg).selector() == 170
+
+    def test_several_messages_in_one_recv(self):
+        """test one big recv that holds all messages"""
+        got, framer = self.get_messages(self.stream, [len(self.stream)])
+        assert got == self.msgs
+        assert framer.bytes_skipped == 0
+
+    def test_messages_split_across_recvs(self):
+        """test dribbling stream in small, odd-sized pieces so messages (and headers) get split"""
+        got, framer = self.get_messages(self.stream, [7] * (len(self.stream) // 7 + 1))
+        assert got == self.msgs
+        for msg, xyz in zip(got, self.xyzs):
+            np.testing.assert_array_equal(decode_xyz(msg, len(xyz)), xyz)
+
+    def test_resync_after_junk(self):
+        """test junk bytes at start of stream and between messages get skipped"""
+        stream = b'\x00\xac\x01junk' + self.msgs[0] + b'\xacmore junk' + b''.join(self.msgs[1:])
+        got, framer = self.get_messages(stream, [50, 3, 100, 1000])
+        assert got == self.msgs
+        assert framer.bytes_skipped == 7 + 10
+
+    def test_partial_message_at_eof(self):
+        """test incomplete trailing message is not handed out"""
+        got, framer = self.get_messages(self.stream[:-5], [])
+        assert got == self.msgs[:-1]